@@ -1,5 +1,12 @@
 import asyncio
-from typing import Awaitable, Callable, TypedDict
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    FrozenSet,
+    Optional,
+    TypedDict,
+)
 
 from telethon import errors
 from telethon.client.telegramclient import (
@@ -7,9 +14,14 @@ from telethon.client.telegramclient import (
 )
 from telethon.client.updates import EventBuilderDict
 
+from _garnet.concurrency import TaskTracker
 from _garnet.helpers import ctx
 from _garnet.loggers import events
 
+if TYPE_CHECKING:
+    from _garnet.dedup import UpdateDeduplicator
+    from _garnet.executors import DispatchExecutor
+
 
 class TelegramClient(
     _TelethonTelegramClient,  # type: ignore
@@ -20,6 +32,21 @@ class TelegramClient(
     async def _dispatch_update(  # type: ignore
         self, update, others, channel_id, pts_date
     ):
+        tasks = self.__garnet_config__["tasks"]
+        if tasks.closed:
+            events.debug(f"Shutting down, dropping update {pts_date=}")
+            return
+
+        subscribed = self.__garnet_config__["subscribed"]
+        if subscribed is not None and type(update) not in subscribed:
+            # no handler can be notified, so event isn't built at all
+            return
+
+        dedup = self.__garnet_config__["dedup"]
+        if dedup is not None and dedup.seen(update):
+            events.debug(f"Dropping duplicate update {pts_date=}")
+            return
+
         if not self._entity_cache.ensure_cached(update):
             if self._state_cache.update(update, check_only=True):
                 try:
@@ -34,7 +61,11 @@ class TelegramClient(
 
         built = EventBuilderDict(self, update, others)
 
-        task = asyncio.create_task(
+        if (executor := self.__garnet_config__.get("executor")) is not None:
+            await executor.submit(built, self)
+            return
+
+        task = tasks.spawn(
             self.__garnet_config__["dispatch_hook"](built, self),
             name=f"pts_date={pts_date} update propagating",
         )
@@ -52,12 +83,31 @@ class TelegramClient(
                     )
 
 
+async def dispatch_tracked(
+    built: EventBuilderDict, client: TelegramClient, /,
+) -> None:
+    """
+    Call dispatch hook of client's config, tasks spawned meanwhile
+    (e.g. after filter actions) are tracked by config's tracker.
+    Executors are started with it, so their workers don't depend on context
+    they were started in.
+    """
+    config = client.__garnet_config__
+    await config["tasks"].run(config["dispatch_hook"](built, client))
+
+
 class GarnetConfig(TypedDict):
     dont_wait_for_handler: bool
     dispatch_hook: Callable[[EventBuilderDict, TelegramClient], Awaitable[None]]
+    executor: Optional["DispatchExecutor"]
+    tasks: TaskTracker
+    dedup: Optional["UpdateDeduplicator"]
+    # raw update types handlers are subscribed to, `None` for any
+    subscribed: Optional[FrozenSet[type]]
 
 
 __all__ = (
     "TelegramClient",
     "GarnetConfig",
+    "dispatch_tracked",
 )
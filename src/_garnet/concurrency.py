@@ -1,7 +1,17 @@
 import asyncio
 import contextvars
 import functools
-from typing import Callable, TypeVar, cast
+import time
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Optional,
+    Set,
+    TypedDict,
+    TypeVar,
+    cast,
+)
 
 T = TypeVar("T")
 
@@ -13,4 +23,131 @@ async def to_thread(func: Callable[[], T], /) -> T:
     return await loop.run_in_executor(None, func_call)
 
 
-__all__ = ("to_thread",)
+class DrainReport(TypedDict):
+    # tasks running when drain started
+    pending: int
+    # tasks finished before deadline (including ones spawned while draining)
+    finished: int
+    # tasks cancelled after deadline
+    cancelled: int
+    # seconds spent draining
+    elapsed: float
+
+
+def merge_reports(*reports: DrainReport) -> DrainReport:
+    return DrainReport(
+        pending=sum(report["pending"] for report in reports),
+        finished=sum(report["finished"] for report in reports),
+        cancelled=sum(report["cancelled"] for report in reports),
+        elapsed=sum(report["elapsed"] for report in reports),
+    )
+
+
+_tracker: contextvars.ContextVar[
+    Optional["TaskTracker"]
+] = contextvars.ContextVar("tracker", default=None)
+
+
+class TaskTracker:
+    """
+    Set of running tasks which should be finished before shutdown.
+    Tasks spawned within tracked tasks (see `spawn`) are tracked too.
+    """
+
+    __slots__ = "closed", "spawned", "_tasks"
+
+    def __init__(self) -> None:
+        self.closed = False
+        self.spawned = 0
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def _tracked(self, coro: Coroutine[Any, Any, T], /) -> T:
+        # task has its own copy of context, so it doesn't leak
+        _tracker.set(self)
+        return await coro
+
+    async def run(self, coro: Coroutine[Any, Any, T], /) -> T:
+        """Await coroutine, tasks it spawns (see `spawn`) are tracked."""
+        token = _tracker.set(self)
+        try:
+            return await coro
+        finally:
+            _tracker.reset(token)
+
+    def spawn(
+        self, coro: Coroutine[Any, Any, T], /, name: Optional[str] = None,
+    ) -> "asyncio.Task[T]":
+        """Schedule coroutine in a tracked task."""
+        task = asyncio.create_task(self._tracked(coro), name=name)
+        self.spawned += 1
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def close(self) -> None:
+        """Mark tracker as closed, owners should stop spawning new tasks."""
+        self.closed = True
+
+    async def wait(self, timeout: float, /) -> bool:
+        """
+        Wait up to `timeout` seconds for tasks (including ones spawned
+        meanwhile) to finish, tell if all of them did.
+        """
+        deadline = time.monotonic() + timeout
+        while self._tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.wait(set(self._tasks), timeout=remaining)
+        return True
+
+    async def drain(self, timeout: float, /) -> DrainReport:
+        """
+        Wait up to `timeout` seconds for tasks (including ones spawned
+        meanwhile) to finish and cancel the rest.
+        """
+        started = time.monotonic()
+        pending = len(self._tasks)
+        spawned = self.spawned
+        cancelled = 0
+
+        if not await self.wait(timeout):
+            tasks = set(self._tasks)
+            for task in tasks:
+                task.cancel()
+            cancelled = len(tasks)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return DrainReport(
+            pending=pending,
+            finished=pending + self.spawned - spawned - cancelled,
+            cancelled=cancelled,
+            elapsed=time.monotonic() - started,
+        )
+
+
+def tracking(tracker: TaskTracker, /) -> contextvars.Token:
+    """Make tasks spawned in current context tracked by `tracker`."""
+    return _tracker.set(tracker)
+
+
+def spawn(
+    coro: Coroutine[Any, Any, T], /, name: Optional[str] = None,
+) -> "asyncio.Task[T]":
+    """Schedule coroutine in a task tracked by current tracker if any."""
+    if (tracker := _tracker.get()) is not None:
+        return tracker.spawn(coro, name=name)
+    return asyncio.create_task(coro, name=name)
+
+
+__all__ = (
+    "to_thread",
+    "DrainReport",
+    "merge_reports",
+    "TaskTracker",
+    "tracking",
+    "spawn",
+)
@@ -0,0 +1,218 @@
+import collections
+import time
+from array import array
+from typing import Any, Deque, Hashable, Optional
+
+from telethon.tl import types
+
+from _garnet.helpers.peers import peers_of
+
+# updates which carry the same message, telethon may receive any of them
+# (e.g. short one from the push stream and full one from difference)
+_NEW_MESSAGE = (types.UpdateNewMessage, types.UpdateNewChannelMessage)
+_SHORT_MESSAGE = (types.UpdateShortMessage, types.UpdateShortChatMessage)
+_EDIT_MESSAGE = (types.UpdateEditMessage, types.UpdateEditChannelMessage)
+
+_MAX_LOAD = 0.7
+_UINT64 = (1 << 64) - 1
+
+
+def dedup_key(update: Any, /) -> Optional[Hashable]:
+    """
+    Get identity of raw update, `None` if update can't be identified.
+    Key of the same update received twice is the same.
+    """
+    if isinstance(update, _NEW_MESSAGE):
+        return "m", peers_of(update)[0], update.message.id
+
+    if isinstance(update, _SHORT_MESSAGE):
+        return "m", peers_of(update)[0], update.id
+
+    if isinstance(update, _EDIT_MESSAGE):
+        message = update.message
+        edit_date = getattr(message, "edit_date", None)
+        return (
+            "e",
+            peers_of(update)[0],
+            message.id,
+            edit_date.timestamp() if edit_date else 0,
+        )
+
+    if (query_id := getattr(update, "query_id", None)) is not None:
+        return update.CONSTRUCTOR_ID, query_id
+
+    if (pts := getattr(update, "pts", None)) is not None:
+        return update.CONSTRUCTOR_ID, getattr(update, "channel_id", 0), pts
+
+    if (qts := getattr(update, "qts", None)) is not None:
+        return update.CONSTRUCTOR_ID, qts
+
+    return None
+
+
+class _Table:
+    """Open addressing set of 64-bit fingerprints (zero is an empty slot)."""
+
+    __slots__ = "slots", "mask", "size", "born"
+
+    def __init__(self, capacity: int, born: float):
+        self.slots = array("Q", bytes(8 * capacity))
+        self.mask = capacity - 1
+        self.size = 0
+        self.born = born
+
+    def __contains__(self, fingerprint: int) -> bool:
+        slots, mask = self.slots, self.mask
+        index = fingerprint & mask
+        while value := slots[index]:
+            if value == fingerprint:
+                return True
+            index = (index + 1) & mask
+        return False
+
+    def add(self, fingerprint: int, /) -> None:
+        slots, mask = self.slots, self.mask
+        index = fingerprint & mask
+        while value := slots[index]:
+            if value == fingerprint:
+                return
+            index = (index + 1) & mask
+        slots[index] = fingerprint
+        self.size += 1
+
+    def grown(self) -> "_Table":
+        table = _Table(len(self.slots) * 2, self.born)
+        for fingerprint in self.slots:
+            if fingerprint:
+                table.add(fingerprint)
+        return table
+
+
+def _capacity_for(size: int, minimum: int, /) -> int:
+    capacity = minimum
+    while capacity * _MAX_LOAD < size:
+        capacity *= 2
+    return capacity
+
+
+class UpdateDeduplicator:
+    """
+    Remembers updates seen within a time window and tells repeated ones.
+
+    Keys (see `dedup_key`) are stored as 64-bit fingerprints in
+    generations of flat hash tables (8-16 bytes per update),
+    the oldest generation is dropped as a whole once it's out of window.
+
+    Usage::
+
+        >>> from garnet.runner import run, UpdateDeduplicator
+        >>>
+        >>> dedup = UpdateDeduplicator(window=6 * 60 * 60)
+        >>> await run(router, storage, dedup=dedup)
+        >>> dedup.hits  # number of dropped duplicates
+    """
+
+    __slots__ = (
+        "window",
+        "generations",
+        "initial_capacity",
+        "hits",
+        "misses",
+        "unkeyed",
+        "_tables",
+        "_span",
+    )
+
+    def __init__(
+        self,
+        window: float = 3 * 60 * 60,
+        *,
+        generations: int = 4,
+        initial_capacity: int = 1 << 14,
+    ):
+        """
+        :param window: seconds update is remembered for (at least)
+        :param generations: number of tables window is split into,
+            more generations drop outdated keys more precisely
+        :param initial_capacity: number of slots of the first table
+        """
+        if window <= 0 or generations < 1:
+            raise ValueError("`window` and `generations` must be positive")
+
+        if initial_capacity < 1 or initial_capacity & (initial_capacity - 1):
+            raise ValueError("`initial_capacity` must be a power of two")
+
+        self.window = window
+        self.generations = generations
+        self.initial_capacity = initial_capacity
+        # number of updates seen before
+        self.hits = 0
+        # number of updates seen for the first time
+        self.misses = 0
+        # number of updates without key
+        self.unkeyed = 0
+
+        self._span = window / generations
+        self._tables: Deque[_Table] = collections.deque()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(window={self.window}, "
+            f"hits={self.hits}, misses={self.misses}, unkeyed={self.unkeyed})"
+        )
+
+    def __len__(self) -> int:
+        return sum(table.size for table in self._tables)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by fingerprints."""
+        return sum(
+            table.slots.itemsize * len(table.slots) for table in self._tables
+        )
+
+    def _current(self) -> _Table:
+        now = time.monotonic()
+        tables = self._tables
+
+        if not tables or now - tables[-1].born >= self._span:
+            size = tables[-1].size if tables else 0
+            tables.append(
+                _Table(_capacity_for(size, self.initial_capacity), now)
+            )
+
+        # table keeps keys added until the next table is born
+        while len(tables) > 1 and now - tables[1].born >= self.window:
+            tables.popleft()
+
+        return tables[-1]
+
+    def seen(self, update: Any, /) -> bool:
+        """Check if update was seen before and remember it otherwise."""
+        if (key := dedup_key(update)) is None:
+            self.unkeyed += 1
+            return False
+
+        fingerprint = (hash(key) & _UINT64) or 1
+        current = self._current()
+
+        for table in self._tables:
+            if fingerprint in table:
+                self.hits += 1
+                return True
+
+        if (current.size + 1) > len(current.slots) * _MAX_LOAD:
+            current = self._tables[-1] = current.grown()
+
+        current.add(fingerprint)
+        self.misses += 1
+        return False
+
+    def clear(self) -> None:
+        self._tables.clear()
+
+
+__all__ = (
+    "dedup_key",
+    "UpdateDeduplicator",
+)
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+import contextvars
 import functools
 import inspect
-import operator
+from contextlib import contextmanager
 from typing import (
+    TYPE_CHECKING,
+    Any,
     Awaitable,
     Callable,
+    Dict,
+    Generator,
     Generic,
+    List,
+    Literal,
     Optional,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -18,8 +26,28 @@ from telethon.events.common import EventBuilder
 
 from _garnet.concurrency import to_thread
 
+if TYPE_CHECKING:
+    from _garnet.events.index import Hint
+
 ET = TypeVar("ET")
+T = TypeVar("T")
 FR = Union[bool, Awaitable[bool]]
+OpT = Literal["and", "or", "xor", "not"]
+
+
+class _Memo(Dict[Tuple[int, int], Any]):
+    """Reused results, `revision` counts how many times they were forgotten."""
+
+    __slots__ = ("revision",)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.revision = 0
+
+
+_memo: contextvars.ContextVar[Optional[_Memo]] = contextvars.ContextVar(
+    "filter_memo", default=None
+)
 
 
 class Filter(Generic[ET]):
@@ -38,20 +66,39 @@ class Filter(Generic[ET]):
     >>> naive = Filter(filter_function)
     >>> aware = Filter(filter_function, events.NewMessage)
     >>> non_async_naive = Filter(lambda _: True)
+    >>> blocking_naive = Filter(lambda _: True, offload=True)
     >>>
     >>> assert naive.is_event_naive and naive.is_awaitable
     >>> assert not aware.is_event_naive and aware.is_awaitable
     >>> assert non_async_naive.is_event_naive
     >>> assert not non_async_naive.is_awaitable
+    >>> assert blocking_naive.offload and not non_async_naive.offload
+    >>> assert not non_async_naive.pure
+    >>> assert Filter(lambda _: True, pure=True).pure
 
+    Filters composed with logical operators keep their operands,
+    see `compose`.
     """
 
-    __slots__ = "function", "is_awaitable", "event_builder"
+    __slots__ = (
+        "function",
+        "is_awaitable",
+        "event_builder",
+        "offload",
+        "pure",
+        "hint",
+        "op",
+        "operands",
+    )
 
     def __init__(
         self,
         function: Callable[[ET], FR],
         event_builder: Optional[Type[EventBuilder]] = None,
+        *,
+        offload: bool = False,
+        pure: bool = False,
+        hint: Optional[Hint] = None,
     ) -> None:
         """
         :param function: A single parameter function (Optional[EventType])
@@ -59,6 +106,13 @@ class Filter(Generic[ET]):
         (Can be `async def` defined function)
         :param event_builder: telethon's EventBuilder inheritor.
         Mostly you don't want to interact with this parameter.
+        :param offload: Run non-async function in a thread instead of calling
+        it right in the event loop, use it only for blocking functions.
+        :param pure: Whether the result depends on the event (and user state)
+        only. Results of pure filters are reused within the same update,
+        so never pass True for side-effecting or non-deterministic functions.
+        :param hint: Dispatch hint, lets router skip handlers with this filter
+        without calling it, when the update does not fit the hint.
         """
 
         self.function = function
@@ -66,6 +120,11 @@ class Filter(Generic[ET]):
             function
         ) or inspect.isawaitable(function)
         self.event_builder = event_builder
+        self.offload = offload
+        self.pure = pure
+        self.hint = hint
+        self.op: Optional[OpT] = None
+        self.operands: Tuple[Filter[ET], ...] = ()
 
     def __xor__(self, filter2: Filter[ET]) -> Filter[ET]:
         """
@@ -87,7 +146,7 @@ class Filter(Generic[ET]):
         >>>
         """
 
-        return binary_op(self, filter2, operator.xor)
+        return compose("xor", self, filter2)
 
     def __and__(self, filter2: Filter[ET]) -> Filter[ET]:
         """
@@ -98,7 +157,7 @@ class Filter(Generic[ET]):
         :return: newly composed filter
         """
 
-        return binary_op(self, filter2, operator.and_)
+        return compose("and", self, filter2)
 
     def __or__(self, filter2: Filter[ET]) -> Filter[ET]:
         """
@@ -109,7 +168,7 @@ class Filter(Generic[ET]):
         :return: newly composed filter
         """
 
-        return binary_op(self, filter2, operator.or_)
+        return compose("or", self, filter2)
 
     def __invert__(self) -> Filter[ET]:
         """
@@ -119,24 +178,29 @@ class Filter(Generic[ET]):
         :return: newly composed filter
         """
 
-        return unary_op(self, operator.not_)
+        return compose("not", self)
 
     async def call(self, e: ET, /) -> bool:
         """
         Call functor with type contracted parameter.
-        If the initial function is async, call result will be awaited
+        If the initial function is async, call result will be awaited,
+        otherwise function is called inline (or in a thread if offloaded)
 
         :param e: Some data
         :return:
         """
-        fn = cast(Callable[[], FR], functools.partial(self.function, e))
-
         if self.is_awaitable:
-            fn = cast(Callable[[], Awaitable[bool]], fn)
-            return await fn()
-        else:
-            fn = cast(Callable[[], bool], fn)
+            return await cast(Callable[[ET], Awaitable[bool]], self.function)(e)
+        elif self.offload:
+            fn = cast(Callable[[], bool], functools.partial(self.function, e))
             return await to_thread(fn)
+        else:
+            return cast(Callable[[ET], bool], self.function)(e)
+
+    @property
+    def is_sync(self) -> bool:
+        """Test if the Filter can be called right in the event loop."""
+        return not (self.is_awaitable or self.offload)
 
     @property
     def is_event_naive(self) -> bool:
@@ -149,55 +213,200 @@ class Filter(Generic[ET]):
     __repr__ = __str__
 
 
-def binary_op(
-    filter1: Filter[ET],
-    filter2: Filter[ET],
-    operator_: Callable[[bool, bool], bool],
-) -> Filter[ET]:
-    """Merge two filter and apply `operator_` function."""
+def _flatten(op: OpT, filters: Tuple[Filter[ET], ...]) -> List[Filter[ET]]:
+    flat: List[Filter[ET]] = []
+    for filter_ in filters:
+        if op != "not" and filter_.op == op:
+            flat.extend(filter_.operands)
+        else:
+            flat.append(filter_)
+    return flat
 
-    if (not isinstance(filter1, Filter)) | (not isinstance(filter2, Filter)):
-        raise ValueError(
-            f"Cannot merge non-Filter objects. {filter1!r} with {filter2!r}"
-        )
 
-    if (
-        not (filter1.is_event_naive or filter2.is_event_naive)
-        and filter1.event_builder != filter2.event_builder
-    ):
+def _compile_sync(
+    op: OpT, operands: List[Filter[ET]],
+) -> Callable[[ET], bool]:
+    functions = tuple(
+        cast(Callable[[ET], bool], filter_.function) for filter_ in operands
+    )
+
+    if op == "and":
+
+        def func(event: ET) -> bool:
+            for function in functions:
+                if not function(event):
+                    return False
+            return True
+
+    elif op == "or":
+
+        def func(event: ET) -> bool:
+            for function in functions:
+                if function(event):
+                    return True
+            return False
+
+    elif op == "xor":
+
+        def func(event: ET) -> bool:
+            result = False
+            for function in functions:
+                result ^= bool(function(event))
+            return result
+
+    else:
+        (function,) = functions
+
+        def func(event: ET) -> bool:
+            return not function(event)
+
+    return func
+
+
+def _compile_async(
+    op: OpT, operands: List[Filter[ET]],
+) -> Callable[[ET], Awaitable[bool]]:
+    async def call(filter_: Filter[ET], event: ET) -> bool:
+        if filter_.is_sync:
+            return bool(filter_.function(event))
+        return bool(await evaluate(filter_, event))
+
+    if op == "and":
+
+        async def func(event: ET) -> bool:
+            for filter_ in operands:
+                if not await call(filter_, event):
+                    return False
+            return True
+
+    elif op == "or":
+
+        async def func(event: ET) -> bool:
+            for filter_ in operands:
+                if await call(filter_, event):
+                    return True
+            return False
+
+    elif op == "xor":
+
+        async def func(event: ET) -> bool:
+            result = False
+            for filter_ in operands:
+                result ^= await call(filter_, event)
+            return result
+
+    else:
+        (operand,) = operands
+
+        async def func(event: ET) -> bool:
+            return not await call(operand, event)
+
+    return func
+
+
+def compose(op: OpT, /, *filters: Filter[ET]) -> Filter[ET]:
+    """
+    Compose filters with logical operator.
+
+    Nested operations of the same kind are flattened into n-ary ones,
+    so `a & b & c` is a single AND of three operands,
+    AND/OR operations stop at the first operand which decides the result.
+    If every operand can be called in the event loop,
+    composed filter is synchronous too.
+    """
+
+    for filter_ in filters:
+        if not isinstance(filter_, Filter):
+            raise ValueError(f"Cannot merge non-Filter objects. {filters!r}")
+
+    if op == "not" and filters[0].op == "not":
+        return filters[0].operands[0]
+
+    builders = {f.event_builder for f in filters if not f.is_event_naive}
+    if len(builders) > 1:
         raise ValueError(
             "Cannot merge event-aware filters with different event_builders"
         )
 
-    common_event_builder = filter1.event_builder
+    operands = _flatten(op, filters)
 
-    async def func(event: ET) -> bool:
-        return operator_(await filter1.call(event), await filter2.call(event),)
+    func: Callable[[ET], FR]
+    if all(filter_.is_sync for filter_ in operands):
+        func = _compile_sync(op, operands)
+    else:
+        func = _compile_async(op, operands)
 
     func.__name__ = (
-        f"Merged({filter1.function.__name__}+{filter2.function.__name__})"
+        f"{op.capitalize()}("
+        f"{', '.join(f.function.__name__ for f in operands)})"
     )
 
-    # noinspection PyUnreachableCode
-    if __debug__:
-        func.__doc__ = (
-            f"Merged:\nA: {filter1.function.__name__}"
-            f"\nB: {filter2.function.__name__}"
-        )
+    composed = Filter(
+        function=func,
+        event_builder=builders.pop() if builders else None,
+        pure=all(filter_.pure for filter_ in operands),
+    )
+    composed.op = op
+    composed.operands = tuple(operands)
+    return composed
 
-    return Filter(function=func, event_builder=common_event_builder)
 
+@contextmanager
+def memoized() -> Generator[None, None, None]:
+    """Reuse results of pure filters until the context exits."""
+    token = _memo.set(_Memo())
+    try:
+        yield
+    finally:
+        _memo.reset(token)
 
-def unary_op(
-    filter1: Filter[ET], operator_: Callable[[bool], bool],
-) -> Filter[ET]:
-    """Create new filter from the old one."""
 
-    @functools.wraps(filter1.function)
-    async def func(event: ET) -> bool:
-        return operator_(await filter1.call(event))
+def forget() -> None:
+    """Forget reused results, e.g. after user state has changed."""
+    memo = _memo.get()
+    if memo is not None:
+        memo.clear()
+        memo.revision += 1
+
+
+def revision() -> int:
+    """Get the number of times results were forgotten in current context."""
+    memo = _memo.get()
+    return 0 if memo is None else memo.revision
+
 
-    return Filter(function=func, event_builder=filter1.event_builder,)
+def reuse(owner: object, event: Any, compute: Callable[[], T], /) -> T:
+    """
+    Compute value for the event once within `memoized` context,
+    e.g. parse message text once for all filters and selectors.
+    """
+    memo = _memo.get()
+    if memo is None:
+        return compute()
+
+    key = (id(owner), id(event))
+    try:
+        return cast(T, memo[key])
+    except KeyError:
+        result = memo[key] = compute()
+        return result
+
+
+async def evaluate(filter_: Filter[ET], event: ET, /) -> Any:
+    """
+    Call filter or reuse its result for the same event if it was already
+    called within `memoized` context.
+    """
+    memo = _memo.get()
+    if memo is None or not filter_.pure:
+        return await filter_.call(event)
+
+    key = (id(filter_), id(event))
+    try:
+        return memo[key]
+    except KeyError:
+        result = memo[key] = await filter_.call(event)
+        return result
 
 
 def ensure_filter(
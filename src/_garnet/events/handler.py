@@ -4,6 +4,7 @@ from typing import (
     Awaitable,
     Callable,
     Generic,
+    Optional,
     Tuple,
     Type,
     TypeVar,
@@ -12,6 +13,7 @@ from typing import (
 
 from telethon.events.common import EventBuilder
 
+from _garnet.events.action import AfterFilterAction
 from _garnet.events.filter import Filter
 
 ET = TypeVar("ET")
@@ -46,6 +48,12 @@ class EventHandler(Generic[ET], abc.ABC):
         Tuple[Filter[ET], ...],
     ]
 
+    # seconds handler (with intermediates) is given before it's cancelled,
+    # router's timeout is used if not set
+    __timeout__: Optional[float] = None
+    # action to call with event and handler if handler is timed out
+    __on_timeout__: Optional[Type[AfterFilterAction[ET]]] = None
+
     @property
     @abc.abstractmethod
     def __event_builder__(self) -> "Type[EventBuilder]":
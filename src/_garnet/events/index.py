@@ -0,0 +1,328 @@
+import abc
+import heapq
+from operator import attrgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    ContextManager,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from telethon.client.updates import EventBuilderDict
+from telethon.events.common import EventBuilder
+
+from _garnet.events.action import NoAction
+from _garnet.events.handler import EventHandler
+
+if TYPE_CHECKING:
+    from _garnet.events.router import Router
+
+
+class Hint(abc.ABC):
+    """
+    Dispatch hint of a filter, tells what the filter can pass for.
+    Routes of a router with hints of the same type are indexed
+    by a single selector, so handlers which can't pass are not even tried.
+    """
+
+    __slots__ = ()
+
+    # if handler has several hinted filters the one with lowest cost is used
+    cost: ClassVar[int] = 0
+
+    @classmethod
+    @abc.abstractmethod
+    def selector(
+        cls, hinted: Sequence[Tuple["Route", "Hint"]], /,
+    ) -> "Selector":
+        """Build selector for routes with hints of this type."""
+        raise NotImplementedError
+
+
+class Selector(abc.ABC):
+    """Index of routes with the same type of hints."""
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    async def select(self, event: Any, /) -> Iterable[Sequence["Route"]]:
+        """Get sequences (ordered by position) of routes that can pass."""
+        raise NotImplementedError
+
+
+class KeyHint(Hint):
+    """Hint for filters which pass only for particular keys of update."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self, keys: Iterable[Hashable]):
+        self.keys: FrozenSet[Hashable] = frozenset(keys)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({set(self.keys)!r})"
+
+
+class KeySelector(Selector):
+    """Selector looking up routes by keys of update in a dictionary."""
+
+    __slots__ = ("table",)
+
+    def __init__(self, hinted: Sequence[Tuple["Route", KeyHint]]):
+        table: Dict[Hashable, List[Route]] = {}
+        for route, hint in hinted:
+            for key in hint.keys:
+                table.setdefault(key, []).append(route)
+
+        self.table = {key: tuple(routes) for key, routes in table.items()}
+
+    @abc.abstractmethod
+    async def keys_of(self, event: Any, /) -> Iterable[Hashable]:
+        """Get keys of update."""
+        raise NotImplementedError
+
+    async def select(self, event: Any, /) -> Iterable[Sequence["Route"]]:
+        table = self.table
+        return [table[key] for key in await self.keys_of(event) if key in table]
+
+
+class Route:
+    """
+    Handler with its position in the (flattened) routers tree,
+    pre-built chain of intermediates and dispatch hint.
+    """
+
+    __slots__ = "position", "handler", "chain", "hint"
+
+    def __init__(
+        self,
+        position: int,
+        handler: Type[EventHandler[Any]],
+        chain: Callable[[Any], Any],
+    ):
+        self.position = position
+        self.handler = handler
+        self.chain = chain
+        self.hint = _hint_of(handler)
+
+    def __repr__(self) -> str:
+        return f"Route({self.position}, {self.handler.__name__})"
+
+
+def _hint_of(handler: Type[EventHandler[Any]], /) -> Optional[Hint]:
+    """
+    Find the cheapest hint among handler filters and their AND operands.
+    Filters are checked in order and the first failed one calls its action,
+    so hints are taken only from filters up to the first one with action,
+    otherwise skipped handler wouldn't call action of a failed filter.
+    """
+    builders = (None, handler.__event_builder__)
+    hints: List[Hint] = []
+
+    for filter_, action in handler.filters:
+        if action is not NoAction:
+            break
+
+        if filter_.event_builder not in builders:
+            continue
+
+        for f in (filter_, *(filter_.operands if filter_.op == "and" else ())):
+            if f.hint is not None and f.event_builder in builders:
+                hints.append(f.hint)
+
+    return min(hints, key=attrgetter("cost"), default=None)
+
+
+_by_position = attrgetter("position")
+
+
+def _unique(routes: Iterable[Route], /) -> List[Route]:
+    """Drop repeated routes of position-ordered iterable."""
+    result: List[Route] = []
+    for route in routes:
+        if not result or result[-1] is not route:
+            result.append(route)
+    return result
+
+
+class Segment:
+    """Routes of one router which are subscribed to the same event builder."""
+
+    __slots__ = (
+        "position",
+        "router",
+        "builder",
+        "routes",
+        "_unhinted",
+        "_selectors",
+    )
+
+    def __init__(
+        self,
+        position: int,
+        router: "Router",
+        builder: Type[EventBuilder],
+        routes: Tuple[Route, ...],
+    ):
+        self.position = position
+        self.router = router
+        self.builder = builder
+        self.routes = routes
+
+        unhinted: List[Route] = []
+        hinted: Dict[Type[Hint], List[Tuple[Route, Hint]]] = {}
+        for route in routes:
+            if route.hint is None:
+                unhinted.append(route)
+            else:
+                hinted.setdefault(type(route.hint), []).append(
+                    (route, route.hint)
+                )
+
+        self._unhinted = tuple(unhinted)
+        self._selectors = tuple(
+            hint_type.selector(pairs) for hint_type, pairs in hinted.items()
+        )
+
+    async def candidates(
+        self, built: EventBuilderDict, enter: "EnterT", /,
+    ) -> Sequence[Route]:
+        """
+        Get routes which can pass for the update in registration order.
+        Selectors are called within `enter(event)` context (the same context
+        router calls handlers in).
+        """
+        if not self._selectors:
+            return self.routes
+
+        event = built[self.builder]
+        found: List[Sequence[Route]] = [self._unhinted]
+        with enter(event):
+            for selector in self._selectors:
+                found.extend(await selector.select(event))
+
+        return _unique(heapq.merge(*found, key=_by_position))
+
+    def __repr__(self) -> str:
+        return f"Segment({self.position}, {self.router!r}, {self.routes!r})"
+
+
+class _MergedSegment:
+    """Segments of the same router visit subscribed to different builders."""
+
+    __slots__ = "position", "router", "parts"
+
+    def __init__(self, *parts: Segment):
+        self.position = parts[0].position
+        self.router = parts[0].router
+        self.parts = parts
+
+    async def candidates(
+        self, built: EventBuilderDict, enter: "EnterT", /,
+    ) -> Sequence[Route]:
+        return list(
+            heapq.merge(
+                *[await part.candidates(built, enter) for part in self.parts],
+                key=_by_position,
+            )
+        )
+
+
+EnterT = Callable[[Any], ContextManager[None]]
+AnySegment = Union[Segment, _MergedSegment]
+DispatchIndex = Dict[Type[EventBuilder], Tuple[Segment, ...]]
+
+
+def _walk(router: "Router") -> Iterable["Router"]:
+    """Depth-first traverse of router and its children (router comes first)."""
+    yield router
+    for child in router.children:
+        yield from _walk(child)
+
+
+def build_index(root: "Router", /) -> DispatchIndex:
+    """
+    Compile routers tree into mapping of event builder to ordered segments.
+    Position of a segment and a route reflect registration order
+    in the tree, so dispatch order is the same as with tree walking.
+    """
+    per_builder: Dict[Type[EventBuilder], List[Segment]] = {}
+    route_position = 0
+
+    for router_position, router in enumerate(_walk(root)):
+        grouped: Dict[Type[EventBuilder], List[Route]] = {}
+
+        for handler in router._handlers:
+            grouped.setdefault(handler.__event_builder__, []).append(
+                Route(route_position, handler, router._chain(handler))
+            )
+            route_position += 1
+
+        for builder, routes in grouped.items():
+            per_builder.setdefault(builder, []).append(
+                Segment(router_position, router, builder, tuple(routes))
+            )
+
+    return {
+        builder: tuple(segments) for builder, segments in per_builder.items()
+    }
+
+
+def _merge(segments: Iterable[Segment], /) -> List[AnySegment]:
+    """Merge segments of the same router visit preserving routes order."""
+    grouped: List[List[Segment]] = []
+
+    for segment in segments:
+        if grouped and grouped[-1][0].position == segment.position:
+            grouped[-1].append(segment)
+        else:
+            grouped.append([segment])
+
+    return [
+        parts[0] if len(parts) == 1 else _MergedSegment(*parts)
+        for parts in grouped
+    ]
+
+
+def select_segments(
+    index: DispatchIndex, built: EventBuilderDict, /,
+) -> Sequence[AnySegment]:
+    """
+    Get segments which can be notified about update.
+    Event builders which could not build an event are not touched.
+    """
+    present = [
+        segments for builder, segments in index.items() if built[builder]
+    ]
+
+    if not present:
+        return ()
+
+    if len(present) == 1:
+        return present[0]
+
+    return _merge(heapq.merge(*present, key=_by_position))
+
+
+__all__ = (
+    "Hint",
+    "Selector",
+    "KeyHint",
+    "KeySelector",
+    "Route",
+    "Segment",
+    "AnySegment",
+    "DispatchIndex",
+    "build_index",
+    "select_segments",
+)
@@ -0,0 +1,106 @@
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Type
+
+from telethon.events.common import EventBuilder
+from telethon.tl import types
+
+import _garnet.patched_events as pe
+
+_NEW_MESSAGES = frozenset(
+    {
+        types.UpdateNewMessage,
+        types.UpdateNewChannelMessage,
+        types.UpdateShortMessage,
+        types.UpdateShortChatMessage,
+    }
+)
+
+# raw updates event builders can build events from
+RAW_UPDATES: Dict[Type[EventBuilder], FrozenSet[type]] = {
+    pe.NewMessage: _NEW_MESSAGES,
+    pe.Album: frozenset(
+        {types.UpdateNewMessage, types.UpdateNewChannelMessage}
+    ),
+    pe.MessageEdited: frozenset(
+        {types.UpdateEditMessage, types.UpdateEditChannelMessage}
+    ),
+    pe.MessageDeleted: frozenset(
+        {types.UpdateDeleteMessages, types.UpdateDeleteChannelMessages}
+    ),
+    pe.MessageRead: frozenset(
+        {
+            types.UpdateReadHistoryInbox,
+            types.UpdateReadHistoryOutbox,
+            types.UpdateReadChannelInbox,
+            types.UpdateReadChannelOutbox,
+            types.UpdateReadMessagesContents,
+            types.UpdateChannelReadMessagesContents,
+        }
+    ),
+    pe.ChatAction: frozenset(
+        {
+            types.UpdateNewMessage,
+            types.UpdateNewChannelMessage,
+            types.UpdateChatParticipantAdd,
+            types.UpdateChatParticipantDelete,
+            # joins and leaves of channels and megagroups (newer Telethon)
+            types.UpdateChannelParticipant,
+            types.UpdatePinnedMessages,
+            types.UpdatePinnedChannelMessages,
+        }
+    ),
+    pe.UserUpdate: frozenset(
+        {
+            types.UpdateUserStatus,
+            types.UpdateUserTyping,
+            types.UpdateChatUserTyping,
+            types.UpdateChannelUserTyping,
+        }
+    ),
+    pe.CallbackQuery: frozenset(
+        {types.UpdateBotCallbackQuery, types.UpdateInlineBotCallbackQuery}
+    ),
+    pe.InlineQuery: frozenset({types.UpdateBotInlineQuery}),
+}
+
+
+def raw_updates_of(builder: Type[EventBuilder], /) -> Optional[FrozenSet[type]]:
+    """
+    Get raw update types event builder can build events from,
+    `None` if it's unknown (e.g. `Raw` events).
+    Custom event builders can declare `__raw_updates__` class attribute.
+    """
+    declared: Optional[Iterable[type]] = getattr(
+        builder, "__raw_updates__", None
+    )
+    if declared is not None:
+        return frozenset(declared)
+
+    # the closest known base (e.g. `MessageEdited` subclasses `NewMessage`)
+    for base in builder.__mro__:
+        if base in RAW_UPDATES:
+            return RAW_UPDATES[base]
+
+    return None
+
+
+def subscribed_updates(
+    builders: Iterable[Type[EventBuilder]], /,
+) -> Optional[FrozenSet[type]]:
+    """
+    Get raw update types any of event builders can build events from,
+    `None` if any of them can be built from unknown ones.
+    """
+    subscribed: Set[type] = set()
+    for builder in builders:
+        if (raw_types := raw_updates_of(builder)) is None:
+            return None
+        subscribed |= raw_types
+
+    return frozenset(subscribed)
+
+
+__all__ = (
+    "RAW_UPDATES",
+    "raw_updates_of",
+    "subscribed_updates",
+)
@@ -1,11 +1,14 @@
 import asyncio
+import contextvars
 import copy
 import functools
+import time
 from contextlib import contextmanager
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
+    ContextManager,
     Dict,
     Generator,
     List,
@@ -21,17 +24,36 @@ from telethon.client.updates import EventBuilderDict
 from telethon.events import common
 
 import _garnet.patched_events as pe
-from _garnet.events.action import AfterFilterAction, NoAction, ensure_action
-from _garnet.events.filter import Filter, ensure_filter
+from _garnet.concurrency import spawn
+from _garnet.events.action import (
+    AfterFilterAction,
+    AsyncFunction,
+    NoAction,
+    ensure_action,
+)
+from _garnet.events.filter import (
+    Filter,
+    ensure_filter,
+    evaluate,
+    memoized,
+    revision,
+)
 from _garnet.events.handler import (
     AsyncFunctionHandler,
     EventHandler,
     ensure_handler,
 )
-from _garnet.events.user_cage import KeyMakerFn, UserCage
+from _garnet.events.index import (
+    AnySegment,
+    DispatchIndex,
+    build_index,
+    select_segments,
+)
+from _garnet.events.user_cage import KeyMakerFn, cage_for, caged
 from _garnet.loggers import events
 from _garnet.vars import fsm as fsm_ctx
 from _garnet.vars import handler as h_ctx
+from _garnet.vars import text as text_ctx
 from _garnet.vars import user_and_chat as uc_ctx
 
 if TYPE_CHECKING:
@@ -41,6 +63,9 @@ if TYPE_CHECKING:
 
 ET = TypeVar("ET", bound=common.EventBuilder)
 UnwrappedIntermediateT = Callable[[Type[EventHandler], common.EventCommon], Any]
+IntermediateTimerT = Callable[
+    [UnwrappedIntermediateT, Type[EventHandler], float], None
+]
 
 __ProxyT = TypeVar("__ProxyT")
 _EventHandlerGT = Union[
@@ -48,25 +73,48 @@ _EventHandlerGT = Union[
 ]
 
 FilterWithAction = Tuple[Filter[ET], Type[AfterFilterAction[ET]]]
+OnTimeoutT = Union[AsyncFunction[ET], Type[AfterFilterAction[ET]]]
+
+# variables filters set when they pass, e.g. match object
+_FILTER_VARS: "Tuple[contextvars.ContextVar[Any], ...]" = (
+    text_ctx.MatchCtx,
+    text_ctx.KeywordsCtx,
+)
+
+
+@contextmanager
+def _filter_vars_scope() -> Generator[None, None, None]:
+    """
+    Drop values filters set within the context when it exits,
+    so they're seen only by the router or handler they were set for.
+    """
+    tokens = [variable.set(variable.get()) for variable in _FILTER_VARS]
+    try:
+        yield
+    finally:
+        for variable, token in zip(_FILTER_VARS, tokens):
+            variable.reset(token)
 
 
 async def check_filter(
     built: EventBuilderDict,
     filter_: Tuple[
-        Filter[Optional[ET]], Type[AfterFilterAction[Optional[ET], Any]],
+        Filter[Optional[ET]], Type[AfterFilterAction[Optional[ET]]],
     ],
     /,
 ) -> bool:
     f, on_err_action = filter_
 
-    if event := built[f.event_builder]:
+    event = None if f.event_builder is None else built[f.event_builder]
+
+    if event:
         event_token = event.set_current(event)
 
         try:
-            if await f.call(event) is True:
+            if await evaluate(f, event) is True:
                 return True
             else:
-                asyncio.create_task(on_err_action(event, f).call())
+                spawn(on_err_action(event, f).call())
                 return False
 
         finally:
@@ -77,13 +125,59 @@ async def check_filter(
             f"Got event-naive filter: {filter_!r}, "
             f"calling it with default `None`"
         )
-        if await f.call(None) is not True:
-            asyncio.create_task(on_err_action(event, f).call())
+        if await evaluate(f, None) is not True:
+            spawn(on_err_action(event, f).call())
             return False
 
     return True
 
 
+def _timed(
+    intermediate: UnwrappedIntermediateT,
+    handler: Type[EventHandler[ET]],
+    timer: IntermediateTimerT,
+) -> UnwrappedIntermediateT:
+    @functools.wraps(intermediate)
+    async def timed(next_: Callable[[ET], Any], event: ET) -> Any:
+        started = time.perf_counter()
+        try:
+            return await intermediate(next_, event)
+        finally:
+            timer(intermediate, handler, time.perf_counter() - started)
+
+    return timed
+
+
+def _deadlined(
+    chain: Callable[[ET], Any],
+    handler: Type[EventHandler[ET]],
+    timeout: float,
+    on_timeout: Optional[Type[AfterFilterAction[ET]]],
+) -> Callable[[ET], Any]:
+    @functools.wraps(chain)
+    async def deadlined(event: ET) -> Any:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if (outer := h_ctx.DeadlineCtx.get()) is not None:
+            deadline = min(deadline, outer)
+
+        token = h_ctx.DeadlineCtx.set(deadline)
+        try:
+            return await asyncio.wait_for(
+                chain(event), max(deadline - loop.time(), 0.0)
+            )
+        except asyncio.TimeoutError:
+            events.warning(
+                f"Handler {handler.__name__} timed out after {timeout}s"
+            )
+            if on_timeout is not None:
+                spawn(on_timeout(event, handler).call())
+        finally:
+            h_ctx.DeadlineCtx.reset(token)
+
+    return deadlined
+
+
 def _map_filters(
     for_event: Optional[Type[ET]],
     filters: Tuple[Union[Filter[Optional[ET]], FilterWithAction[Optional[ET]]]],
@@ -110,6 +204,13 @@ class Router:
         "_intermediates",
         "children",
         "_cage_key_maker_f",
+        "_parents",
+        "_index",
+        "_intermediate_timer",
+        "_cache_cage_data",
+        "_timeout",
+        "_on_timeout",
+        "priority",
     )
 
     def __init__(
@@ -119,37 +220,82 @@ class Router:
             Filter[Optional[ET]], FilterWithAction[Optional[ET]]
         ],
         cage_key_maker: Optional[KeyMakerFn] = None,
+        intermediate_timer: Optional[IntermediateTimerT] = None,
+        cache_cage_data: bool = False,
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
+        priority: Optional[int] = None,
     ):
         """
         :param default_event: Default event
         :param upper_filters: Filters to be used to test event
         when event reaches this router
+        :param intermediate_timer: Function to be called with intermediate,
+        handler and seconds spent in the intermediate (including the rest
+        of the chain) after every intermediate call
+        :param cache_cage_data: Read user data once per update, the same
+        data object is returned by every `UserCage.get_data` call then
+        :param timeout: Seconds every own handler (with intermediates) is given
+        before it's cancelled, unless handler has its own timeout
+        :param on_timeout: Action to be called when own handler is timed out,
+        unless handler has its own action
+        :param priority: Priority of own handlers' event builders,
+        see `PriorityLanes`. Lane is chosen before routing, so it applies
+        to all updates of these builders, not only ones this router handles
+        (the highest priority of a builder wins)
         """
         self.event = default_event
         self._handlers: List[Type[EventHandler[ET]]] = []
-
-        if default_event is not None:
-            self.upper_filters = _map_filters(default_event, upper_filters)
-        else:
-            self.upper_filters = upper_filters
+        self.upper_filters = tuple(_map_filters(default_event, upper_filters))
 
         self._intermediates: List[UnwrappedIntermediateT] = []
         self.children: "List[Router]" = []
         self._cage_key_maker_f = cage_key_maker
+        self._parents: "List[Router]" = []
+        self._index: Optional[DispatchIndex] = None
+        self._intermediate_timer = intermediate_timer
+        self._cache_cage_data = cache_cage_data
+        self._timeout = timeout
+        self._on_timeout = on_timeout and ensure_action(on_timeout, self.event)
+        self.priority = priority
 
     def __deepcopy__(self, memo: Dict[Any, Any]) -> "Router":
         copied = self.__class__(
             self.event,
             *self.upper_filters,
             cage_key_maker=self._cage_key_maker_f,
+            intermediate_timer=self._intermediate_timer,
+            cache_cage_data=self._cache_cage_data,
+            timeout=self._timeout,
+            on_timeout=self._on_timeout,
+            priority=self.priority,
         )
         copied._handlers = self._handlers
         copied._intermediates = self._intermediates
         copied.children = [
             copy.deepcopy(child, memo=memo) for child in self.children
         ]
+        for child in copied.children:
+            child._parents.append(copied)
         return copied
 
+    def _invalidate(self) -> None:
+        """Drop compiled dispatch index of self and of all including routers."""
+        self._index = None
+        for parent in self._parents:
+            parent._invalidate()
+
+    def freeze(self) -> DispatchIndex:
+        """
+        Compile routers tree into dispatch index,
+        so updates only touch handlers subscribed to the built events.
+        Index is compiled lazily on the first update if it was not frozen,
+        and recompiled if the tree is changed after that.
+        """
+        if self._index is None:
+            self._index = build_index(self)
+        return self._index
+
     def add_use(self, intermediate: UnwrappedIntermediateT) -> None:
         """
         Add async generator function to intermediates.
@@ -157,6 +303,7 @@ class Router:
         :param intermediate: asynchronous generator function
         """
         self._intermediates.append(intermediate)
+        self._invalidate()
 
     def use(self) -> Callable[[UnwrappedIntermediateT], UnwrappedIntermediateT]:
         """
@@ -192,6 +339,8 @@ class Router:
             )
 
         self.children.append(router)
+        router._parents.append(self)
+        self._invalidate()
         return self
 
     @property
@@ -215,15 +364,36 @@ class Router:
         cls,
         intermediates: Reversible[UnwrappedIntermediateT],
         handler: Type[EventHandler[ET]],
+        timer: Optional[IntermediateTimerT] = None,
     ) -> Callable[[ET], Any]:
         @functools.wraps(handler)
         def mpa(event: ET) -> Any:
             return handler(event)
 
         for inter in reversed(intermediates):
+            if timer is not None:
+                inter = _timed(inter, handler, timer)
             mpa = functools.partial(inter, mpa)
         return mpa
 
+    def _chain(self, handler: Type[EventHandler[ET]]) -> Callable[[ET], Any]:
+        """
+        Build handler call chain with own intermediates and deadline.
+        Chains are cached in the dispatch index, see `Router.freeze`.
+        """
+        chain = self._wrap_intermediates(
+            self._intermediates, handler, self._intermediate_timer,
+        )
+
+        timeout = handler.__timeout__
+        if timeout is None:
+            timeout = self._timeout
+        if timeout is None:
+            return chain
+
+        on_timeout = handler.__on_timeout__ or self._on_timeout
+        return _deadlined(chain, handler, timeout, on_timeout)
+
     async def _notify_filters(self, built: EventBuilderDict) -> bool:
         """Shallow call"""
         for filter_ in self.upper_filters:
@@ -240,17 +410,19 @@ class Router:
         /,
     ):
         with uc_ctx.current_user_and_chat_ctx_manager(event):
-            fsm_context = UserCage(
+            fsm_context = cage_for(
                 storage,
                 uc_ctx.ChatIDCtx.get(),
                 uc_ctx.UserIDCtx.get(),
                 self._cage_key_maker_f,
+                cache_data=self._cache_cage_data,
             )
             event_token = event.set_current(event)
             fsm_token = fsm_ctx.CageCtx.set(fsm_context)
             client_token = client.set_current(client)
             try:
-                yield
+                with _filter_vars_scope():
+                    yield
             finally:
                 event.reset_current(event_token)
                 fsm_ctx.CageCtx.reset(fsm_token)
@@ -258,55 +430,78 @@ class Router:
 
     async def _notify_handlers(
         self,
+        segment: AnySegment,
         built: EventBuilderDict,
         storage: "BaseStorage[StorageDataT]",
         client: "TelegramClient",
         /,
     ) -> bool:
-        """Shallow call."""
-        for handler in self._handlers:
-            if event := built[handler.__event_builder__]:
-                with self._contexvars_context(
-                    storage, event, client,
-                ):
-                    events.debug(
-                        "Current context configuration: {"
-                        f"CHAT_ID={uc_ctx.ChatIDCtx.get()},"
-                        f"USER_ID={uc_ctx.UserIDCtx.get()},"
-                        "}"
-                    )
+        """
+        Shallow call.
+        Candidates of the rest of the segment are selected again
+        if a skipped handler has changed user state.
+        Raises `StopPropagation` if handler asked to stop propagation.
+        """
 
-                    handler_token = None
-                    try:
-                        handler_token = h_ctx.HandlerCtx.set(handler)
-
-                        for hf in handler.filters:
-                            assert isinstance(hf, tuple), (
-                                "Got unchecked " "handler, " "won't execute. "
-                            )
-                            if await check_filter(built, hf):
-                                continue
-                            break
-                        else:
-                            await self._wrap_intermediates(
-                                self._intermediates, handler,
-                            )(event)
-                            return True
+        def enter(event: ET) -> ContextManager[None]:
+            return self._contexvars_context(storage, event, client)
 
-                    except pe.StopPropagation:
-                        events.debug(
-                            f"Stopping propagation for all next handlers "
-                            f"after {handler!r}"
+        seen_revision = revision()
+        routes = await segment.candidates(built, enter)
+        cursor = 0
+
+        while cursor < len(routes):
+            route = routes[cursor]
+            cursor += 1
+
+            handler = route.handler
+            event = built[handler.__event_builder__]
+
+            with enter(event):
+                events.debug(
+                    "Current context configuration: {"
+                    f"CHAT_ID={uc_ctx.ChatIDCtx.get()},"
+                    f"USER_ID={uc_ctx.UserIDCtx.get()},"
+                    "}"
+                )
+
+                handler_token = None
+                try:
+                    handler_token = h_ctx.HandlerCtx.set(handler)
+
+                    for hf in handler.filters:
+                        assert isinstance(hf, tuple), (
+                            "Got unchecked " "handler, " "won't execute. "
                         )
+                        if await check_filter(built, hf):
+                            continue
                         break
+                    else:
+                        await route.chain(event)
+                        return True
 
-                    except pe.SkipHandler:
-                        events.debug(f"Skipping handler({handler!r}) execution")
-                        continue
+                except pe.StopPropagation:
+                    events.debug(
+                        f"Stopping propagation for all next handlers "
+                        f"after {handler!r}"
+                    )
+                    raise
+
+                except pe.SkipHandler:
+                    events.debug(f"Skipping handler({handler!r}) execution")
+
+                finally:
+                    if handler_token:
+                        h_ctx.HandlerCtx.reset(handler_token)
 
-                    finally:
-                        if handler_token:
-                            h_ctx.HandlerCtx.reset(handler_token)
+            if revision() != seen_revision:
+                seen_revision = revision()
+                routes = [
+                    candidate
+                    for candidate in await segment.candidates(built, enter)
+                    if candidate.position > route.position
+                ]
+                cursor = 0
 
         return False
 
@@ -318,68 +513,119 @@ class Router:
         /,
     ) -> None:
         """Notify router and its children about update."""
-        if await self._notify_filters(built) and await self._notify_handlers(
-            built, storage, client
-        ):
-            return
+        index = self._index
+        if index is None:
+            index = self.freeze()
+
+        with memoized(), caged():
+            for segment in select_segments(index, built):
+                router = segment.router
+
+                with _filter_vars_scope():
+                    if not await router._notify_filters(built):
+                        continue
 
-        for router in self.children:
-            return await router.notify(storage, built, client)
+                    try:
+                        if await router._notify_handlers(
+                            segment, built, storage, client
+                        ):
+                            return
+                    except pe.StopPropagation:
+                        return
 
     # noinspection PyTypeChecker
     def message(
-        self, *filters: "Filter[ET]",
+        self,
+        *filters: "Filter[ET]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for `garnet.events.NewMessage` event handlers."""
 
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             f_or_class_to_reg = ensure_handler(f_or_class, pe.NewMessage)
-            self.register(f_or_class_to_reg, filters, event=pe.NewMessage)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=pe.NewMessage,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
 
     # noinspection PyTypeChecker
     def callback_query(
-        self, *filters: "Filter[ET]",
+        self,
+        *filters: "Filter[ET]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for `garnet.events.CallbackQuery` event handlers."""
 
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             f_or_class_to_reg = ensure_handler(f_or_class, pe.CallbackQuery)
-            self.register(f_or_class_to_reg, filters, event=pe.CallbackQuery)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=pe.CallbackQuery,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
 
     # noinspection PyTypeChecker
     def chat_action(
-        self, *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        self,
+        *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for `garnet.events.ChatAction` event handlers."""
 
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             f_or_class_to_reg = ensure_handler(f_or_class, pe.ChatAction)
-            self.register(f_or_class_to_reg, filters, event=pe.ChatAction)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=pe.ChatAction,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
 
     # noinspection PyTypeChecker
     def message_edited(
-        self, *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        self,
+        *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for `garnet.events.MessageEdited` event handlers."""
 
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             f_or_class_to_reg = ensure_handler(f_or_class, pe.MessageEdited)
-            self.register(f_or_class_to_reg, filters, event=pe.MessageEdited)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=pe.MessageEdited,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
 
     def default(
-        self, *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        self,
+        *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for router's default event event handlers."""
         if self.event is None or (
@@ -395,7 +641,13 @@ class Router:
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             assert self.event is not None
             f_or_class_to_reg = ensure_handler(f_or_class, self.event)
-            self.register(f_or_class_to_reg, filters, event=self.event)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=self.event,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
@@ -405,12 +657,20 @@ class Router:
         event_builder: "Type[common.EventBuilder]",
         /,
         *filters: "Union[Filter[ET], FilterWithAction[ET]]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> Callable[[_EventHandlerGT[ET]], _EventHandlerGT[ET]]:
         """Decorator for a specific event-aware event handlers."""
 
         def decorator(f_or_class: _EventHandlerGT[ET]) -> _EventHandlerGT[ET]:
             f_or_class_to_reg = ensure_handler(f_or_class, event_builder)
-            self.register(f_or_class_to_reg, filters, event=event_builder)
+            self.register(
+                f_or_class_to_reg,
+                filters,
+                event=event_builder,
+                timeout=timeout,
+                on_timeout=on_timeout,
+            )
             return f_or_class
 
         return decorator
@@ -420,9 +680,15 @@ class Router:
         handler: "Type[EventHandler[ET]]",
         filters: "Tuple[Union[Filter[ET], FilterWithAction[ET]], ...]",
         event: "Type[common.EventBuilder]",
+        timeout: Optional[float] = None,
+        on_timeout: Optional[OnTimeoutT[ET]] = None,
     ) -> "Router":
         """
         Entrypoint for registering event handlers on particular event builders.
+
+        :param timeout: Seconds handler (with intermediates) is given
+        before it's cancelled, overrides router's timeout
+        :param on_timeout: Action to be called when handler is timed out
         """
         handler = ensure_handler(handler, event_builder=event)
         if handler.filters:
@@ -430,7 +696,13 @@ class Router:
         else:
             handler.filters = tuple(_map_filters(event, filters))
 
+        if timeout is not None:
+            handler.__timeout__ = timeout
+        if on_timeout is not None:
+            handler.__on_timeout__ = ensure_action(on_timeout, event)
+
         self._handlers.append(handler)
+        self._invalidate()
         return self
 
     def __str__(self) -> str:
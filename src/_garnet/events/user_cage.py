@@ -1,11 +1,30 @@
-from typing import Any, Callable, Dict, Generic, Mapping, Optional, Union
-
+import contextvars
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Generic,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from _garnet.events.filter import forget
 from _garnet.filters.state import M
 from _garnet.storages.base import BaseStorage
 from _garnet.storages.typedef import StorageDataT
 
 KeyMakerFn = Callable[[Optional[int], Optional[int]], str]
 
+_NOT_READ: Any = object()
+
+_cages: contextvars.ContextVar[
+    Optional[Dict[Tuple[int, str, bool], "UserCage[Any]"]]
+] = contextvars.ContextVar("cages", default=None)
+
 
 def _default_key_maker(
     chat_id: Optional[int] = None, user_id: Optional[int] = None, /,
@@ -23,13 +42,27 @@ def _default_key_maker(
     return f"{chat_id}:{user_id}"
 
 
+class _Cached:
+    """State and data of a user read or written by cages sharing it."""
+
+    __slots__ = "state", "data"
+
+    def __init__(self) -> None:
+        self.state: Any = _NOT_READ
+        self.data: Any = _NOT_READ
+
+
 class UserCage(Generic[StorageDataT]):
     """
     UserCage is "cage" for a particular user in chat.
     That stores user's state and can also be used to store user related date
+
+    Cage remembers state it has read or written (and data, if `cache_data`),
+    so the storage is asked only once for the cage lifetime,
+    which is the single update when cage is made by router.
     """
 
-    __slots__ = "key", "storage"
+    __slots__ = "key", "storage", "cache_data", "_cached"
 
     def __init__(
         self,
@@ -38,20 +71,37 @@ class UserCage(Generic[StorageDataT]):
         user_id: Optional[int],
         key_maker: Optional[KeyMakerFn],
         /,
+        *,
+        cache_data: bool = False,
     ):
         if key_maker is None:
             key_maker = _default_key_maker
 
         self.key = key_maker(chat_id, user_id)
         self.storage = storage
+        self.cache_data = cache_data
+        self._cached = _Cached()
 
     async def get_state(self) -> Optional[str]:
         """Get user's state."""
-        return await self.storage.get_state(self.key)
+        cached = self._cached
+        if cached.state is _NOT_READ:
+            cached.state = await self.storage.get_state(self.key)
+        return cached.state
 
     async def get_data(self) -> Optional[StorageDataT]:
-        """Get data associated with user."""
-        return await self.storage.get_data(self.key)
+        """
+        Get data associated with user.
+        (!) If data is cached, the same object is returned for every call.
+        Storage may return copy-on-write view (see `DictStorage`).
+        """
+        if not self.cache_data:
+            return await self.storage.get_data(self.key)
+
+        cached = self._cached
+        if cached.data is _NOT_READ:
+            cached.data = await self.storage.get_data(self.key)
+        return cached.data
 
     async def update_data(
         self, data: Optional[StorageDataT] = None, /, **kwargs: Any,
@@ -70,7 +120,9 @@ class UserCage(Generic[StorageDataT]):
 
         temp_data.update(**kwargs)
 
+        self._cached.data = _NOT_READ
         await self.storage.update_data(self.key, data=temp_data)  # type: ignore
+        forget()
 
     async def set_state(self, state: Optional[Union[M, str]] = None) -> None:
         """Set user's current state, state can be M(ember) of a state group."""
@@ -79,19 +131,29 @@ class UserCage(Generic[StorageDataT]):
         else:
             state_name = state
 
+        self._cached.state = _NOT_READ
         await self.storage.set_state(self.key, state=state_name)
+        self._cached.state = state_name
+        forget()
 
     async def set_data(self, data: Optional[StorageDataT] = None) -> None:
         """Rewrite user associated data."""
+        self._cached.data = _NOT_READ
         await self.storage.set_data(self.key, data=data)
+        forget()
 
     async def reset_state(self) -> None:
         """Reset user's state."""
+        self._cached.state = _NOT_READ
         await self.storage.reset_state(self.key)
+        self._cached.state = None
+        forget()
 
     async def reset_data(self) -> None:
         """Reset user's data"""
+        self._cached.data = _NOT_READ
         await self.storage.reset_data(self.key)
+        forget()
 
     async def free(self) -> None:
         """
@@ -108,4 +170,54 @@ class UserCage(Generic[StorageDataT]):
         >>> assert await cage.get_state() is None
         >>> assert await cage.get_data() is None
         """
+        self._cached.state = self._cached.data = _NOT_READ
         await self.storage.reset(self.key)
+        self._cached.state = None
+        forget()
+
+
+@contextmanager
+def caged() -> Generator[None, None, None]:
+    """Share cages made by `cage_for` until the context exits."""
+    token = _cages.set({})
+    try:
+        yield
+    finally:
+        _cages.reset(token)
+
+
+def cage_for(
+    storage: BaseStorage[StorageDataT],
+    chat_id: Optional[int],
+    user_id: Optional[int],
+    key_maker: Optional[KeyMakerFn],
+    /,
+    *,
+    cache_data: bool = False,
+) -> UserCage[StorageDataT]:
+    """
+    Get cage shared within `caged` context or make a new one.
+    Cages of the same user with and without `cache_data` share cached state,
+    but data is cached only for cages made with `cache_data`.
+    """
+    cages = _cages.get()
+    if cages is None:
+        return UserCage(
+            storage, chat_id, user_id, key_maker, cache_data=cache_data,
+        )
+
+    if key_maker is None:
+        key_maker = _default_key_maker
+
+    user_key = key_maker(chat_id, user_id)
+    key = (id(storage), user_key, cache_data)
+    try:
+        return cages[key]
+    except KeyError:
+        cage = cages[key] = UserCage(
+            storage, chat_id, user_id, key_maker, cache_data=cache_data,
+        )
+        sibling = cages.get((id(storage), user_key, not cache_data))
+        if sibling is not None:
+            cage._cached = sibling._cached
+        return cage
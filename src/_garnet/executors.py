@@ -0,0 +1,449 @@
+import abc
+import asyncio
+import collections
+import enum
+import inspect
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from telethon.client.updates import EventBuilderDict
+
+from _garnet.concurrency import DrainReport, TaskTracker, merge_reports
+from _garnet.events.user_cage import KeyMakerFn, _default_key_maker
+from _garnet.helpers.peers import peers_of
+from _garnet.loggers import events, runtime
+
+if TYPE_CHECKING:
+    from _garnet.client import TelegramClient
+
+DispatchHookT = Callable[[EventBuilderDict, "TelegramClient"], Awaitable[None]]
+UpdateHookT = Callable[[EventBuilderDict, "TelegramClient"], Any]
+_Submitted = Tuple[EventBuilderDict, "TelegramClient"]
+
+
+async def _call_hook(
+    hook: Optional[UpdateHookT],
+    built: EventBuilderDict,
+    client: "TelegramClient",
+    /,
+) -> None:
+    if hook is None:
+        return
+
+    try:
+        result = hook(built, client)
+        if inspect.isawaitable(result):
+            await result
+    except Exception:
+        events.exception(f"Error in hook {hook!r}")
+
+
+def _cancelled(closing: bool, /) -> bool:
+    """
+    Tell cancellation of current task from `CancelledError` raised
+    by a handler (e.g. timeout of its `wait_for`): tasks count cancellation
+    requests since Python 3.11, before that only executor's own ones
+    (when it's closing) are known.
+    """
+    cancelling = getattr(asyncio.current_task(), "cancelling", None)
+    if cancelling is not None:
+        return cancelling() > 0
+    return closing
+
+
+class DispatchExecutor(abc.ABC):
+    """
+    Base dispatch executor.
+    Client submits updates to an executor and executor decides when
+    and how router is notified about them.
+    """
+
+    @abc.abstractmethod
+    async def start(self, dispatch: DispatchHookT, /) -> None:
+        """Start executor, called once before updates are submitted."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def submit(
+        self, built: EventBuilderDict, client: "TelegramClient", /,
+    ) -> None:
+        """Submit update, may wait until executor is able to accept it."""
+        raise NotImplementedError
+
+    @property
+    def queued(self) -> int:
+        """Number of accepted updates waiting to be dispatched."""
+        return 0
+
+    @abc.abstractmethod
+    async def close(self, timeout: float = 0.0, /) -> DrainReport:
+        """
+        Stop executor, called once when client stops.
+        Accepted updates are given `timeout` seconds to be handled,
+        the rest are cancelled.
+        """
+        raise NotImplementedError
+
+
+class Overflow(enum.Enum):
+    """What to do with a new update when executor's queue is full."""
+
+    # wait for free place in the queue (client stops reading updates)
+    BLOCK = "block"
+    # drop the oldest queued update to free place for the new one
+    DROP_OLDEST = "drop_oldest"
+    # drop the new update
+    DROP_NEWEST = "drop_newest"
+    # drop the new update, `on_overflow` hook is required to handle it
+    REJECT = "reject"
+
+
+class WorkerPool(DispatchExecutor):
+    """
+    Fixed number of worker coroutines dispatching updates from bounded queue.
+
+    Usage::
+
+        >>> from garnet.runner import run, WorkerPool, Overflow
+        >>>
+        >>> async def busy(built, client):
+        ...     if query := built[events.CallbackQuery]:
+        ...         await query.answer("Too busy, try later")
+        >>>
+        >>> pool = WorkerPool(64, 10_000, Overflow.REJECT, on_overflow=busy)
+        >>> await run(router, storage, executor=pool)
+    """
+
+    __slots__ = (
+        "workers",
+        "queue_size",
+        "overflow",
+        "on_overflow",
+        "in_flight",
+        "dropped",
+        "_queue",
+        "_tasks",
+        "_dispatch",
+        "_closing",
+    )
+
+    def __init__(
+        self,
+        workers: int = 32,
+        queue_size: int = 1024,
+        overflow: Overflow = Overflow.BLOCK,
+        *,
+        on_overflow: Optional[UpdateHookT] = None,
+    ):
+        """
+        :param workers: max number of updates dispatched at the same time
+        :param queue_size: max number of updates waiting for a worker
+        :param overflow: overflow policy, see `Overflow`
+        :param on_overflow: hook called with every dropped update
+        """
+        if workers < 1 or queue_size < 1:
+            raise ValueError("`workers` and `queue_size` must be positive")
+
+        if overflow is Overflow.REJECT and on_overflow is None:
+            raise ValueError("`on_overflow` is required for Overflow.REJECT")
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.on_overflow = on_overflow
+        self.in_flight = 0
+        self.dropped = 0
+
+        self._queue: "Optional[asyncio.Queue[_Submitted]]" = None
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._dispatch: Optional[DispatchHookT] = None
+        self._closing = False
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.workers}, {self.queue_size}, "
+            f"{self.overflow})"
+        )
+
+    @property
+    def queued(self) -> int:
+        """Number of updates waiting for a worker."""
+        return 0 if self._queue is None else self._queue.qsize()
+
+    async def _work(self) -> None:
+        assert self._queue is not None and self._dispatch is not None
+
+        while True:
+            built, client = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await self._dispatch(built, client)
+            except asyncio.CancelledError:
+                if _cancelled(self._closing):
+                    raise
+                events.error("Dispatch of update was cancelled by handler")
+            except Exception:
+                events.exception("Got an unhandled error in worker")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    async def start(self, dispatch: DispatchHookT, /) -> None:
+        self._dispatch = dispatch
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"garnet worker #{number}")
+            for number in range(self.workers)
+        ]
+
+    async def _drop(
+        self, built: EventBuilderDict, client: "TelegramClient", /,
+    ) -> None:
+        self.dropped += 1
+        events.debug(f"Dropping update due to {self.overflow}")
+        await _call_hook(self.on_overflow, built, client)
+
+    async def submit(
+        self, built: EventBuilderDict, client: "TelegramClient", /,
+    ) -> None:
+        assert self._queue is not None, "WorkerPool is not started"
+
+        if self.overflow is Overflow.BLOCK or not self._queue.full():
+            await self._queue.put((built, client))
+
+        elif self.overflow is Overflow.DROP_OLDEST:
+            oldest = self._queue.get_nowait()
+            self._queue.task_done()
+            self._queue.put_nowait((built, client))
+            await self._drop(*oldest)
+
+        else:
+            await self._drop(built, client)
+
+    async def close(self, timeout: float = 0.0, /) -> DrainReport:
+        started = time.monotonic()
+        pending = self.queued + self.in_flight
+
+        if pending and self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        cancelled = self.queued + self.in_flight
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        return DrainReport(
+            pending=pending,
+            finished=max(pending - cancelled, 0),
+            cancelled=cancelled,
+            elapsed=time.monotonic() - started,
+        )
+
+
+class KeyedExecutor(DispatchExecutor):
+    """
+    Dispatch updates with the same key one by one in order they came,
+    and updates with different keys concurrently.
+
+    By default key is the same key `UserCage` is stored by,
+    so one user can't race with themself, e.g. between FSM states.
+    Key queue lives only while it has updates, so idle keys take no memory.
+    Updates without chat and user are dispatched concurrently.
+
+    Usage::
+
+        >>> from garnet.runner import run, KeyedExecutor
+        >>>
+        >>> await run(router, storage, executor=KeyedExecutor())
+    """
+
+    __slots__ = (
+        "key_maker",
+        "max_pending",
+        "max_in_flight",
+        "accepted",
+        "_lanes",
+        "_tasks",
+        "_pending",
+        "_in_flight",
+        "_dispatch",
+        "_closing",
+    )
+
+    def __init__(
+        self,
+        key_maker: Optional[KeyMakerFn] = None,
+        *,
+        max_pending: int = 10_000,
+        max_in_flight: Optional[int] = None,
+    ):
+        """
+        :param key_maker: chat and user IDs to key function,
+            should be the same as `cage_key_maker` of router if it has one
+        :param max_pending: max number of accepted but not handled updates,
+            client waits for free place when it's reached
+        :param max_in_flight: max number of updates dispatched at the same time
+        """
+        if max_pending < 1 or (max_in_flight or 1) < 1:
+            raise ValueError(
+                "`max_pending` and `max_in_flight` must be positive"
+            )
+
+        self.key_maker = key_maker or _default_key_maker
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        # number of accepted but not handled updates
+        self.accepted = 0
+
+        self._lanes: Dict[Hashable, Deque[_Submitted]] = {}
+        self._tasks = TaskTracker()
+        self._pending: Optional[asyncio.Semaphore] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._dispatch: Optional[DispatchHookT] = None
+        self._closing = False
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.key_maker!r}, "
+            f"max_pending={self.max_pending}, "
+            f"max_in_flight={self.max_in_flight})"
+        )
+
+    @property
+    def queued(self) -> int:
+        return self.accepted
+
+    @property
+    def keys(self) -> int:
+        """Number of keys with queued or running updates."""
+        return len(self._lanes)
+
+    def key_of(self, built: EventBuilderDict, /) -> Optional[Hashable]:
+        """Get key of update, `None` for updates without chat and user."""
+        chat_id, user_id = peers_of(built.update)
+        if chat_id is None and user_id is None:
+            return None
+        return self.key_maker(chat_id, user_id)
+
+    async def _run_one(self, submitted: _Submitted, /) -> None:
+        assert self._pending is not None and self._dispatch is not None
+
+        try:
+            if self._in_flight is None:
+                await self._dispatch(*submitted)
+            else:
+                async with self._in_flight:
+                    await self._dispatch(*submitted)
+        except asyncio.CancelledError:
+            if _cancelled(self._closing):
+                raise
+            events.error("Dispatch of update was cancelled by handler")
+        except Exception:
+            events.exception("Got an unhandled error in keyed executor")
+        finally:
+            self.accepted -= 1
+            self._pending.release()
+
+    async def _run_lane(self, key: Hashable, lane: Deque[_Submitted], /):
+        try:
+            while lane:
+                await self._run_one(lane[0])
+                lane.popleft()
+        finally:
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+
+    async def start(self, dispatch: DispatchHookT, /) -> None:
+        self._dispatch = dispatch
+        self._pending = asyncio.Semaphore(self.max_pending)
+        if self.max_in_flight is not None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def submit(
+        self, built: EventBuilderDict, client: "TelegramClient", /,
+    ) -> None:
+        assert self._pending is not None, "KeyedExecutor is not started"
+
+        await self._pending.acquire()
+        self.accepted += 1
+        key = self.key_of(built)
+
+        if key is None:
+            self._tasks.spawn(self._run_one((built, client)), "garnet update")
+
+        elif (lane := self._lanes.get(key)) is not None:
+            lane.append((built, client))
+
+        else:
+            lane = self._lanes[key] = collections.deque(((built, client),))
+            self._tasks.spawn(self._run_lane(key, lane), f"garnet lane {key!r}")
+
+    async def close(self, timeout: float = 0.0, /) -> DrainReport:
+        started = time.monotonic()
+        pending = self.accepted
+        cancelled = 0
+        if not await self._tasks.wait(timeout):
+            # updates being dispatched are counted before they're cancelled
+            cancelled = self.accepted
+            self._closing = True
+            await self._tasks.drain(0.0)
+        self._lanes.clear()
+
+        return DrainReport(
+            pending=pending,
+            finished=pending - cancelled,
+            cancelled=cancelled,
+            elapsed=time.monotonic() - started,
+        )
+
+
+async def shutdown(
+    tasks: TaskTracker, executor: Optional[DispatchExecutor], timeout: float, /,
+) -> DrainReport:
+    """
+    Stop accepting updates and give in-flight ones `timeout` seconds
+    to be handled: updates accepted by executor first,
+    then the rest of tracked tasks (e.g. after filter actions).
+    """
+    tasks.close()
+    deadline = time.monotonic() + timeout
+    reports = []
+
+    if executor is not None:
+        reports.append(await executor.close(timeout))
+
+    reports.append(await tasks.drain(max(deadline - time.monotonic(), 0.0)))
+    report = merge_reports(*reports)
+
+    log = runtime.info if not report["cancelled"] else runtime.warning
+    log(
+        f"Drained in {report['elapsed']:.2f}s: "
+        f"{report['finished']} finished, {report['cancelled']} cancelled"
+    )
+    return report
+
+
+__all__ = (
+    "shutdown",
+    "DispatchExecutor",
+    "DispatchHookT",
+    "KeyedExecutor",
+    "Overflow",
+    "WorkerPool",
+)
@@ -17,6 +17,7 @@ class _FilterVar(var.Var):  # type: ignore
             self.value = Filter(
                 lambda e: e.file is not None and val == e.file.ext,
                 event_builder=NewMessage,
+                pure=True,
             )
 
 
@@ -35,10 +36,10 @@ class File:
     ... async def handle_audio(): pass
     """
 
-    is_video: FE = Filter(lambda event: is_video(event.media))
-    is_image: FE = Filter(lambda event: is_image(event.media))
-    is_gif: FE = Filter(lambda event: is_gif(event.document))
-    is_audio: FE = Filter(lambda event: is_audio(event.media))
+    is_video: FE = Filter(lambda event: is_video(event.media), pure=True)
+    is_image: FE = Filter(lambda event: is_image(event.media), pure=True)
+    is_gif: FE = Filter(lambda event: is_gif(event.document), pure=True)
+    is_audio: FE = Filter(lambda event: is_audio(event.media), pure=True)
 
     # generated by extensions
     # Image extensions
@@ -1,9 +1,13 @@
+import sys
 from typing import (
     Any,
     Container,
     Dict,
+    FrozenSet,
+    Hashable,
     Iterable,
     Literal,
+    Optional,
     Tuple,
     Type,
     Union,
@@ -11,6 +15,7 @@ from typing import (
 )
 
 from _garnet.events.filter import Filter
+from _garnet.events.index import KeyHint, KeySelector
 from _garnet.vars import fsm
 
 _DummyGroupT = Iterable[Union[str, int, Any]]  # use Any to allow nested types
@@ -32,6 +37,34 @@ class NoTop(Exception):
 
 
 # region State filter
+class StateSelector(KeySelector):
+    """
+    Looks routes up by user's state, read through the cage router sets
+    for the segment, so router's `cage_key_maker` is respected.
+    """
+
+    async def keys_of(self, event: Any, /) -> Iterable[Hashable]:
+        state = await fsm.CageCtx.get().get_state()
+        if state is None:
+            return (ENTRYPOINT_STATE,)
+        return state, ANY_STATE_EXCEPT_NONE
+
+
+class StateHint(KeyHint):
+    """
+    State filter passes only for these state names,
+    `ANY_STATE_EXCEPT_NONE` key stands for any state but `None`.
+    """
+
+    # reading state is more expensive than looking a command up
+    # or matching text (even though it's read once per update)
+    cost = 2
+
+    @classmethod
+    def selector(cls, hinted, /) -> StateSelector:
+        return StateSelector(hinted)
+
+
 async def any_state_except_none_func(_):
     return await fsm.CageCtx.get().get_state() is not None
 
@@ -58,23 +91,27 @@ class _MetaCurrentState(type):
     ) -> Filter:
         if _s == ANY_STATE_EXCEPT_NONE:
             _f = any_state_except_none_func
+            keys = (ANY_STATE_EXCEPT_NONE,)
 
         elif _s is None:
             _f = no_state_but_none_func
+            keys = (ENTRYPOINT_STATE,)
 
         elif isinstance(_s, type) and issubclass(_s, Group):
+            keys = _s.all_state_names
 
             async def _f(_):
                 current_state = await fsm.CageCtx.get().get_state()
+                state = _s._frozen.by_name.get(current_state)
 
-                for state in _s.all_state_objects:
-                    if state.name == current_state:
-                        fsm.MCtx.set(state)
-                        return True
+                if state is not None:
+                    fsm.MCtx.set(state)
+                    return True
 
                 return False
 
         elif isinstance(_s, M):
+            keys = (_s.name,)
 
             async def _f(_):
                 current_state = await fsm.CageCtx.get().get_state()
@@ -90,7 +127,13 @@ class _MetaCurrentState(type):
                 "(star notation for any state)"
             )
 
-        return Filter(_f, None)
+        # filters of particular states set `MCtx`, so can't be reused
+        return Filter(
+            _f,
+            None,
+            pure=_f in (any_state_except_none_func, no_state_but_none_func),
+            hint=StateHint(keys),
+        )
 
     @classmethod
     def exact(
@@ -100,11 +143,21 @@ class _MetaCurrentState(type):
         return State == state  # type: ignore
 
     any: Filter = _ilc_descriptor(
-        Filter(any_state_except_none_func, event_builder=None)
+        Filter(
+            any_state_except_none_func,
+            event_builder=None,
+            pure=True,
+            hint=StateHint((ANY_STATE_EXCEPT_NONE,)),
+        )
     )
 
     entry: Filter = _ilc_descriptor(
-        Filter(no_state_but_none_func, event_builder=None)
+        Filter(
+            no_state_but_none_func,
+            event_builder=None,
+            pure=True,
+            hint=StateHint((ENTRYPOINT_STATE,)),
+        )
     )
 
 
@@ -153,7 +206,7 @@ class M:
         oopsie-woopsie
     """
 
-    __slots__ = "_sh_name", "owner"
+    __slots__ = "_sh_name", "owner", "name"
 
     def __set_name__(self, owner: "_MetaStateGroup", name: str) -> None:
         if type(owner) != _MetaStateGroup:
@@ -161,11 +214,8 @@ class M:
 
         self.owner = owner
         self._sh_name = name
-
-    @property
-    def name(self):
-        """Get the full name of a member."""
-        return ".".join((self.owner.full_group_name, self._sh_name))
+        # full name, computed by the group when it's frozen
+        self.name: str = name
 
     def __str__(self) -> str:
         """Affects str(...M-object...)."""
@@ -174,30 +224,70 @@ class M:
     @property
     def next(self) -> "M":
         """Get next item of a group which self is in."""
-        _oss = self.owner.all_state_objects
-        try:
-            return _oss[_oss.index(self) + 1]  # type: ignore
-        except IndexError:
-            raise NoNext from None
+        frozen = self.owner._frozen
+        position = frozen.positions[self] + 1
+        if position == len(frozen.states):
+            raise NoNext
+        return frozen.states[position]
 
     @property
     def prev(self) -> "M":
         """Get previous item of a group which self is in."""
-        _oss = self.owner.all_state_objects
-        try:
-            return _oss[_oss.index(self) - 1]  # type: ignore
-        except IndexError:
-            raise NoPrev from None
+        frozen = self.owner._frozen
+        position = frozen.positions[self]
+        if position == 0:
+            raise NoPrev
+        return frozen.states[position - 1]
 
     @property
     def top(self) -> "M":
         """Get the top (head) item of a group which self is in."""
         try:
-            return self.owner.all_state_objects[0]  # type: ignore
+            return self.owner._frozen.states[0]
         except IndexError:
             raise NoTop from None
 
 
+class _FrozenGroup:
+    """
+    Precomputed group metadata: full name, states (including children)
+    with their interned full names, positions and lookup by name.
+    """
+
+    __slots__ = (
+        "full_name",
+        "states",
+        "names",
+        "name_set",
+        "by_name",
+        "positions",
+    )
+
+    def __init__(
+        self, group: "_MetaStateGroup", parent_name: Optional[str] = None,
+    ):
+        full_name = group._group_name
+        if parent_name is not None:
+            full_name = ".".join((parent_name, full_name))
+        self.full_name = sys.intern(full_name)
+
+        for state in group.states:
+            state.name = sys.intern(".".join((self.full_name, state._sh_name)))
+
+        states = group.states
+        for child in group.children:
+            child._frozen = _FrozenGroup(child, self.full_name)
+            states += child._frozen.states
+
+        self.states: Tuple[M, ...] = states
+        self.names: Tuple[str, ...] = tuple(state.name for state in states)
+        self.name_set: FrozenSet[str] = frozenset(self.names)
+        self.by_name: Dict[str, M] = dict(zip(self.names, states))
+        self.positions: Dict[M, int] = {
+            state: position for position, state in enumerate(states)
+        }
+
+
 def is_reserved(name: str, /) -> bool:
     """
     Check if the name is reserved for state group.
@@ -215,6 +305,7 @@ def is_reserved(name: str, /) -> bool:
             "all_children",
             "_group_name",
             "full_group_name",
+            "_frozen",
         )
     )
 
@@ -254,15 +345,15 @@ class _MetaStateGroup(type):
         cls.parent = None
         cls.children = tuple(children)
         cls.states = tuple(states)
+        # children are frozen again, since their full names have changed
+        cls._frozen = _FrozenGroup(cls)
 
         return cast("Type[Group]", cls)
 
     @property
     def full_group_name(cls) -> str:
         """Get the full name for states group(include parent classes name)."""
-        if cls.parent:
-            return ".".join((cls.parent.full_group_name, cls._group_name))
-        return cls._group_name
+        return cls._frozen.full_name
 
     @property
     def all_children(cls) -> "Tuple[Type[Group], ...]":
@@ -277,10 +368,7 @@ class _MetaStateGroup(type):
         """
         Get tuple of state members including children, excluding parent groups.
         """
-        result = cls.states
-        for child in cls.children:  # type: Type[Group]
-            result += child.all_state_objects
-        return result
+        return cls._frozen.states
 
     @property
     def all_state_names(cls) -> "Tuple[str, ...]":
@@ -288,7 +376,13 @@ class _MetaStateGroup(type):
         Get tuple of names of  state members
         including children, excluding parent groups.
         """
-        return tuple(state.name for state in cls.all_state_objects)
+        return cls._frozen.names
+
+    def __contains__(cls, state: "Union[M, str, None]") -> bool:
+        """Test if state member (or its name) is in the group or children."""
+        if isinstance(state, M):
+            state = state.name
+        return state in cls._frozen.name_set
 
     def get_root(cls) -> "Type[Group]":
         """
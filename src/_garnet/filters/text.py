@@ -1,10 +1,28 @@
 import functools
 import operator
 import re
-from typing import Any, Callable, Iterable, Type, Union
-
-from _garnet.events.filter import Filter
+import unicodedata
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from _garnet.concurrency import to_thread
+from _garnet.events.filter import Filter, reuse
+from _garnet.events.index import Hint, KeyHint, KeySelector, Route, Selector
 from _garnet.patched_events import NewMessage
+from _garnet.vars.text import KeywordsCtx, MatchCtx
 
 _MF = Callable[[str], str]
 
@@ -17,6 +35,7 @@ def _base_len_comparator(
         return Filter(
             lambda update: operator_(len(update.raw_text or "")),
             event_builder=NewMessage,
+            pure=True,
         )
     else:
         return Filter(
@@ -24,6 +43,7 @@ def _base_len_comparator(
                 len(update.raw_text or ""), predicted_length
             ),
             event_builder=NewMessage,
+            pure=True,
         )
 
 
@@ -46,37 +66,194 @@ def startswith(prefix: str, /) -> Filter:
         if isinstance(update.raw_text, str)
         else None,
         event_builder=NewMessage,
+        pure=True,
     )
 
 
+def _parse_command(text: Any, /) -> Optional[str]:
+    """Get command name from text ignoring prefix and bot username."""
+    if not isinstance(text, str):
+        return None
+
+    head = text.split(maxsplit=1)
+    if not head:
+        return None
+
+    return head[0][1:].split("@", maxsplit=1)[0]
+
+
+def command_of(update: Any, /) -> Optional[str]:
+    """Get command name of Some.text::str, parsed once per update."""
+    return reuse(command_of, update, lambda: _parse_command(update.text))
+
+
+class CommandSelector(KeySelector):
+    async def keys_of(self, event: Any, /) -> Iterable[Hashable]:
+        return (command_of(event),)
+
+
+class CommandHint(KeyHint):
+    """Command filter passes only for its command names."""
+
+    @classmethod
+    def selector(cls, hinted, /) -> CommandSelector:
+        return CommandSelector(hinted)
+
+
 def commands(
     *cmd: str, prefixes: Union[str, Iterable[str]] = "/", to_set: bool = True,
 ) -> Filter:
     """
     Check if cmd Some.text::str is a command.
     Uses Set.__contains__ if to_set is True (which is faster)
+    Router finds handlers with these filters by command name
+    instead of trying them one by one.
     """
+    hint = CommandHint(cmd)
+
     if to_set:
         cmd = set(cmd)
 
     return Filter(
         lambda update: isinstance(update.text, str)
         and any(update.text.startswith(prefix) for prefix in prefixes)
-        and (update.text.split(maxsplit=1)[0][1:].split("@", maxsplit=1)[0])
-        in cmd,
+        and command_of(update) in cmd,
         event_builder=NewMessage,
+        pure=True,
+        hint=hint,
     )
 
 
+# global inline flags (e.g. "(?i)") are allowed only at the start of pattern,
+# leading ones are in `Pattern.flags` already, so they're moved to bucket flags
+_leading_flags = re.compile(r"^(?:\(\?[aiLmsux]+\))+")
+_global_flags = re.compile(r"\(\?[aiLmsux]+\)")
+# references to groups (backreferences and conditional groups)
+# can't survive renumbering of groups in a combined pattern
+_group_reference = re.compile(r"\\\d|\(\?P=|\(\?\(")
+
+
+def _combinable(rex: Pattern[str], /) -> Optional[str]:
+    """Get pattern to combine with patterns of the same flags if it can be."""
+    if rex.groupindex or rex.flags & re.VERBOSE:
+        return None
+
+    pattern = _leading_flags.sub("", rex.pattern)
+    if _global_flags.search(pattern) or _group_reference.search(pattern):
+        return None
+    return pattern
+
+
+class PatternSelector(Selector):
+    """
+    Matches message text once against all patterns of the segment.
+    Patterns are combined into optional lookaheads with named groups,
+    so a single `match` call tells every pattern that matches.
+    Patterns that can't be combined are matched one by one.
+    """
+
+    __slots__ = "combined", "standalone"
+
+    def __init__(self, hinted: Sequence[Tuple[Route, "PatternHint"]]):
+        by_pattern: Dict[Pattern[str], List[Route]] = {}
+        for route, hint in hinted:
+            by_pattern.setdefault(hint.pattern, []).append(route)
+
+        buckets: Dict[int, Dict[str, Tuple[Pattern[str], str]]] = {}
+        self.standalone: List[Tuple[Pattern[str], Tuple[Route, ...]]] = []
+        self.combined: List[
+            Tuple[Pattern[str], Dict[str, Tuple[Route, ...]]]
+        ] = []
+
+        for rex, routes in by_pattern.items():
+            pattern = _combinable(rex)
+            if pattern is None:
+                self.standalone.append((rex, tuple(routes)))
+            else:
+                bucket = buckets.setdefault(rex.flags, {})
+                bucket[f"_p{len(bucket)}"] = rex, pattern
+
+        for flags, patterns in buckets.items():
+            try:
+                combined = re.compile(
+                    "".join(
+                        f"(?:(?=(?P<{name}>{pattern})))?"
+                        for name, (_, pattern) in patterns.items()
+                    ),
+                    flags,
+                )
+            except re.error:
+                # anything missed above can't break the whole index
+                self.standalone.extend(
+                    (rex, tuple(by_pattern[rex]))
+                    for rex, _ in patterns.values()
+                )
+                continue
+
+            self.combined.append(
+                (
+                    combined,
+                    {
+                        name: tuple(by_pattern[rex])
+                        for name, (rex, _) in patterns.items()
+                    },
+                )
+            )
+
+    async def select(self, event: Any, /) -> Iterable[Sequence[Route]]:
+        text = getattr(event, "raw_text", None)
+        if not isinstance(text, str):
+            return ()
+
+        found: List[Sequence[Route]] = []
+        for combined, routes in self.combined:
+            groups = combined.match(text).groupdict()  # always matches
+            found.extend(
+                routes[name]
+                for name, value in groups.items()
+                if value is not None
+            )
+
+        for rex, routes_ in self.standalone:
+            if rex.match(text):
+                found.append(routes_)
+
+        return found
+
+
+class PatternHint(Hint):
+    """Match filter passes only if its pattern matches."""
+
+    __slots__ = ("pattern",)
+
+    # matching is more expensive than looking a command up
+    cost = 1
+
+    def __init__(self, pattern: Pattern[str]):
+        self.pattern = pattern
+
+    @classmethod
+    def selector(cls, hinted, /) -> PatternSelector:
+        return PatternSelector(hinted)
+
+
 def match(expression: str, flags: int = 0, /) -> Filter[NewMessage.Event]:
     """
     Check if Some.raw_text::str does match a pattern.
+    Match object is set to `garnet.ctx::MatchCtx` when filter passes.
+    Router matches text against all patterns of its handlers at once.
     """
     rex = re.compile(expression, flags=flags)
 
+    def matches(update: Any) -> bool:
+        found = reuse(rex, update, lambda: rex.match(update.raw_text))
+        if found:
+            MatchCtx.set(found)
+            return True
+        return False
+
     return Filter(
-        lambda update: bool(rex.match(update.raw_text)),
-        event_builder=NewMessage,
+        matches, event_builder=NewMessage, hint=PatternHint(rex),
     )
 
 
@@ -85,7 +262,9 @@ def exact(text: str, /) -> Filter[NewMessage.Event]:
     Check if Some.raw_text::str is equal to text.
     """
     return Filter(
-        lambda update: update.raw_text == text, event_builder=NewMessage,
+        lambda update: update.raw_text == text,
+        event_builder=NewMessage,
+        pure=True,
     )
 
 
@@ -110,9 +289,183 @@ def between(*texts: str, to_set: bool = True) -> Filter:
         texts = set(texts)
 
     return Filter(
-        lambda update: update.raw_text in texts, event_builder=NewMessage,
+        lambda update: update.raw_text in texts,
+        event_builder=NewMessage,
+        pure=True,
+    )
+
+
+class _Automaton:
+    """Aho-Corasick automaton over normalized terms."""
+
+    __slots__ = "goto", "fail", "out", "lengths"
+
+    def __init__(self, keys: Sequence[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+
+        for index, key in enumerate(keys):
+            state = 0
+            for char in key:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    out.append([])
+                state = next_state
+            if key:
+                out[state].append(index)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                out[next_state].extend(out[fail[next_state]])
+
+        self.goto = goto
+        self.fail = fail
+        self.out = [tuple(indexes) for indexes in out]
+        self.lengths = tuple(len(key) for key in keys)
+
+    def search(self, text: str, whole_words: bool) -> List[int]:
+        """Get indexes of found keys in order of their first occurrence."""
+        goto, fail, out = self.goto, self.fail, self.out
+        found: Dict[int, None] = {}
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for index in out[state]:
+                if whole_words:
+                    before = position - self.lengths[index]
+                    after = position + 1
+                    if (before >= 0 and text[before].isalnum()) or (
+                        after < len(text) and text[after].isalnum()
+                    ):
+                        continue
+                found[index] = None
+
+        return list(found)
+
+
+class Keywords:
+    """
+    Set of keywords (phrases) searched in Some.raw_text::str in one pass
+    regardless of the number of phrases.
+
+    Usage::
+
+        >>> from garnet.filters import text
+        >>> banned = text.Keywords(["spam", "buy now"], whole_words=True)
+        >>>
+        >>> @router.message(banned.filter())
+        ... async def moderate(event):
+        ...     found = ctx.KeywordsCtx.get()  # ("buy now", )
+        >>>
+        >>> await banned.rebuild(load_banned_phrases())  # in a thread
+    """
+
+    __slots__ = (
+        "ignore_case",
+        "normalization",
+        "whole_words",
+        "_terms",
+        "_automaton",
     )
 
+    def __init__(
+        self,
+        terms: Iterable[str] = (),
+        *,
+        ignore_case: bool = True,
+        normalization: Optional[str] = "NFKC",
+        whole_words: bool = False,
+    ) -> None:
+        """
+        :param terms: phrases to search for
+        :param ignore_case: compare case-folded text
+        :param normalization: unicode normalization form (or None)
+        applied to both phrases and text
+        :param whole_words: found phrase should not be a part of a word
+        """
+        self.ignore_case = ignore_case
+        self.normalization = normalization
+        self.whole_words = whole_words
+        self._terms, self._automaton = self._build(terms)
+
+    def normalize(self, text: str, /) -> str:
+        if self.normalization is not None:
+            text = unicodedata.normalize(self.normalization, text)
+        if self.ignore_case:
+            text = text.casefold()
+        return text
+
+    def _build(
+        self, terms: Iterable[str]
+    ) -> Tuple[Tuple[str, ...], _Automaton]:
+        terms = tuple(terms)
+        return terms, _Automaton([self.normalize(term) for term in terms])
+
+    async def rebuild(self, terms: Iterable[str]) -> None:
+        """
+        Replace phrases, automaton is built in a thread
+        and swapped when it's ready, searches use the old one until then.
+        """
+        self._terms, self._automaton = await to_thread(
+            functools.partial(self._build, terms)
+        )
+
+    def find(self, text: str, /) -> Tuple[str, ...]:
+        """Get phrases found in text in order of their first occurrence."""
+        terms, automaton = self._terms, self._automaton
+        found = automaton.search(self.normalize(text), self.whole_words)
+        return tuple(terms[index] for index in found)
+
+    def filter(self) -> Filter[NewMessage.Event]:
+        """
+        Get filter which passes if any phrase is found in Some.raw_text::str,
+        found phrases are set to `garnet.ctx::KeywordsCtx`.
+        """
+
+        def func(update: Any) -> bool:
+            text = update.raw_text
+            found = self.find(text) if isinstance(text, str) else ()
+            if found:
+                KeywordsCtx.set(found)
+                return True
+            return False
+
+        return Filter(func, event_builder=NewMessage)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+def keywords(
+    *terms: str,
+    ignore_case: bool = True,
+    normalization: Optional[str] = "NFKC",
+    whole_words: bool = False,
+) -> Filter[NewMessage.Event]:
+    """
+    Check if any of phrases is in Some.raw_text::str, see `Keywords`.
+    """
+    return Keywords(
+        terms,
+        ignore_case=ignore_case,
+        normalization=normalization,
+        whole_words=whole_words,
+    ).filter()
+
 
 def can_be_int(base: int = 10) -> Filter:
     """
@@ -125,6 +478,7 @@ def can_be_int(base: int = 10) -> Filter:
             functools.partial(func, event.raw_text), ValueError,
         ),
         event_builder=NewMessage,
+        pure=True,
     )
 
 
@@ -137,6 +491,7 @@ def can_be_float() -> Filter:
             functools.partial(float, event.raw_text), ValueError,
         ),
         event_builder=NewMessage,
+        pure=True,
     )
 
 
@@ -0,0 +1,49 @@
+from typing import Any, Optional, Tuple
+
+from telethon.tl import types
+from telethon.utils import get_peer_id
+
+_PEERS = (types.PeerUser, types.PeerChat, types.PeerChannel)
+_MESSAGES = (types.Message, types.MessageService)
+
+
+def _int_attr(update: Any, name: str, /) -> Optional[int]:
+    value = getattr(update, name, None)
+    return value if isinstance(value, int) else None
+
+
+def peers_of(update: Any, /) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Get chat and user IDs of raw update without building events.
+    IDs are "marked" the same way as `event.chat_id` and `event.sender_id`,
+    `None` stands for unknown ID.
+    """
+    message = getattr(update, "message", None)
+    if isinstance(message, _MESSAGES):
+        chat_id = get_peer_id(message.peer_id)
+        user_id = None
+        if message.from_id is not None:
+            user_id = get_peer_id(message.from_id)
+        elif isinstance(message.peer_id, types.PeerUser):
+            user_id = chat_id
+        return chat_id, user_id
+
+    chat_id = None
+    if isinstance(peer := getattr(update, "peer", None), _PEERS):
+        chat_id = get_peer_id(peer)
+    elif (channel_id := _int_attr(update, "channel_id")) is not None:
+        chat_id = get_peer_id(types.PeerChannel(channel_id))
+    elif (raw_chat_id := _int_attr(update, "chat_id")) is not None:
+        chat_id = get_peer_id(types.PeerChat(raw_chat_id))
+
+    user_id = _int_attr(update, "user_id")
+    if user_id is None:
+        user_id = _int_attr(update, "from_id")
+
+    if chat_id is None and isinstance(update, types.UpdateShortMessage):
+        chat_id = user_id
+
+    return chat_id, user_id
+
+
+__all__ = ("peers_of",)
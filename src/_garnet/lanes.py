@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import itertools
+from typing import TYPE_CHECKING, Any, Deque, Dict, Mapping, Tuple, Type
+
+from telethon.events.common import EventBuilder
+
+import _garnet.patched_events as pe
+from _garnet.events.raw import raw_updates_of
+
+if TYPE_CHECKING:
+    from _garnet.events.router import Router
+
+# arguments telethon passes to `TelegramClient._dispatch_update`
+UpdateArgsT = Tuple[Any, ...]
+
+DEFAULT_PRIORITIES: Mapping[Type[EventBuilder], int] = {
+    pe.CallbackQuery: 1,
+    pe.InlineQuery: 1,
+}
+
+
+class PriorityLanes:
+    """
+    Queue of updates waiting to be dispatched with a lane per priority,
+    updates of higher lanes are dispatched first.
+    Replaces telethon's queue of sequentially dispatched updates.
+
+    To keep lower lanes moving, every `burst`-th update is taken
+    from the lane with the longest waiting update instead.
+
+    Priority of raw update is the highest priority of event builders
+    which can build events from it (see `raw_updates_of`),
+    updates no prioritized event builder can be built from get `default`.
+
+    Usage::
+
+        >>> from garnet.runner import run, PriorityLanes
+        >>>
+        >>> lanes = PriorityLanes({events.CallbackQuery: 1}, burst=4)
+        >>> await run(router, storage, lanes=lanes)
+    """
+
+    __slots__ = (
+        "priorities",
+        "default",
+        "burst",
+        "_by_type",
+        "_lanes",
+        "_order",
+        "_sequence",
+        "_took",
+        "_size",
+    )
+
+    def __init__(
+        self,
+        priorities: Mapping[Type[EventBuilder], int] = DEFAULT_PRIORITIES,
+        *,
+        default: int = 0,
+        burst: int = 8,
+    ):
+        """
+        :param priorities: event builder to priority mapping
+        :param default: priority of other updates
+        :param burst: every `burst`-th update is the longest waiting one
+        """
+        if burst < 1:
+            raise ValueError("`burst` must be positive")
+
+        self.priorities: Dict[Type[EventBuilder], int] = dict(priorities)
+        self.default = default
+        self.burst = burst
+
+        self._by_type: Dict[type, int] = {}
+        self._lanes: Dict[int, Deque[Tuple[int, UpdateArgsT]]] = {}
+        # lanes from the highest priority
+        self._order: Tuple[Deque[Tuple[int, UpdateArgsT]], ...] = ()
+        self._sequence = itertools.count()
+        self._took = 0
+        self._size = 0
+        self._compile()
+
+    def __repr__(self) -> str:
+        priorities = {
+            builder.__name__: priority
+            for builder, priority in self.priorities.items()
+        }
+        return (
+            f"{self.__class__.__name__}({priorities!r}, "
+            f"default={self.default}, burst={self.burst})"
+        )
+
+    def _compile(self) -> None:
+        by_type: Dict[type, int] = {}
+        for builder, priority in self.priorities.items():
+            for raw_type in raw_updates_of(builder) or ():
+                by_type[raw_type] = max(
+                    priority, by_type.get(raw_type, priority)
+                )
+
+        self._by_type = by_type
+        for priority in {self.default, *by_type.values()}:
+            self._lanes.setdefault(priority, collections.deque())
+        self._order = tuple(
+            self._lanes[priority]
+            for priority in sorted(self._lanes, reverse=True)
+        )
+
+    def include(self, router: "Router", /) -> None:
+        """
+        Prioritize event builders of handlers of routers
+        with `priority` set (the router and its children).
+
+        Lane is chosen by raw update type before any router is notified,
+        so router priority is per event builder, not per router:
+        e.g. a router with priority and a `NewMessage` handler moves
+        all new messages into its lane. The highest priority wins.
+        """
+        if router.priority is not None:
+            for handler in router._handlers:
+                builder = handler.__event_builder__
+                self.priorities[builder] = max(
+                    router.priority,
+                    self.priorities.get(builder, router.priority),
+                )
+
+        for child in router.children:
+            self.include(child)
+
+        self._compile()
+
+    def priority_of(self, update: Any, /) -> int:
+        return self._by_type.get(type(update), self.default)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return not self._size
+
+    def put_nowait(self, args: UpdateArgsT, /) -> None:
+        self._lanes[self.priority_of(args[0])].append(
+            (next(self._sequence), args)
+        )
+        self._size += 1
+
+    def get_nowait(self) -> UpdateArgsT:
+        if not self._size:
+            raise asyncio.QueueEmpty
+
+        self._took += 1
+        if self._took % self.burst:
+            lane = next(lane for lane in self._order if lane)
+        else:
+            lane = min(
+                (lane for lane in self._order if lane),
+                key=lambda waiting: waiting[0][0],
+            )
+
+        self._size -= 1
+        return lane.popleft()[1]
+
+
+__all__ = (
+    "DEFAULT_PRIORITIES",
+    "PriorityLanes",
+)
@@ -0,0 +1,250 @@
+import asyncio
+import collections
+import functools
+import inspect
+import time
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Counter,
+    FrozenSet,
+    Iterable,
+    Optional,
+    Type,
+)
+
+from telethon.client.updates import EventBuilderDict
+from telethon.events.common import EventBuilder
+
+import _garnet.patched_events as pe
+from _garnet.events.raw import raw_updates_of
+from _garnet.executors import DispatchHookT
+from _garnet.loggers import events, runtime
+
+if TYPE_CHECKING:
+    from _garnet.client import TelegramClient
+
+ShedHookT = Callable[[EventBuilderDict, "TelegramClient", str], Any]
+RespondT = Callable[[EventBuilderDict, "TelegramClient"], Awaitable[Any]]
+
+# reasons update was shed for
+LOW_PRIORITY = "low_priority"
+STALE = "stale"
+RESPONDED = "responded"
+
+
+def update_age(update: Any, /) -> Optional[float]:
+    """Seconds since update was sent, `None` if update has no date."""
+    date = getattr(getattr(update, "message", None), "date", None)
+    if date is None:
+        date = getattr(update, "date", None)
+
+    if not isinstance(date, datetime):
+        return None
+
+    return time.time() - date.timestamp()
+
+
+def answer_queries(text: str, /, *, alert: bool = False) -> RespondT:
+    """
+    Make canned response which answers callback and inline queries
+    with `text` (those must be answered anyway) and ignores other updates.
+    """
+
+    async def respond(built: EventBuilderDict, _: "TelegramClient") -> None:
+        if query := built[pe.CallbackQuery]:
+            await query.answer(text, alert=alert)
+        elif inline_query := built[pe.InlineQuery]:
+            await inline_query.answer(
+                [], switch_pm=text, switch_pm_param="busy",
+            )
+
+    return respond
+
+
+class OverloadController:
+    """
+    Sheds updates in front of router while runtime is overloaded,
+    i.e. too many updates are waiting to be dispatched
+    or event loop is lagging.
+
+    Policy (applied only while overloaded, in order):
+        - updates of `shed` event builders are dropped
+        - updates older than `max_age` seconds are dropped
+        - the rest are answered with `respond` and dropped, if it's set
+
+    Every shed update is passed to `on_shed(built, client, reason)`.
+
+    Usage::
+
+        >>> from garnet.runner import run, OverloadController, answer_queries
+        >>>
+        >>> overload = OverloadController(
+        ...     max_queue=500,
+        ...     shed=(events.UserUpdate, events.MessageRead),
+        ...     max_age=30,
+        ...     respond=answer_queries("Too busy, try again later"),
+        ... )
+        >>> await run(router, storage, overload=overload)
+        >>> overload.shed  # Counter of shed updates per reason
+    """
+
+    __slots__ = (
+        "max_queue",
+        "max_lag",
+        "max_age",
+        "respond",
+        "on_shed",
+        "interval",
+        "lag",
+        "shed",
+        "_depth",
+        "_shed_types",
+        "_shed_builders",
+        "_monitor",
+    )
+
+    def __init__(
+        self,
+        *,
+        max_queue: Optional[int] = 1000,
+        max_lag: Optional[float] = 0.5,
+        max_age: Optional[float] = None,
+        shed: Iterable[Type[EventBuilder]] = (),
+        respond: Optional[RespondT] = None,
+        on_shed: Optional[ShedHookT] = None,
+        interval: float = 0.25,
+    ):
+        """
+        :param max_queue: overloaded if more updates wait to be dispatched
+        :param max_lag: overloaded if event loop lags more seconds
+        :param max_age: seconds after which update is stale
+        :param shed: low priority event builders
+        :param respond: canned response, see `answer_queries`
+        :param on_shed: hook called with every shed update and reason
+        :param interval: seconds between event loop lag measurements
+        """
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.max_age = max_age
+        self.respond = respond
+        self.on_shed = on_shed
+        self.interval = interval
+        # event loop lag in seconds
+        self.lag = 0.0
+        # number of shed updates per reason
+        self.shed: Counter[str] = collections.Counter()
+
+        self._depth: Callable[[], int] = lambda: 0
+        self._shed_builders = tuple(shed)
+        self._shed_types: FrozenSet[type] = frozenset(
+            raw_type
+            for builder in self._shed_builders
+            for raw_type in raw_updates_of(builder) or ()
+        )
+        self._monitor: "Optional[asyncio.Task[None]]" = None
+
+    def __repr__(self) -> str:
+        shed = [builder.__name__ for builder in self._shed_builders]
+        return (
+            f"{self.__class__.__name__}(max_queue={self.max_queue}, "
+            f"max_lag={self.max_lag}, max_age={self.max_age}, shed={shed})"
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of updates waiting to be dispatched."""
+        return self._depth()
+
+    @property
+    def overloaded(self) -> bool:
+        return (self.max_queue is not None and self.depth > self.max_queue) or (
+            self.max_lag is not None and self.lag > self.max_lag
+        )
+
+    def watch(self, depth: Callable[[], int], /) -> None:
+        """Set function which tells the number of waiting updates."""
+        self._depth = depth
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            # spikes fade out over a few intervals instead of at once
+            self.lag = max(loop.time() - expected, self.lag / 2)
+
+    async def start(self) -> None:
+        if self.max_lag is not None:
+            self._monitor = asyncio.create_task(
+                self._measure_lag(), name="garnet loop lag monitor"
+            )
+
+    async def close(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+
+    def reason_to_shed(self, built: EventBuilderDict, /) -> Optional[str]:
+        """Get reason to shed update, `None` if it should be dispatched."""
+        if not self.overloaded:
+            return None
+
+        if type(built.update) in self._shed_types:
+            return LOW_PRIORITY
+
+        if self.max_age is not None:
+            age = update_age(built.update)
+            if age is not None and age > self.max_age:
+                return STALE
+
+        if self.respond is not None:
+            return RESPONDED
+
+        return None
+
+    async def _shed(
+        self, built: EventBuilderDict, client: "TelegramClient", reason: str,
+    ) -> None:
+        self.shed[reason] += 1
+        events.debug(f"Shedding update ({reason}), {self.depth} waiting")
+
+        try:
+            if reason == RESPONDED and self.respond is not None:
+                await self.respond(built, client)
+
+            if self.on_shed is not None:
+                result = self.on_shed(built, client, reason)
+                if inspect.isawaitable(result):
+                    await result
+        except Exception:
+            runtime.exception("Error while shedding update")
+
+    def wrap(self, dispatch: DispatchHookT, /) -> DispatchHookT:
+        """Put controller in front of dispatch hook (e.g. `Router.notify`)."""
+
+        @functools.wraps(dispatch)
+        async def controlled(
+            built: EventBuilderDict, client: "TelegramClient",
+        ) -> None:
+            reason = self.reason_to_shed(built)
+            if reason is None:
+                await dispatch(built, client)
+            else:
+                await self._shed(built, client, reason)
+
+        return controlled
+
+
+__all__ = (
+    "OverloadController",
+    "answer_queries",
+    "update_age",
+    "LOW_PRIORITY",
+    "STALE",
+    "RESPONDED",
+)
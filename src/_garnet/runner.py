@@ -3,11 +3,38 @@ import functools
 import logging
 import sys
 from os import getenv
-from typing import Any, Awaitable, Callable, NoReturn, Optional, TypedDict
-
-from _garnet.client import GarnetConfig, TelegramClient
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    FrozenSet,
+    List,
+    NoReturn,
+    Optional,
+    TypedDict,
+)
+
+from _garnet.client import GarnetConfig, TelegramClient, dispatch_tracked
+from _garnet.concurrency import TaskTracker
+from _garnet.dedup import UpdateDeduplicator
+from _garnet.events.raw import subscribed_updates
 from _garnet.events.router import Router
+from _garnet.executors import (
+    DispatchExecutor,
+    DispatchHookT,
+    KeyedExecutor,
+    shutdown,
+)
+from _garnet.lanes import PriorityLanes
 from _garnet.loggers import runtime
+from _garnet.overload import OverloadController
+from _garnet.shards import (
+    ExecutorFactoryT,
+    RouterFactoryT,
+    ShardedExecutor,
+    StorageFactoryT,
+    default_shards,
+)
 from _garnet.storages.base import BaseStorage
 
 
@@ -35,12 +62,117 @@ def default_conf_maker() -> RuntimeConfig:
     )
 
 
+def _make_bot(
+    conf_maker: Callable[[], RuntimeConfig],
+    print_: Optional[Callable[..., None]],
+) -> TelegramClient:
+    runtime_cfg = conf_maker()
+
+    if not isinstance(runtime_cfg["session_dsn"], str):
+        raise ValueError  # todo
+
+    bot = TelegramClient(
+        session=runtime_cfg["session_dsn"],
+        api_id=int(runtime_cfg["app_id"]),
+        api_hash=runtime_cfg["app_hash"],
+    )
+
+    if callable(print_):
+        app_id = runtime_cfg["app_id"]
+        app_hash = runtime_cfg["app_hash"]
+        app_hash = app_hash[:8] + ("*" * (len(app_hash) - 8))
+        bot_token = runtime_cfg["bot_token"]
+        bot_token = bot_token[:8] + ("*" * (len(bot_token) - 8))
+        session_dsn = runtime_cfg["session_dsn"]
+        session_dsn = session_dsn[:4] + ("*" * (len(session_dsn) - 4))
+
+        print_(
+            "=" * 16,
+            "🔧 Using config(",
+            f"    {app_id=},",
+            f"    {app_hash=},",
+            f"    {bot_token=},",
+            f"    {session_dsn=},",
+            ")",
+        )
+
+    return bot
+
+
+def _configure(
+    bot: TelegramClient,
+    dispatch_hook: DispatchHookT,
+    dont_wait_for_handler: bool,
+    executor: Optional[DispatchExecutor],
+    dedup: Optional[UpdateDeduplicator],
+    lanes: Optional[PriorityLanes],
+    subscribed: Optional[FrozenSet[type]],
+    print_: Optional[Callable[..., None]],
+) -> TaskTracker:
+    # updates are dispatched with it (see `dispatch_tracked`),
+    # so after filter actions and so on are tracked too
+    tasks = TaskTracker()
+
+    if executor is not None or lanes is not None:
+        # executor does backpressure and lanes order updates,
+        # so updates are read sequentially
+        dont_wait_for_handler = False
+
+    bot.__garnet_config__ = GarnetConfig(
+        dont_wait_for_handler=dont_wait_for_handler,
+        dispatch_hook=dispatch_hook,
+        executor=executor,
+        tasks=tasks,
+        dedup=dedup,
+        subscribed=subscribed,
+    )
+
+    if dont_wait_for_handler:
+        bot._updates_queue = set()
+        bot._dispatching_updates_queue = None
+    else:
+        bot._updates_queue = asyncio.Queue() if lanes is None else lanes
+        bot._dispatching_updates_queue = asyncio.Event()
+
+    if callable(print_):
+        print_(f"☄️ Propagate events chaotically: {dont_wait_for_handler}",)
+        if executor is not None:
+            print_(f"👷 Dispatch executor: {executor!r}")
+        if dedup is not None:
+            print_(f"🔁 Dropping duplicate updates: {dedup!r}")
+        if lanes is not None:
+            print_(f"🚦 Priority lanes: {lanes!r}")
+        if subscribed is not None:
+            names = sorted(raw_type.__name__ for raw_type in subscribed)
+            print_(f"📭 Dropping updates other than: {', '.join(names)}")
+
+    return tasks
+
+
+def _queue_depth(
+    bot: TelegramClient, executor: Optional[DispatchExecutor],
+) -> Callable[[], int]:
+    def depth() -> int:
+        queue = bot._updates_queue
+        waiting = queue.qsize() if hasattr(queue, "qsize") else len(queue)
+        if executor is not None:
+            waiting += executor.queued
+        return waiting
+
+    return depth
+
+
 async def run(
     router: Router,
     storage: BaseStorage[Any],
     bot: Optional[TelegramClient] = None,
     conf_maker: Callable[[], RuntimeConfig] = default_conf_maker,
     dont_wait_for_handler: bool = False,
+    executor: Optional[DispatchExecutor] = None,
+    drain_timeout: float = 30.0,
+    dedup: Optional[UpdateDeduplicator] = None,
+    lanes: Optional[PriorityLanes] = None,
+    overload: Optional[OverloadController] = None,
     print_: Optional[Callable[..., None]] = functools.partial(print, sep="\n"),
 ) -> NoReturn:
     """
@@ -53,63 +185,138 @@ async def run(
         sequentially, otherwise will schedule a task to an event loop
         immediately and wait to the next bunch. It also syncs with
         TelegramClient's sequential_updates flag
+        - ``executor`` if passed, updates are submitted to it instead
+        (e.g. ``WorkerPool`` to bound number of concurrently handled updates),
+        ``dont_wait_for_handler`` is ignored then
+        - ``drain_timeout`` on exit new updates are dropped and in-flight ones
+        are given that many seconds to be handled before storage is closed
+        - ``dedup`` if passed, updates received twice (e.g. after reconnect)
+        are dropped before events are built
+        - updates no handler of the router is subscribed to (e.g. typing or
+        read receipts) are dropped before events are built, unless there are
+        handlers of event builders with unknown raw updates (e.g. ``Raw``)
+        - ``lanes`` if passed, updates waiting to be dispatched are ordered
+        by priority of their event builders (and routers with ``priority``),
+        updates are read sequentially then
+        - ``overload`` if passed, updates are shed by its policy in front of
+        the router while too many updates wait or event loop lags
     """
     if bot is None:
-        runtime_cfg = conf_maker()
+        bot = _make_bot(conf_maker, print_)
 
-        if not isinstance(runtime_cfg["session_dsn"], str):
-            raise ValueError  # todo
-
-        bot = TelegramClient(
-            session=runtime_cfg["session_dsn"],
-            api_id=int(runtime_cfg["app_id"]),
-            api_hash=runtime_cfg["app_hash"],
-        )
+    subscribed = subscribed_updates(router.freeze())
+    if lanes is not None:
+        lanes.include(router)
 
+    dispatch_hook: DispatchHookT = functools.partial(router.notify, storage)
+    if overload is not None:
+        dispatch_hook = overload.wrap(dispatch_hook)
+        overload.watch(_queue_depth(bot, executor))
         if callable(print_):
-            app_id = runtime_cfg["app_id"]
-            app_hash = runtime_cfg["app_hash"]
-            app_hash = app_hash[:8] + ("*" * (len(app_hash) - 8))
-            bot_token = runtime_cfg["bot_token"]
-            bot_token = bot_token[:8] + ("*" * (len(bot_token) - 8))
-            session_dsn = runtime_cfg["session_dsn"]
-            session_dsn = session_dsn[:4] + ("*" * (len(session_dsn) - 4))
-
-            print_(
-                "=" * 16,
-                "🔧 Using config(",
-                f"    {app_id=},",
-                f"    {app_hash=},",
-                f"    {bot_token=},",
-                f"    {session_dsn=},",
-                ")",
-            )
-
-    bot.__garnet_config__ = GarnetConfig(
-        dont_wait_for_handler=dont_wait_for_handler,
-        dispatch_hook=functools.partial(router.notify, storage),
+            print_(f"🪫 Shedding updates on overload: {overload!r}")
+
+    tasks = _configure(
+        bot,
+        dispatch_hook,
+        dont_wait_for_handler,
+        executor,
+        dedup,
+        lanes,
+        subscribed,
+        print_,
     )
 
-    if dont_wait_for_handler:
-        bot._updates_queue = set()
-        bot._dispatching_updates_queue = None
-    else:
-        bot._updates_queue = asyncio.Queue()
-        bot._dispatching_updates_queue = asyncio.Event()
-
-    if callable(print_):
-        print_(f"☄️ Propagate events chaotically: {dont_wait_for_handler}",)
-
     try:
         await storage.init()
+        if overload is not None:
+            await overload.start()
+        if executor is not None:
+            await executor.start(dispatch_tracked)
         if not bot.is_connected():
             runtime_cfg = conf_maker()
             await bot.start(bot_token=runtime_cfg["bot_token"],)
         await bot.run_until_disconnected()
     finally:
+        await shutdown(tasks, executor, drain_timeout)
+        if overload is not None:
+            await overload.close()
         await storage.close()
 
 
+async def run_sharded(
+    router_factory: RouterFactoryT,
+    storage_factory: StorageFactoryT,
+    shards: Optional[int] = None,
+    bot: Optional[TelegramClient] = None,
+    conf_maker: Callable[[], RuntimeConfig] = default_conf_maker,
+    executor_factory: ExecutorFactoryT = KeyedExecutor,
+    queue_size: int = 1024,
+    drain_timeout: float = 30.0,
+    dedup: Optional[UpdateDeduplicator] = None,
+    lanes: Optional[PriorityLanes] = None,
+    print_: Optional[Callable[..., None]] = functools.partial(print, sep="\n"),
+) -> NoReturn:
+    """
+    Run a bot with updates handled in ``shards`` processes.
+
+    This process only receives updates and sends them to shard processes
+    (updates of a chat always go to the same shard), each shard runs
+    its own router and storage, made by ``router_factory`` and
+    ``storage_factory``, and dispatches updates with an executor made by
+    ``executor_factory``. Exited shards are restarted.
+
+    Tweaking:
+        - factories must be picklable (e.g. module level functions)
+        - storages of shards must be either shared (e.g. database)
+        or split by chat, since shards don't share memory
+        - ``shards`` is a number of CPUs by default
+        - ``drain_timeout`` on exit updates are sent to shards and shards are
+        given that many seconds to handle them before they are terminated
+        - ``dedup`` the same as for ``run``, duplicates are dropped
+        before they are sent to shards
+        - ``router_factory`` is called in this process too, so updates
+        no handler is subscribed to are not sent to shards
+        - ``lanes`` the same as for ``run``, but only priorities of event
+        builders are used (routers live in shards)
+        - shards are logged in with the bot's auth key and open their own
+        connections with it, Telegram may push some updates to those
+        and such updates are not handled
+    """
+    if bot is None:
+        bot = _make_bot(conf_maker, print_)
+
+    executor = ShardedExecutor(
+        bot,
+        router_factory,
+        storage_factory,
+        shards or default_shards(),
+        executor_factory=executor_factory,
+        queue_size=queue_size,
+    )
+    # routers made in shards are the same, so subscriptions are too
+    subscribed = subscribed_updates(router_factory().freeze())
+    tasks = _configure(
+        bot,
+        executor.submit,
+        False,
+        executor,
+        dedup,
+        lanes,
+        subscribed,
+        print_,
+    )
+
+    try:
+        if not bot.is_connected():
+            runtime_cfg = conf_maker()
+            await bot.start(bot_token=runtime_cfg["bot_token"],)
+        # shards share session of the bot, so it must be authorized first
+        await executor.start(executor.submit)
+        await bot.run_until_disconnected()
+    finally:
+        await shutdown(tasks, executor, drain_timeout)
+
+
 def launch(
     app_name: str = "my-awesome-bot",
     *runs: Awaitable[NoReturn],
@@ -117,13 +324,17 @@ def launch(
 ) -> NoReturn:
     configure_logging(app_name)
     loop = asyncio.new_event_loop()
+    run_tasks: List["asyncio.Future[NoReturn]"] = []
     try:
         runtime.info(f"Starting {app_name}...")
         asyncio.events.set_event_loop(loop)
 
+        run_tasks.extend(
+            asyncio.ensure_future(run_, loop=loop) for run_ in runs
+        )
         done, pending = loop.run_until_complete(
             asyncio.wait(
-                runs,
+                run_tasks,
                 return_when=(
                     asyncio.tasks.FIRST_EXCEPTION
                     if return_on_first_exception
@@ -149,10 +360,22 @@ def launch(
 
     finally:
         try:
+            # runs are stopped first, so they drain in-flight updates
+            # and close storages before the rest of tasks is cancelled
+            runtime.info("Stopping runs")
+            for task in run_tasks:
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*run_tasks, return_exceptions=True)
+            )
+
             runtime.info("Cancelling asyncio tasks")
             cancellable = asyncio.all_tasks(loop)
             for task in cancellable:
                 task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*cancellable, return_exceptions=True)
+            )
 
             loop.run_until_complete(loop.shutdown_asyncgens())
 
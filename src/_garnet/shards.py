@@ -0,0 +1,421 @@
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import time
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Sequence, Tuple
+
+from telethon.client.updates import EventBuilderDict
+from telethon.extensions import BinaryReader
+from telethon.sessions import StringSession
+from telethon.utils import get_peer_id
+
+from _garnet.client import GarnetConfig, TelegramClient, dispatch_tracked
+from _garnet.concurrency import DrainReport, TaskTracker, to_thread
+from _garnet.executors import (
+    DispatchExecutor,
+    DispatchHookT,
+    KeyedExecutor,
+    shutdown,
+)
+from _garnet.helpers.peers import peers_of
+from _garnet.loggers import runtime
+
+if TYPE_CHECKING:
+    from _garnet.events.router import Router
+    from _garnet.storages.base import BaseStorage
+
+RouterFactoryT = Callable[[], "Router"]
+StorageFactoryT = Callable[[], "BaseStorage[Any]"]
+ExecutorFactoryT = Callable[[], DispatchExecutor]
+
+# serialized update, other updates of its container and its entities
+PayloadT = Tuple[bytes, Sequence[bytes], Sequence[bytes]]
+
+# max number of updates sent to a shard at once
+_BATCH_SIZE = 256
+# seconds between checks if shard processes are alive
+_WATCH_INTERVAL = 1.0
+# seconds shard process is given to finish its updates if main process exited
+_DRAIN_TIMEOUT = 30.0
+# seconds shard process is given to stop after draining
+_STOP_GRACE = 5.0
+
+
+def _read(data: bytes, /) -> Any:
+    return BinaryReader(data).tgread_object()
+
+
+def dump_update(built: EventBuilderDict, /) -> PayloadT:
+    """Serialize raw update of `EventBuilderDict` to TL bytes."""
+    update = built.update
+    return (
+        bytes(update),
+        [bytes(other) for other in built.others or ()],
+        [bytes(entity) for entity in update._entities.values()],
+    )
+
+
+def load_update(
+    client: TelegramClient, payload: PayloadT, /,
+) -> EventBuilderDict:
+    """Deserialize payload from `dump_update` into `EventBuilderDict`."""
+    raw_update, raw_others, raw_entities = payload
+
+    update = _read(raw_update)
+    entities = [_read(raw_entity) for raw_entity in raw_entities]
+    update._entities = {get_peer_id(entity): entity for entity in entities}
+    client._entity_cache.add(entities)
+
+    others = [_read(raw_other) for raw_other in raw_others] or None
+    return EventBuilderDict(client, update, others)
+
+
+class _ShardClient(TelegramClient):
+    """
+    Client of a shard process.
+    It's logged in with the auth key of the main client (copied through
+    `StringSession`), but opens its own connection to send requests.
+    Shard receives updates from the main process only, so updates Telegram
+    sends to this connection are used just to fill entity cache
+    and are not dispatched anywhere.
+    """
+
+    def _handle_update(self, update: Any) -> None:
+        self.session.process_entities(update)
+        self._entity_cache.add(update)
+        runtime.debug(
+            f"Shard got {update.__class__.__name__} from Telegram, ignoring it"
+        )
+
+
+async def _serve_shard(
+    number: int,
+    conn: Connection,
+    session: str,
+    api_id: int,
+    api_hash: str,
+    router_factory: RouterFactoryT,
+    storage_factory: StorageFactoryT,
+    executor_factory: ExecutorFactoryT,
+) -> None:
+    router = router_factory()
+    storage = storage_factory()
+    executor = executor_factory()
+
+    tasks = TaskTracker()
+    client = _ShardClient(StringSession(session), api_id, api_hash)
+    client.__garnet_config__ = GarnetConfig(
+        dont_wait_for_handler=False,
+        dispatch_hook=functools.partial(router.notify, storage),
+        executor=None,
+        tasks=tasks,
+        dedup=None,
+        subscribed=None,
+    )
+
+    router.freeze()
+    await storage.init()
+    # main process sends seconds to drain within instead of a batch to stop
+    drain_timeout = _DRAIN_TIMEOUT
+    try:
+        await client.connect()
+        await client.get_me(input_peer=True)
+        await executor.start(dispatch_tracked)
+        runtime.info(f"Shard #{number} is ready")
+
+        while True:
+            try:
+                batch = await to_thread(conn.recv)
+            except EOFError:
+                break
+
+            if not isinstance(batch, list):
+                drain_timeout = batch
+                break
+
+            for payload in batch:
+                await executor.submit(load_update(client, payload), client)
+
+    finally:
+        runtime.info(f"Shard #{number} is stopping")
+        await shutdown(tasks, executor, drain_timeout)
+        await storage.close()
+        await client.disconnect()
+
+
+def _shard_main(number: int, conn: Connection, *args: Any) -> None:
+    """Entry point of a shard process."""
+    try:
+        asyncio.run(_serve_shard(number, conn, *args))
+    except KeyboardInterrupt:
+        pass
+
+
+class _Shard:
+    __slots__ = "number", "queue", "process", "conn", "restarts", "sending"
+
+    def __init__(self, number: int, queue_size: int):
+        self.number = number
+        self.queue: "asyncio.Queue[PayloadT]" = asyncio.Queue(queue_size)
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn: Optional[Connection] = None
+        self.restarts = 0
+        # held while something is written to `conn`, so writes never overlap
+        self.sending = asyncio.Lock()
+
+
+def _sent(lock: asyncio.Lock, sent: "asyncio.Future[None]", /) -> None:
+    lock.release()
+    if not sent.cancelled():
+        # error is raised to sender, unless it was cancelled meanwhile
+        sent.exception()
+
+
+class ShardedExecutor(DispatchExecutor):
+    """
+    Send updates to shard processes, each running its own router and storage.
+    Updates of a chat always go to the same shard.
+    Exited shard processes are restarted by the executor itself.
+
+    Factories are called in shard processes, so they must be picklable
+    (e.g. module level functions).
+
+    Shards share the auth key of `client` (its session is copied to them
+    with `StringSession`), and each shard opens its own connection
+    to Telegram with it to send requests. Telegram may push updates
+    to any connection of the auth key, and updates pushed to shards
+    are not dispatched, so some updates may be lost.
+    """
+
+    __slots__ = (
+        "client",
+        "router_factory",
+        "storage_factory",
+        "executor_factory",
+        "_shards",
+        "_tasks",
+        "_round_robin",
+        "_closing",
+        "_context",
+    )
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        router_factory: RouterFactoryT,
+        storage_factory: StorageFactoryT,
+        shards: int,
+        *,
+        executor_factory: ExecutorFactoryT = KeyedExecutor,
+        queue_size: int = 1024,
+    ):
+        """
+        Must be initialized within running event loop.
+
+        :param client: client receiving updates, its session is shared
+        :param router_factory: router maker, called in each shard
+        :param storage_factory: storage maker, called in each shard
+        :param shards: number of shard processes
+        :param executor_factory: dispatch executor maker, called in each shard
+        :param queue_size: max number of updates waiting to be sent to a shard
+        """
+        if shards < 1:
+            raise ValueError("`shards` must be positive")
+
+        self.client = client
+        self.router_factory = router_factory
+        self.storage_factory = storage_factory
+        self.executor_factory = executor_factory
+
+        self._shards = [_Shard(number, queue_size) for number in range(shards)]
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._round_robin = itertools.cycle(self._shards)
+        self._closing = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(shards={len(self._shards)})"
+
+    @property
+    def queued(self) -> int:
+        return sum(shard.queue.qsize() for shard in self._shards)
+
+    def _spawn_process(self, shard: _Shard, /) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(  # type: ignore
+            target=_shard_main,
+            args=(
+                shard.number,
+                child_conn,
+                StringSession.save(self.client.session),
+                self.client.api_id,
+                self.client.api_hash,
+                self.router_factory,
+                self.storage_factory,
+                self.executor_factory,
+            ),
+            name=f"garnet shard #{shard.number}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        if shard.conn is not None:
+            shard.conn.close()
+        shard.process, shard.conn = process, parent_conn
+
+    def _ensure_alive(self, shard: _Shard, /) -> None:
+        if self._closing or shard.process is None or shard.process.is_alive():
+            return
+
+        shard.restarts += 1
+        runtime.error(
+            f"Shard #{shard.number} exited with {shard.process.exitcode}, "
+            f"restarting ({shard.restarts} restarts)"
+        )
+        self._spawn_process(shard)
+
+    async def _send(self, shard: _Shard, obj: Any, /) -> None:
+        """
+        Write to shard's pipe in a thread, one write at a time.
+        Thread can't be interrupted, so if sender is cancelled
+        the pipe is still busy until the write is done.
+        """
+        await shard.sending.acquire()
+        try:
+            assert shard.conn is not None
+            sent = asyncio.ensure_future(
+                to_thread(functools.partial(shard.conn.send, obj))
+            )
+        except BaseException:
+            shard.sending.release()
+            raise
+
+        sent.add_done_callback(functools.partial(_sent, shard.sending))
+        await asyncio.shield(sent)
+
+    async def _feed(self, shard: _Shard, /) -> None:
+        """Send queued updates to shard process in batches."""
+        while True:
+            batch = [await shard.queue.get()]
+            while len(batch) < _BATCH_SIZE and not shard.queue.empty():
+                batch.append(shard.queue.get_nowait())
+
+            while True:
+                try:
+                    await self._send(shard, batch)
+                    break
+                except (OSError, ValueError):
+                    # batch was not delivered, send it to a new process
+                    await asyncio.sleep(_WATCH_INTERVAL)
+                    self._ensure_alive(shard)
+
+            for _ in batch:
+                shard.queue.task_done()
+
+    async def _watch(self) -> None:
+        """Restart exited shard processes."""
+        while True:
+            await asyncio.sleep(_WATCH_INTERVAL)
+            for shard in self._shards:
+                self._ensure_alive(shard)
+
+    def shard_of(self, built: EventBuilderDict, /) -> _Shard:
+        chat_id, user_id = peers_of(built.update)
+        if chat_id is None:
+            chat_id = user_id
+        if chat_id is None:
+            return next(self._round_robin)
+        return self._shards[chat_id % len(self._shards)]
+
+    async def start(self, dispatch: DispatchHookT, /) -> None:
+        # updates are dispatched by routers of shards, not by `dispatch`
+        for shard in self._shards:
+            self._spawn_process(shard)
+            self._tasks.append(
+                asyncio.create_task(
+                    self._feed(shard), name=f"garnet shard #{shard.number}"
+                )
+            )
+        self._tasks.append(
+            asyncio.create_task(self._watch(), name="garnet shards watch")
+        )
+
+    async def submit(
+        self, built: EventBuilderDict, client: "TelegramClient", /,
+    ) -> None:
+        await self.shard_of(built).queue.put(dump_update(built))
+
+    async def _stop(self, shard: _Shard, timeout: float, /) -> None:
+        if shard.process is None or shard.conn is None:
+            return
+
+        try:
+            # batch being sent (if any) is written first
+            await asyncio.wait_for(
+                self._send(shard, timeout), timeout + _STOP_GRACE
+            )
+        except (OSError, ValueError, asyncio.TimeoutError):
+            pass
+
+        await to_thread(
+            functools.partial(shard.process.join, timeout + _STOP_GRACE)
+        )
+        if shard.process.is_alive():
+            runtime.error(f"Shard #{shard.number} didn't stop, terminating")
+            shard.process.terminate()
+        shard.conn.close()
+
+    async def close(self, timeout: float = 0.0, /) -> DrainReport:
+        """
+        Send queued updates to shards and let shards drain in `timeout`.
+        Report counts updates which were not sent to shards as cancelled,
+        shards report their own drains.
+        """
+        started = time.monotonic()
+        pending = sum(shard.queue.qsize() for shard in self._shards)
+
+        if pending:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        *[shard.queue.join() for shard in self._shards]
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                runtime.error("Not all updates were sent to shards")
+
+        self._closing = True
+        cancelled = sum(shard.queue.qsize() for shard in self._shards)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+        remaining = max(timeout - (time.monotonic() - started), 0.0)
+        await asyncio.gather(
+            *[self._stop(shard, remaining) for shard in self._shards]
+        )
+
+        return DrainReport(
+            pending=pending,
+            finished=pending - cancelled,
+            cancelled=cancelled,
+            elapsed=time.monotonic() - started,
+        )
+
+
+def default_shards() -> int:
+    """Default number of shards, one per CPU."""
+    return multiprocessing.cpu_count()
+
+
+__all__ = (
+    "ShardedExecutor",
+    "dump_update",
+    "load_update",
+    "default_shards",
+)
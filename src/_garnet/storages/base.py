@@ -61,6 +61,13 @@ class BaseStorage(Generic[StorageDataT], abc.ABC):
         await self.reset_state(key=key)
         await self.reset_data(key=key)
 
+    async def delete(self, key: str) -> None:
+        """
+        Forget key, as if neither state nor data was ever set.
+        Storages which can't drop keys just reset them.
+        """
+        await self.reset(key=key)
+
     @abc.abstractmethod
     async def init(self) -> None:
         """First call for storage during garnet runtime"""
@@ -0,0 +1,427 @@
+import asyncio
+import collections
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from _garnet.loggers import runtime
+
+from . import cow
+from .base import BaseStorage
+from .typedef import StorageDataT
+
+# how data of a key was changed since the last flush
+_SET = "set"
+_UPDATE = "update"
+
+# key deleted, state changed, state, data change, data (or update) to write
+_ChangesT = Tuple[bool, bool, Optional[str], Optional[str], Any]
+
+
+class CacheStats(TypedDict):
+    # reads served from cache
+    hits: int
+    # reads passed to wrapped storage
+    misses: int
+    # keys changed and not written yet
+    dirty: int
+    # number of flushes (batches) and keys written by them
+    flushes: int
+    flushed: int
+    # keys failed to be written (they are written by the next flush)
+    errors: int
+    # seconds the last and the longest flush took
+    last_flush_latency: float
+    max_flush_latency: float
+
+
+class _Entry:
+    __slots__ = (
+        "state",
+        "data",
+        "has_state",
+        "has_data",
+        "state_dirty",
+        "data_dirty",
+        "update",
+        "unread",
+        "pinned",
+        "deleted",
+    )
+
+    def __init__(self) -> None:
+        self.state: Optional[str] = None
+        # never changed in place, changes replace it
+        self.data: Optional[Dict[Any, Any]] = None
+        self.has_state = False
+        self.has_data = False
+        self.state_dirty = False
+        self.data_dirty: Optional[str] = None
+        # updates of data to write if it wasn't set since the last flush
+        self.update: Optional[Dict[Any, Any]] = None
+        # updates made before data was read, they may be written already
+        # or not, merging them into read data is right anyway
+        self.unread: Optional[Dict[Any, Any]] = None
+        # number of flushes writing the entry
+        self.pinned = 0
+        # key is deleted before changes made since then are written
+        self.deleted = False
+
+    @property
+    def dirty(self) -> bool:
+        return (
+            self.deleted or self.state_dirty or self.data_dirty is not None
+        )
+
+    def take_changes(self) -> _ChangesT:
+        changes = (
+            self.deleted,
+            self.state_dirty,
+            self.state,
+            self.data_dirty,
+            self.data if self.data_dirty is _SET else self.update,
+        )
+        self.deleted = False
+        self.state_dirty = False
+        self.data_dirty = None
+        self.update = None
+        return changes
+
+    def restore_changes(self, changes: _ChangesT, /) -> None:
+        """Mark changes not written as dirty again, newer ones win."""
+        deleted, state_dirty, _, data_dirty, data = changes
+        if self.deleted:
+            # key was deleted since, changes not written don't matter
+            return
+
+        self.deleted = deleted
+        # state is the newest one anyway
+        self.state_dirty = self.state_dirty or state_dirty
+
+        if data_dirty is None or self.data_dirty is _SET:
+            return
+
+        if data_dirty is _SET:
+            # data was set, so it's loaded and has the newer updates too
+            self.data_dirty = _SET
+            self.update = None
+        elif self.data_dirty is _UPDATE:
+            self.update = {**data, **self.update}  # type: ignore
+        else:
+            self.data_dirty = _UPDATE
+            self.update = data
+
+
+class CachedStorage(BaseStorage[StorageDataT]):
+    """
+    Write-behind cache over another (e.g. remote) storage.
+
+    Reads are served from LRU cache of `max_entries` keys,
+    writes change the cache only and are coalesced per key
+    (only the last state, the last set data or merged updates are written).
+    Changed keys are written to wrapped storage in batches
+    every `flush_interval` seconds or once `max_dirty` keys are changed,
+    the rest are written on close.
+    Changed keys are never evicted before they are written.
+
+    Data is read as copy-on-write views (see `DictStorage`).
+    Use `stats()` to get hit rate, dirty keys and flush latency.
+
+    Usage::
+
+        >>> from garnet.storages import CachedStorage
+        >>>
+        >>> storage = CachedStorage(MyDatabaseStorage(), flush_interval=0.5)
+        >>> await run(router, storage)
+    """
+
+    __slots__ = (
+        "storage",
+        "max_entries",
+        "flush_interval",
+        "max_dirty",
+        "batch_size",
+        "_cache",
+        "_dirty",
+        "_flusher",
+        "_ticker",
+        "_stats",
+    )
+
+    def __init__(
+        self,
+        storage: BaseStorage[StorageDataT],
+        /,
+        *,
+        max_entries: int = 10_000,
+        flush_interval: float = 1.0,
+        max_dirty: int = 1024,
+        batch_size: int = 64,
+    ):
+        """
+        :param storage: wrapped storage
+        :param max_entries: max number of cached keys
+        :param flush_interval: seconds between flushes
+        :param max_dirty: flush earlier once that many keys are changed
+        :param batch_size: number of keys written concurrently
+        """
+        if max_entries < 1 or batch_size < 1:
+            raise ValueError("`max_entries` and `batch_size` must be positive")
+
+        super().__init__(data_factory=storage._data_data_factory)
+        self.storage = storage
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.batch_size = batch_size
+
+        self._cache: "collections.OrderedDict[str, _Entry]" = (
+            collections.OrderedDict()
+        )
+        # changed keys in order of the first change
+        self._dirty: Dict[str, None] = {}
+        self._flusher: "Optional[asyncio.Task[None]]" = None
+        self._ticker: "Optional[asyncio.Task[None]]" = None
+        self._stats = CacheStats(
+            hits=0,
+            misses=0,
+            dirty=0,
+            flushes=0,
+            flushed=0,
+            errors=0,
+            last_flush_latency=0.0,
+            max_flush_latency=0.0,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.storage!r}, "
+            f"max_entries={self.max_entries}, "
+            f"flush_interval={self.flush_interval}, dirty={self.dirty})"
+        )
+
+    @property
+    def dirty(self) -> int:
+        """Number of changed keys not written yet."""
+        return len(self._dirty)
+
+    def stats(self) -> CacheStats:
+        stats = CacheStats(**self._stats)  # type: ignore
+        stats["dirty"] = self.dirty
+        return stats
+
+    def _entry(self, key: str, /) -> _Entry:
+        cache = self._cache
+        if (entry := cache.get(key)) is not None:
+            cache.move_to_end(key)
+            return entry
+
+        entry = cache[key] = _Entry()
+        if len(cache) > self.max_entries:
+            self._shrink(key)
+        return entry
+
+    def _shrink(self, accessed: str, /) -> None:
+        cache = self._cache
+        excess = len(cache) - self.max_entries
+        evicted: List[str] = []
+        for key, entry in cache.items():
+            if len(evicted) == excess:
+                break
+            # changed keys stay until they are written
+            if not entry.dirty and not entry.pinned and key != accessed:
+                evicted.append(key)
+
+        for key in evicted:
+            del cache[key]
+
+        if len(cache) > self.max_entries:
+            self._kick()
+
+    def _changed(self, key: str, /) -> None:
+        self._dirty[key] = None
+        if len(self._dirty) >= self.max_dirty:
+            self._kick()
+
+    async def get_state(self, key: str) -> Optional[str]:
+        entry = self._entry(key)
+        if entry.has_state:
+            self._stats["hits"] += 1
+            return entry.state
+
+        self._stats["misses"] += 1
+        state = await self.storage.get_state(key)
+        # state may be set while it's read
+        if not entry.has_state:
+            entry.state, entry.has_state = state, True
+        return entry.state
+
+    async def set_state(self, key: str, state: Optional[str] = None) -> None:
+        entry = self._entry(key)
+        entry.state, entry.has_state = state, True
+        entry.state_dirty = True
+        self._changed(key)
+
+    async def get_data(self, key: str) -> Optional[StorageDataT]:
+        entry = self._entry(key)
+        if entry.has_data:
+            self._stats["hits"] += 1
+            return cow.copy_on_write(entry.data)  # type: ignore
+
+        self._stats["misses"] += 1
+        data = await self.storage.get_data(key)
+        # data may be set or updated while it's read
+        if not entry.has_data:
+            # views of wrapped storage aren't changed in place like ours
+            loaded = self._data_data_factory() if data is None else data
+            loaded = cow.unwrap(loaded)
+            if entry.unread:
+                loaded = {**loaded, **entry.unread}
+            entry.data, entry.has_data = loaded, True  # type: ignore
+            entry.unread = None
+        return cow.copy_on_write(entry.data)  # type: ignore
+
+    async def set_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        entry = self._entry(key)
+        entry.data = (
+            self._data_data_factory() if data is None else cow.adopt(data)
+        )
+        entry.has_data = True
+        entry.data_dirty = _SET
+        entry.update = entry.unread = None
+        self._changed(key)
+
+    async def update_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        if not data:
+            return
+
+        entry = self._entry(key)
+        update = cow.own(data)
+        if entry.has_data:
+            entry.data = {**entry.data, **update}  # type: ignore
+        else:
+            entry.unread = {**(entry.unread or {}), **update}
+
+        if entry.data_dirty is not _SET:
+            entry.data_dirty = _UPDATE
+            entry.update = {**(entry.update or {}), **update}
+        self._changed(key)
+
+    async def delete(self, key: str) -> None:
+        entry = self._entry(key)
+        entry.state, entry.has_state, entry.state_dirty = None, True, False
+        entry.data, entry.has_data = self._data_data_factory(), True
+        entry.data_dirty = entry.update = entry.unread = None
+        entry.deleted = True
+        self._changed(key)
+
+    async def _write(self, key: str, changes: _ChangesT, /) -> None:
+        deleted, state_dirty, state, data_dirty, data = changes
+        if deleted:
+            await self.storage.delete(key)
+        if state_dirty:
+            await self.storage.set_state(key, state)
+        if data_dirty is _SET:
+            await self.storage.set_data(key, data)
+        elif data_dirty is _UPDATE:
+            await self.storage.update_data(key, data)
+
+    async def _flush_batch(self, keys: List[str], /) -> List[str]:
+        """Write changes of keys and get keys failed to be written."""
+        entries = [self._cache[key] for key in keys]
+        changes = []
+        for key, entry in zip(keys, entries):
+            del self._dirty[key]
+            changes.append(entry.take_changes())
+            entry.pinned += 1
+
+        started = time.monotonic()
+        try:
+            results = await asyncio.gather(
+                *map(self._write, keys, changes), return_exceptions=True
+            )
+        finally:
+            for entry in entries:
+                entry.pinned -= 1
+
+        latency = time.monotonic() - started
+        stats = self._stats
+        stats["flushes"] += 1
+        stats["last_flush_latency"] = latency
+        stats["max_flush_latency"] = max(stats["max_flush_latency"], latency)
+
+        failed: List[str] = []
+        for key, entry, change, result in zip(keys, entries, changes, results):
+            if isinstance(result, BaseException):
+                runtime.error(f"Failed to write {key}: {result!r}")
+                stats["errors"] += 1
+                entry.restore_changes(change)
+                failed.append(key)
+            else:
+                stats["flushed"] += 1
+        return failed
+
+    async def _flush(self) -> None:
+        # keys changed while flushing are written by this flush too,
+        # failed ones are retried by the next flush
+        failed: List[str] = []
+        try:
+            while self._dirty:
+                batch = list(itertools.islice(self._dirty, self.batch_size))
+                failed.extend(await self._flush_batch(batch))
+        except Exception:
+            runtime.exception("Failed to flush cached storage")
+        finally:
+            for key in failed:
+                entry = self._cache.get(key)
+                if entry is not None and entry.dirty:
+                    self._dirty[key] = None
+
+    def _kick(self) -> None:
+        """Start flushing unless it's already running."""
+        # one flush at a time, so older changes never overwrite newer ones
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(
+                self._flush()
+            )
+
+    async def flush(self) -> None:
+        """Write changed keys, ones failed to be written are left dirty."""
+        if self._dirty:
+            self._kick()
+        if self._flusher is not None:
+            await asyncio.shield(self._flusher)
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._dirty:
+                self._kick()
+
+    async def init(self) -> None:
+        await self.storage.init()
+        self._ticker = asyncio.get_running_loop().create_task(self._tick())
+
+    async def close(self) -> None:
+        if self._ticker is not None:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+            self._ticker = None
+
+        await self.flush()
+        if self._dirty:
+            runtime.error(f"{len(self._dirty)} changed keys were not written")
+
+        self._cache.clear()
+        self._dirty.clear()
+        await self.storage.close()
+
+
+__all__ = (
+    "CacheStats",
+    "CachedStorage",
+)
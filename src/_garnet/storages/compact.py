@@ -0,0 +1,233 @@
+import copy
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from . import cow
+from .base import BaseStorage
+from .expiry import Expiry
+from .typedef import StorageDataT
+
+# key of `_default_key_maker` packed into int, other keys are kept as is
+PackedKeyT = Union[int, str]
+
+_OFFSET = 1 << 63
+
+
+def pack_key(key: str, /) -> PackedKeyT:
+    """
+    Pack ``"chat_id:user_id"`` key into int,
+    keys of private chats (``chat_id == user_id``) take the least memory.
+    """
+    chat, separator, user = key.partition(":")
+    if not separator:
+        return key
+
+    try:
+        chat_id, user_id = int(chat), int(user)
+    except ValueError:
+        return key
+
+    if not (
+        -_OFFSET <= chat_id < _OFFSET
+        and -_OFFSET <= user_id < _OFFSET
+        # int() accepts spaces, underscores and leading zeros
+        and f"{chat_id}:{user_id}" == key
+    ):
+        return key
+
+    if chat_id == user_id and chat_id >= 0:
+        return chat_id << 1
+
+    return ((chat_id + _OFFSET) << 65) | ((user_id + _OFFSET) << 1) | 1
+
+
+def unpack_key(packed: PackedKeyT, /) -> str:
+    if isinstance(packed, str):
+        return packed
+
+    if not packed & 1:
+        return f"{packed >> 1}:{packed >> 1}"
+
+    chat_id = (packed >> 65) - _OFFSET
+    user_id = ((packed >> 1) & ((1 << 64) - 1)) - _OFFSET
+    return f"{chat_id}:{user_id}"
+
+
+class CompactStorage(BaseStorage[Dict[Any, Any]]):
+    """
+    In-memory storage for millions of keys, drop-in replacement
+    for DictStorage.
+
+    Keys are packed into ints (see `pack_key`), state names are interned
+    to small int IDs shared by all keys (no object per key),
+    data is allocated only for keys it was set for.
+    Keys without state and data take no memory at all,
+    so reading never allocates anything.
+
+    Records are two flat mappings (packed key to state ID and to data)
+    rather than per-key `__slots__` objects or rows of an `array`:
+    state IDs are small ints shared by the interpreter, so a key with state
+    costs just its packed key and a dict entry (~90 bytes on CPython 3.8,
+    ~140 with a slotted record, ~120 with array rows and index dict).
+
+    Keys are evicted by `expiry` policy if it's passed.
+    """
+
+    __slots__ = (
+        "_data_data_factory",
+        "copy_on_write",
+        "expiry",
+        "_states",
+        "_data",
+        "_state_ids",
+        "_state_names",
+    )
+
+    def __init__(
+        self,
+        data_factory: Callable[[], Dict[Any, Any]] = dict,
+        *,
+        copy_on_write: bool = False,
+        expiry: Optional[Expiry[PackedKeyT]] = None,
+    ) -> None:
+        """
+        :param data_factory: makes data of keys without data
+        :param copy_on_write: see `DictStorage`
+        :param expiry: eviction policy
+        """
+        super().__init__(data_factory=data_factory)
+        self.copy_on_write = copy_on_write
+        self.expiry = expiry
+
+        self._states: Dict[PackedKeyT, int] = {}
+        self._data: Dict[PackedKeyT, Dict[Any, Any]] = {}
+        self._state_ids: Dict[str, int] = {}
+        self._state_names: List[str] = []
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(states={len(self._states)}, "
+            f"data={len(self._data)}, state_names={len(self._state_names)})"
+        )
+
+    def __len__(self) -> int:
+        """Number of keys with state or data."""
+        states = self._states
+        return len(states) + sum(1 for key in self._data if key not in states)
+
+    def _state_id(self, state: str, /) -> int:
+        try:
+            return self._state_ids[state]
+        except KeyError:
+            state_id = self._state_ids[state] = len(self._state_names)
+            self._state_names.append(state)
+            return state_id
+
+    def _track(self, packed: PackedKeyT, /, *, write: bool) -> None:
+        if self.expiry is None:
+            return
+
+        for evicted in self.expiry.track(packed, write=write, create=write):
+            state_id = self._states.pop(evicted, None)
+            data = self._data.pop(evicted, None)
+            self.expiry.notify(
+                unpack_key(evicted),
+                None if state_id is None else self._state_names[state_id],
+                data,
+            )
+
+    def expire(self, key: str, ttl: Optional[float], /) -> None:
+        """Set TTL of key, see `Expiry.expire`."""
+        if self.expiry is None:
+            raise ValueError("Storage has no expiry policy")
+        self.expiry.expire(pack_key(key), ttl)
+
+    def _forget(self, packed: PackedKeyT, /) -> None:
+        if (
+            self.expiry is not None
+            and packed not in self._states
+            and packed not in self._data
+        ):
+            self.expiry.forget(packed)
+
+    async def get_state(self, key: str) -> Optional[str]:
+        packed = pack_key(key)
+        self._track(packed, write=False)
+        state_id = self._states.get(packed)
+        if state_id is None:
+            return None
+        return self._state_names[state_id]
+
+    async def set_state(self, key: str, state: Optional[str] = None) -> None:
+        packed = pack_key(key)
+        self._track(packed, write=True)
+        if state is None:
+            self._states.pop(packed, None)
+            self._forget(packed)
+        else:
+            self._states[packed] = self._state_id(state)
+
+    async def get_data(self, key: str) -> Optional[StorageDataT]:
+        packed = pack_key(key)
+        self._track(packed, write=False)
+        data = self._data.get(packed)
+        if data is None:
+            return self._data_data_factory()  # type: ignore
+        if self.copy_on_write:
+            return cow.copy_on_write(data)  # type: ignore
+        return copy.deepcopy(data)  # type: ignore
+
+    async def set_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        packed = pack_key(key)
+        self._track(packed, write=True)
+        if data is None:
+            self._data.pop(packed, None)
+            self._forget(packed)
+        elif self.copy_on_write:
+            self._data[packed] = cow.adopt(data)
+        else:
+            self._data[packed] = copy.deepcopy(data)  # type: ignore
+
+    async def update_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        if not data:
+            return
+
+        packed = pack_key(key)
+        self._track(packed, write=True)
+        stored = self._data.get(packed)
+        if stored is None:
+            stored = self._data_data_factory()
+        elif self.copy_on_write:
+            # stored data may be viewed, so it's replaced instead of changed
+            stored = {**stored}
+
+        if self.copy_on_write:
+            stored.update(cow.own(data))
+        else:
+            stored.update(data)
+        self._data[packed] = stored
+
+    async def delete(self, key: str) -> None:
+        packed = pack_key(key)
+        self._states.pop(packed, None)
+        self._data.pop(packed, None)
+        self._forget(packed)
+
+    async def init(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        self._states.clear()
+        self._data.clear()
+        if self.expiry is not None:
+            self.expiry.clear()
+
+
+__all__ = (
+    "CompactStorage",
+    "pack_key",
+    "unpack_key",
+)
@@ -0,0 +1,264 @@
+import copy
+import weakref
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    MutableMapping,
+    MutableSequence,
+    Optional,
+    Set,
+    Union,
+    overload,
+)
+
+from _garnet.loggers import runtime
+
+# values of these types can't be changed in place, so they are never copied
+_ATOMIC = (str, int, float, complex, bytes, type(None))
+_UNKNOWN: Any = object()
+# types which made data copied on read, reported once
+_leaked_types: Set[type] = set()
+
+
+def _own(value: Any, /) -> Any:
+    """Get value which can be put into the tree without aliasing."""
+    if isinstance(value, _ATOMIC):
+        return value
+    return copy.deepcopy(value)
+
+
+class _Tree:
+    """
+    Data shared by copy-on-write views of it.
+    Data is either shared with storage (and not changed in place)
+    or a private copy made on the first change.
+    """
+
+    __slots__ = "data", "private", "leaked", "views"
+
+    def __init__(self, data: Dict[Any, Any]):
+        self.data = data
+        self.private = False
+        # objects other than dicts and lists were given out of private copy
+        self.leaked = False
+        # views are unhashable, so they are keyed by id
+        self.views: "weakref.WeakValueDictionary[int, _View]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def materialize(self) -> None:
+        if self.private:
+            return
+
+        memo: Dict[int, Any] = {}
+        self.data = copy.deepcopy(self.data, memo)
+        for view in self.views.values():
+            # views of objects removed from private copy are caller's already
+            view._target = memo.get(id(view._target), view._target)
+        self.private = True
+
+    def adopt(self) -> Dict[Any, Any]:
+        """Hand data over to storage, the next change copies it again."""
+        if self.leaked:
+            return copy.deepcopy(self.data)
+
+        self.private = False
+        return self.data
+
+
+def _wrap(tree: _Tree, value: Any, /) -> Any:
+    if isinstance(value, _ATOMIC):
+        return value
+    if type(value) is dict:
+        return CopyOnWriteDict(tree, value)
+    if type(value) is list:
+        return CopyOnWriteList(tree, value)
+    return _UNKNOWN
+
+
+def _report_leak(value_type: type, /) -> None:
+    if value_type in _leaked_types:
+        return
+
+    _leaked_types.add(value_type)
+    runtime.warning(
+        f"Data with {value_type.__qualname__} values is copied on read, "
+        f"store only dicts, lists and atomic values to read it without copying"
+    )
+
+
+class _View:
+    __slots__ = "_tree", "_target", "__weakref__"
+
+    _target: Any
+
+    def __init__(self, tree: _Tree, target: Any):
+        self._tree = tree
+        self._target = target
+        tree.views[id(self)] = self
+
+    def _write(self) -> None:
+        self._tree.materialize()
+
+    def _read(self, index: Any, /) -> Any:
+        value = _wrap(self._tree, self._target[index])
+        if value is _UNKNOWN:
+            # such objects can be changed in place, so caller gets private one
+            self._tree.materialize()
+            self._tree.leaked = True
+            value = self._target[index]
+            _report_leak(type(value))
+        return value
+
+    def __eq__(self, other: Any) -> bool:
+        return bool(self._target == unwrap(other))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._target!r})"
+
+    def __copy__(self) -> Any:
+        return copy.deepcopy(self._target)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> Any:
+        return copy.deepcopy(self._target, memo)
+
+    def __reduce__(self) -> Any:
+        return copy.deepcopy, (self._target,)
+
+    def copy(self) -> Any:
+        """Get plain (deep) copy of data."""
+        return copy.deepcopy(self._target)
+
+
+class CopyOnWriteDict(_View, MutableMapping[Hashable, Any]):
+    """
+    View of user's data which is copied on the first change,
+    so reading data costs nothing and storage is never changed through it.
+    Nested dicts and lists are views too, assigned values are copied.
+    """
+
+    __slots__ = ()
+
+    _target: Dict[Any, Any]
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._read(key)
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self._write()
+        self._target[key] = _own(value)
+
+    def __delitem__(self, key: Hashable) -> None:
+        self._write()
+        del self._target[key]
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._target
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._target)
+
+    def __len__(self) -> int:
+        return len(self._target)
+
+    __hash__ = None  # type: ignore
+
+
+class CopyOnWriteList(_View, MutableSequence[Any]):
+    """List within `CopyOnWriteDict`."""
+
+    __slots__ = ()
+
+    _target: List[Any]
+
+    @overload
+    def __getitem__(self, index: int) -> Any:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Any]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [
+                self._read(position)
+                for position in range(*index.indices(len(self._target)))
+            ]
+        return self._read(index)
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        self._write()
+        if isinstance(index, slice):
+            self._target[index] = [_own(item) for item in value]
+        else:
+            self._target[index] = _own(value)
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        self._write()
+        del self._target[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        for index in range(len(self._target)):
+            yield self._read(index)
+
+    def __len__(self) -> int:
+        return len(self._target)
+
+    def insert(self, index: int, value: Any) -> None:
+        self._write()
+        self._target.insert(index, _own(value))
+
+    def sort(
+        self,
+        *,
+        key: Optional[Callable[[Any], Any]] = None,
+        reverse: bool = False,
+    ) -> None:
+        self._write()
+        self._target.sort(key=key, reverse=reverse)  # type: ignore
+
+    __hash__ = None  # type: ignore
+
+
+def copy_on_write(data: Any, /) -> Any:
+    """Get copy-on-write view of data, plain dicts only are viewed."""
+    if type(data) is dict:
+        return CopyOnWriteDict(_Tree(data), data)
+    return copy.deepcopy(data)
+
+
+def adopt(data: Any, /) -> Any:
+    """
+    Get data to be stored, changes made through the view are taken
+    without copying (the view copies data again on the next change).
+    """
+    if isinstance(data, CopyOnWriteDict) and data._target is data._tree.data:
+        return data._tree.adopt()
+    return copy.deepcopy(data)
+
+
+def own(data: Any, /) -> Any:
+    """Get values of data which can be stored without aliasing."""
+    return {key: _own(value) for key, value in data.items()}
+
+
+def unwrap(value: Any, /) -> Any:
+    """Get object viewed by copy-on-write view (e.g. to serialize it)."""
+    if isinstance(value, _View):
+        return value._target
+    return value
+
+
+__all__ = (
+    "CopyOnWriteDict",
+    "CopyOnWriteList",
+    "copy_on_write",
+    "adopt",
+    "own",
+    "unwrap",
+)
@@ -1,7 +1,9 @@
 import copy
 from typing import Any, Callable, Dict, Optional, TypedDict
 
+from . import cow
 from .base import BaseStorage
+from .expiry import Expiry
 from .typedef import StorageDataT
 
 
@@ -16,15 +18,44 @@ class DictStorage(BaseStorage[Dict[Any, Any]]):
 
     Not the most persistent storage, therefore
     not recommended for in-production environments.
+
+    Data is deep copied on every read and write by default,
+    with `copy_on_write` data is read as `CopyOnWriteDict` view instead,
+    which copies data only if it's changed.
+    Data with values other than dicts, lists and atomic ones (e.g. sets)
+    is copied as soon as such value is read (it's logged once per type).
+
+    Keys are evicted by `expiry` policy if it's passed.
     """
 
-    __slots__ = ("_data", "_data_data_factory")
+    __slots__ = ("_data", "_data_data_factory", "copy_on_write", "expiry")
 
     def __init__(
-        self, data_factory: Callable[[], Dict[Any, Any]] = dict,
+        self,
+        data_factory: Callable[[], Dict[Any, Any]] = dict,
+        *,
+        copy_on_write: bool = False,
+        expiry: Optional[Expiry[str]] = None,
     ) -> None:
         super().__init__(data_factory=data_factory)
         self._data: Dict[str, _UserStorageMetaData] = {}
+        self.copy_on_write = copy_on_write
+        self.expiry = expiry
+
+    def _track(self, key: str, /, *, write: bool) -> None:
+        if self.expiry is None:
+            return
+
+        # spot is made for every accessed key
+        for evicted in self.expiry.track(key, write=write, create=True):
+            if (spot := self._data.pop(evicted, None)) is not None:
+                self.expiry.notify(evicted, spot["state"], spot["data"])
+
+    def expire(self, key: str, ttl: Optional[float], /) -> None:
+        """Set TTL of key, see `Expiry.expire`."""
+        if self.expiry is None:
+            raise ValueError("Storage has no expiry policy")
+        self.expiry.expire(key, ttl)
 
     def _make_spot_for_key(self, key: str) -> None:
         if key not in self._data:
@@ -33,37 +64,62 @@ class DictStorage(BaseStorage[Dict[Any, Any]]):
             )
 
     async def get_state(self, key: str) -> Optional[str]:
+        self._track(key, write=False)
         self._make_spot_for_key(key)
         return self._data[key]["state"]
 
     async def get_data(self, key: str) -> Optional[StorageDataT]:
+        self._track(key, write=False)
         self._make_spot_for_key(key=key)
+        if self.copy_on_write:
+            return cow.copy_on_write(self._data[key]["data"])  # type: ignore
         return copy.deepcopy(self._data[key]["data"])  # type: ignore
 
     async def update_data(
         self, key: str, data: Optional[StorageDataT] = None
     ) -> None:
+        self._track(key, write=True)
         self._make_spot_for_key(key=key)
+        if self.copy_on_write:
+            # stored data may be viewed, so it's replaced instead of changed
+            spot = self._data[key]
+            spot["data"] = {
+                **spot["data"],  # type: ignore
+                **({} if data is None else cow.own(data)),
+            }
+            return
+
         self._data[key]["data"].update(  # type: ignore
             () if data is None else data
         )
 
     async def set_state(self, key: str, state: Optional[str] = None) -> None:
+        self._track(key, write=True)
         self._make_spot_for_key(key=key)
         self._data[key]["state"] = state
 
     async def set_data(
         self, key: str, data: Optional[StorageDataT] = None
     ) -> None:
+        self._track(key, write=True)
         self._make_spot_for_key(key=key)
         if data is None:
             data = self._data_data_factory()
+        elif self.copy_on_write:
+            data = cow.adopt(data)
         else:
             data = copy.deepcopy(data)
         self._data[key]["data"] = data  # type: ignore
 
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+        if self.expiry is not None:
+            self.expiry.forget(key)
+
     async def init(self) -> None:
         pass
 
     async def close(self) -> None:
         self._data.clear()
+        if self.expiry is not None:
+            self.expiry.clear()
@@ -0,0 +1,287 @@
+import collections
+import heapq
+import inspect
+import itertools
+import math
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from _garnet.concurrency import spawn
+from _garnet.loggers import runtime
+
+from .base import BaseStorage
+from .typedef import StorageDataT
+
+K = TypeVar("K", bound=Hashable)
+EvictHookT = Callable[[str, Optional[str], Optional[Any]], Any]
+
+
+class Expiry(Generic[K]):
+    """
+    Expiry policy and bookkeeping of storage keys.
+
+    Keys not written (or read, if `touch_on_read`) for `ttl` seconds
+    and the least recently used keys over `max_entries` are evicted,
+    state and data of evicted keys are passed to `on_evict` hook
+    (async hooks are run as tasks), e.g. to archive them.
+
+    Deadlines are kept in a heap with lazy deletion, so only due keys
+    are touched, keys are kept in LRU order for `max_entries`.
+    Due keys are evicted by the next storage call.
+
+    Usage::
+
+        >>> from garnet.storages import DictStorage, Expiry, ExpiringStorage
+        >>>
+        >>> storage = DictStorage(expiry=Expiry(ttl=24 * 60 * 60))
+        >>> storage = ExpiringStorage(
+        ...     JSONStorage("states.json"), Expiry(max_entries=10 ** 6)
+        ... )
+    """
+
+    __slots__ = (
+        "ttl",
+        "max_entries",
+        "touch_on_read",
+        "on_evict",
+        "evicted",
+        "_deadlines",
+        "_ttls",
+        "_heap",
+        "_sequence",
+    )
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        *,
+        max_entries: Optional[int] = None,
+        touch_on_read: bool = True,
+        on_evict: Optional[EvictHookT] = None,
+    ):
+        """
+        :param ttl: seconds key lives since the last access
+        :param max_entries: max number of keys
+        :param touch_on_read: reads reset TTL too, otherwise writes only
+        :param on_evict: hook called with key, state and data of evicted key
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("`max_entries` must be positive")
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.touch_on_read = touch_on_read
+        self.on_evict = on_evict
+        # number of evicted keys
+        self.evicted = 0
+
+        # keys from the least recently used one
+        self._deadlines: "collections.OrderedDict[K, float]" = (
+            collections.OrderedDict()
+        )
+        # TTL of keys which don't use the default one
+        self._ttls: Dict[K, Optional[float]] = {}
+        self._heap: List[Tuple[float, int, K]] = []
+        self._sequence = itertools.count()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(ttl={self.ttl}, "
+            f"max_entries={self.max_entries}, "
+            f"touch_on_read={self.touch_on_read}, keys={len(self)})"
+        )
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._deadlines
+
+    def _refresh(self, key: K, now: float, /) -> None:
+        ttl = self._ttls.get(key, self.ttl)
+        deadline = math.inf if ttl is None else now + ttl
+
+        self._deadlines[key] = deadline
+        self._deadlines.move_to_end(key)
+
+        if ttl is not None:
+            heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+            # outdated deadlines are left in the heap until they are due
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._heap = [
+            (deadline, next(self._sequence), key)
+            for key, deadline in self._deadlines.items()
+            if deadline != math.inf
+        ]
+        heapq.heapify(self._heap)
+
+    def _drop(self, key: K, /) -> None:
+        self._ttls.pop(key, None)
+        self.evicted += 1
+
+    def track(self, key: K, /, *, write: bool, create: bool) -> List[K]:
+        """
+        Register access to key and get keys to evict,
+        expired ones are due before the access.
+
+        :param write: access changes key
+        :param create: access makes key if there's none (e.g. reads don't)
+        """
+        now = time.monotonic()
+        heap, deadlines = self._heap, self._deadlines
+        evicted: List[K] = []
+
+        while heap and heap[0][0] <= now:
+            deadline, _, expired = heapq.heappop(heap)
+            if deadlines.get(expired) == deadline:
+                del deadlines[expired]
+                self._drop(expired)
+                evicted.append(expired)
+
+        if key in deadlines:
+            if write or self.touch_on_read:
+                self._refresh(key, now)
+        elif create:
+            self._refresh(key, now)
+
+        if self.max_entries is not None:
+            while len(deadlines) > self.max_entries:
+                least_used, _ = deadlines.popitem(last=False)
+                self._drop(least_used)
+                evicted.append(least_used)
+
+        return evicted
+
+    def expire(self, key: K, ttl: Optional[float], /) -> None:
+        """Set TTL of key (`None` for the default one) and reset it."""
+        if ttl is None or ttl == self.ttl:
+            self._ttls.pop(key, None)
+        else:
+            self._ttls[key] = ttl
+
+        if key in self._deadlines:
+            self._refresh(key, time.monotonic())
+
+    def forget(self, key: K, /) -> None:
+        """Stop tracking key which has nothing stored anymore."""
+        self._deadlines.pop(key, None)
+        self._ttls.pop(key, None)
+
+    def clear(self) -> None:
+        self._deadlines.clear()
+        self._ttls.clear()
+        self._heap.clear()
+
+    def notify(self, key: str, state: Optional[str], data: Any, /) -> None:
+        """Pass evicted key to `on_evict` hook."""
+        if self.on_evict is None:
+            return
+
+        try:
+            result = self.on_evict(key, state, data)
+        except Exception:
+            runtime.exception(f"Error while evicting {key}")
+            return
+
+        if inspect.isawaitable(result):
+            spawn(_logged(result, key), name=f"evicting {key}")
+
+
+async def _logged(result: Awaitable[Any], key: str, /) -> None:
+    try:
+        await result
+    except Exception:
+        runtime.exception(f"Error while evicting {key}")
+
+
+class ExpiringStorage(BaseStorage[StorageDataT]):
+    """
+    Storage wrapper evicting keys of any storage by `Expiry` policy,
+    evicted keys are deleted from the wrapped storage
+    (storages which can't drop keys reset them, see `BaseStorage.delete`).
+    Only keys accessed through the wrapper since `init` are tracked.
+    """
+
+    __slots__ = ("storage", "expiry")
+
+    def __init__(
+        self, storage: BaseStorage[StorageDataT], expiry: Expiry[str], /,
+    ):
+        super().__init__(data_factory=storage._data_data_factory)
+        self.storage = storage
+        self.expiry = expiry
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.storage!r}, {self.expiry!r})"
+
+    async def _track(self, key: str, /, *, write: bool) -> None:
+        # reads of wrapped storage may make keys too
+        await self._evict(self.expiry.track(key, write=write, create=True))
+
+    async def _evict(self, keys: Iterable[str], /) -> None:
+        for key in keys:
+            if self.expiry.on_evict is not None:
+                self.expiry.notify(
+                    key,
+                    await self.storage.get_state(key),
+                    await self.storage.get_data(key),
+                )
+            await self.storage.delete(key)
+
+    def expire(self, key: str, ttl: Optional[float], /) -> None:
+        """Set TTL of key, see `Expiry.expire`."""
+        self.expiry.expire(key, ttl)
+
+    async def get_state(self, key: str) -> Optional[str]:
+        await self._track(key, write=False)
+        return await self.storage.get_state(key)
+
+    async def set_state(self, key: str, state: Optional[str] = None) -> None:
+        await self._track(key, write=True)
+        await self.storage.set_state(key, state)
+
+    async def get_data(self, key: str) -> Optional[StorageDataT]:
+        await self._track(key, write=False)
+        return await self.storage.get_data(key)
+
+    async def set_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        await self._track(key, write=True)
+        await self.storage.set_data(key, data)
+
+    async def update_data(self, key: str, data: StorageDataT) -> None:
+        await self._track(key, write=True)
+        await self.storage.update_data(key, data)
+
+    async def delete(self, key: str) -> None:
+        self.expiry.forget(key)
+        await self.storage.delete(key)
+
+    async def init(self) -> None:
+        await self.storage.init()
+
+    async def close(self) -> None:
+        self.expiry.clear()
+        await self.storage.close()
+
+
+__all__ = (
+    "Expiry",
+    "ExpiringStorage",
+)
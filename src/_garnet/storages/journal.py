@@ -0,0 +1,379 @@
+import asyncio
+import enum
+import functools
+import json
+import os
+import pathlib
+import shutil
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from _garnet.concurrency import to_thread
+from _garnet.loggers import runtime
+
+from .cow import unwrap
+from .dict import DictStorage, _UserStorageMetaData
+from .json import _create_json_file
+from .typedef import StorageDataT
+
+_SET_STATE = "s"
+_SET_DATA = "d"
+_UPDATE_DATA = "u"
+_DELETE = "x"
+
+_SnapshotT = Dict[str, _UserStorageMetaData]
+# encoded record and future of the writer waiting for it to be on disk
+_PendingT = Tuple[bytes, "Optional[asyncio.Future[None]]"]
+
+
+class Fsync(enum.Enum):
+    """When journal records are written and flushed to disk."""
+
+    # every record is flushed on its own, writer waits for it
+    ALWAYS = "always"
+    # records of concurrent writers are flushed together, writers wait for it
+    BATCH = "batch"
+    # records are flushed every `interval` seconds, writers don't wait
+    PERIODIC = "periodic"
+
+
+def _encode(op: str, key: str, value: Any) -> bytes:
+    record = json.dumps(
+        [op, key, value],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=unwrap,
+    )
+    return record.encode("utf-8") + b"\n"
+
+
+def _apply(
+    snapshot: _SnapshotT, record: Any, data_factory: Callable[[], Any],
+) -> None:
+    op, key, value = record
+    if op == _DELETE:
+        snapshot.pop(key, None)
+        return
+
+    if (spot := snapshot.get(key)) is None:
+        spot = snapshot[key] = _UserStorageMetaData(
+            state=None, data=data_factory(),
+        )
+
+    if op == _SET_STATE:
+        spot["state"] = value
+    elif op == _SET_DATA:
+        spot["data"] = data_factory() if value is None else value
+    elif op == _UPDATE_DATA:
+        spot["data"].update(value)  # type: ignore
+    else:
+        raise ValueError(f"Unknown journal record {op!r}")
+
+
+def _replay(
+    snapshot: _SnapshotT,
+    path: pathlib.Path,
+    data_factory: Callable[[], Any],
+) -> int:
+    """
+    Apply records of journal to snapshot
+    and return offset of the end of the last complete record.
+    """
+    if not path.exists():
+        return 0
+
+    end = 0
+    with path.open("rb") as fp:
+        for number, line in enumerate(fp, 1):
+            if not line.endswith(b"\n"):
+                # the last record is torn by a crash
+                runtime.warning(f"Ignoring incomplete record of {path}")
+                break
+
+            end += len(line)
+            try:
+                _apply(snapshot, json.loads(line), data_factory)
+            except (ValueError, TypeError, AttributeError):
+                runtime.warning(f"Skipping broken record {number} of {path}")
+
+    return end
+
+
+def _load_snapshot(path: pathlib.Path) -> _SnapshotT:
+    _create_json_file(path)
+    with path.open("r", encoding="utf-8") as fp:
+        snapshot: _SnapshotT = json.load(fp)
+        return snapshot
+
+
+def _dump_snapshot(snapshot: _SnapshotT, path: pathlib.Path) -> None:
+    temporary = path.with_name(path.name + ".tmp")
+    with temporary.open("w", encoding="utf-8") as fp:
+        json.dump(snapshot, fp, ensure_ascii=False)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temporary, path)
+
+
+class JournalStorage(DictStorage):
+    """
+    JSON file storage based on DictStorage which doesn't lose changes
+    on crash and doesn't dump everything on close.
+
+    Every `set_state`, `set_data`, `update_data` and `delete` is appended
+    as a JSON line to journal file (``<path>.journal``) which is replayed
+    over snapshot (``<path>``, the same format as ``JSONStorage`` file) on init.
+    Once journal grows over `compact_at` bytes it's rotated and merged
+    into snapshot in a thread, writers are not blocked by that.
+    If merging fails, the rotated journal is kept and the next rotation
+    appends to it, so merging is retried once per `compact_at` bytes.
+
+    Usage::
+
+        >>> from garnet.storages import JournalStorage, Fsync
+        >>>
+        >>> storage = JournalStorage("states.json", fsync=Fsync.PERIODIC)
+        >>> await run(router, storage)
+    """
+
+    __slots__ = (
+        "fsync",
+        "interval",
+        "max_pending",
+        "compact_at",
+        "_path",
+        "_journal_path",
+        "_rotated_path",
+        "_journal",
+        "_journal_size",
+        "_pending",
+        "_timer",
+        "_flusher",
+        "_compaction",
+        "_closed",
+    )
+
+    def __init__(
+        self,
+        path: Union[pathlib.Path, str],
+        *,
+        fsync: Fsync = Fsync.BATCH,
+        interval: float = 1.0,
+        max_pending: int = 1024,
+        compact_at: int = 16 * 1024 * 1024,
+        copy_on_write: bool = False,
+    ):
+        """
+        :param path: snapshot file path
+        :param fsync: when records are flushed to disk
+        :param interval: seconds between flushes with `Fsync.PERIODIC`
+        :param max_pending: `Fsync.PERIODIC` flushes earlier
+            once that many records are pending
+        :param compact_at: journal size in bytes to compact it at
+        :param copy_on_write: see `DictStorage`
+        """
+        super().__init__(copy_on_write=copy_on_write)
+        self.fsync = fsync
+        self.interval = interval
+        self.max_pending = max_pending
+        self.compact_at = compact_at
+
+        self._path = pathlib.Path(path)
+        self._journal_path = self._path.with_name(self._path.name + ".journal")
+        self._rotated_path = self._journal_path.with_name(
+            self._journal_path.name + ".1"
+        )
+        self._journal: Optional[BinaryIO] = None
+        self._journal_size = 0
+        self._pending: List[_PendingT] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flusher: "Optional[asyncio.Task[None]]" = None
+        self._compaction: "Optional[asyncio.Task[None]]" = None
+        self._closed = False
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({str(self._path)!r}, "
+            f"fsync={self.fsync}, compact_at={self.compact_at})"
+        )
+
+    async def init(self) -> None:
+        def _open() -> Tuple[_SnapshotT, BinaryIO, int]:
+            snapshot = _load_snapshot(self._path)
+            # journal rotated before the last compaction was done
+            _replay(snapshot, self._rotated_path, self._data_data_factory)
+            end = _replay(snapshot, self._journal_path, self._data_data_factory)
+
+            journal = self._journal_path.open("ab")
+            journal.truncate(end)
+            return snapshot, journal, end
+
+        self._data, self._journal, self._journal_size = await to_thread(_open)
+        self._closed = False
+
+        return await super().init()
+
+    async def _write(self, record: bytes, /) -> None:
+        if self.fsync is Fsync.PERIODIC:
+            if not self._pending:
+                self._timer = asyncio.get_running_loop().call_later(
+                    self.interval, self._kick
+                )
+            self._pending.append((record, None))
+            if len(self._pending) >= self.max_pending:
+                self._kick()
+            return
+
+        written = asyncio.get_running_loop().create_future()
+        self._pending.append((record, written))
+        self._kick()
+        # one writer being cancelled doesn't affect the others
+        await asyncio.shield(written)
+
+    def _kick(self) -> None:
+        """Start flushing pending records unless it's already running."""
+        if self._closed:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(
+                self._flush()
+            )
+
+    def _append(self, chunk: bytes, /) -> None:
+        assert self._journal is not None, "Storage is not initialized"
+        self._journal.write(chunk)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    async def _flush(self) -> None:
+        while self._pending:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self.fsync is Fsync.ALWAYS:
+                flushed, self._pending = self._pending[:1], self._pending[1:]
+            else:
+                flushed, self._pending = self._pending, []
+
+            chunk = b"".join(record for record, _ in flushed)
+            try:
+                await to_thread(functools.partial(self._append, chunk))
+            except Exception as e:
+                if self.fsync is Fsync.PERIODIC:
+                    runtime.exception(f"Failed to write {self._journal_path}")
+                    # retry with the next flush
+                    self._pending[:0] = flushed
+                    self._timer = asyncio.get_running_loop().call_later(
+                        self.interval, self._kick
+                    )
+                    return
+
+                for _, written in flushed:
+                    if written is not None and not written.done():
+                        written.set_exception(e)
+                continue
+
+            self._journal_size += len(chunk)
+            for _, written in flushed:
+                if written is not None and not written.done():
+                    written.set_result(None)
+
+            if self._journal_size >= self.compact_at:
+                await self._rotate()
+
+    async def _rotate(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            return
+
+        def _rotate() -> None:
+            assert self._journal is not None, "Storage is not initialized"
+            self._journal.close()
+            if self._rotated_path.exists():
+                # its compaction failed, so records are merged with it,
+                # replaying them twice after crash gives the same snapshot
+                with self._journal_path.open("rb") as journal:
+                    with self._rotated_path.open("ab") as rotated:
+                        shutil.copyfileobj(journal, rotated)
+                        rotated.flush()
+                        os.fsync(rotated.fileno())
+                os.unlink(self._journal_path)
+            else:
+                os.replace(self._journal_path, self._rotated_path)
+            self._journal = self._journal_path.open("ab")
+
+        await to_thread(_rotate)
+        self._journal_size = 0
+
+        self._compaction = asyncio.get_running_loop().create_task(
+            self._compact()
+        )
+
+    async def _compact(self) -> None:
+        def _merge() -> None:
+            snapshot = _load_snapshot(self._path)
+            _replay(snapshot, self._rotated_path, self._data_data_factory)
+            _dump_snapshot(snapshot, self._path)
+            # replaying it once more after crash gives the same snapshot
+            os.unlink(self._rotated_path)
+
+        try:
+            await to_thread(_merge)
+        except Exception:
+            runtime.exception(f"Failed to compact {self._journal_path}")
+
+    async def set_state(self, key: str, state: Optional[str] = None) -> None:
+        record = _encode(_SET_STATE, key, state)
+        await super().set_state(key, state)
+        await self._write(record)
+
+    async def set_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        record = _encode(_SET_DATA, key, None if data is None else dict(data))
+        await super().set_data(key, data)
+        await self._write(record)
+
+    async def update_data(
+        self, key: str, data: Optional[StorageDataT] = None
+    ) -> None:
+        record = _encode(_UPDATE_DATA, key, {} if data is None else dict(data))
+        await super().update_data(key, data)
+        await self._write(record)
+
+    async def delete(self, key: str) -> None:
+        record = _encode(_DELETE, key, None)
+        await super().delete(key)
+        await self._write(record)
+
+    async def close(self) -> None:
+        if self._pending:
+            self._kick()
+        if self._flusher is not None:
+            await self._flusher
+
+        # failed periodic flush scheduled a retry, it's too late for it
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            runtime.error(
+                f"{len(self._pending)} records were not written "
+                f"to {self._journal_path}"
+            )
+            self._pending.clear()
+
+        if self._compaction is not None:
+            await self._compaction
+
+        if self._journal is not None:
+            await to_thread(self._journal.close)
+            self._journal = None
+
+        return await super().close()
+
+
+__all__ = (
+    "Fsync",
+    "JournalStorage",
+)
@@ -20,8 +20,10 @@ class JSONStorage(DictStorage):
     JSON File storage based on DictStorage
     """
 
-    def __init__(self, path: Union[pathlib.Path, str]):
-        super().__init__()
+    def __init__(
+        self, path: Union[pathlib.Path, str], *, copy_on_write: bool = False,
+    ):
+        super().__init__(copy_on_write=copy_on_write)
         self._path = pathlib.Path(path)
 
     async def init(self) -> None:
@@ -1,5 +1,6 @@
+import asyncio
 import contextvars
-from typing import TYPE_CHECKING, Any, Type
+from typing import TYPE_CHECKING, Any, Optional, Type
 
 if TYPE_CHECKING:
     from _garnet.events.handler import EventHandler
@@ -8,3 +9,23 @@ if TYPE_CHECKING:
 HandlerCtx: "contextvars.ContextVar[Type[EventHandler[Any]]]" = (
     contextvars.ContextVar("handler")
 )
+
+# loop time (see `asyncio.AbstractEventLoop.time`) current handler must end by
+DeadlineCtx: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def time_left() -> Optional[float]:
+    """
+    Seconds left until deadline of current handler,
+    `None` if handler has no timeout.
+
+    Usage::
+
+        >>> async with session.get(url, timeout=time_left()) as response:
+        ...     ...
+    """
+    if (deadline := DeadlineCtx.get()) is None:
+        return None
+    return max(deadline - asyncio.get_running_loop().time(), 0.0)
@@ -0,0 +1,9 @@
+import contextvars
+from typing import Match, Optional, Tuple
+
+MatchCtx: "contextvars.ContextVar[Optional[Match[str]]]" = (
+    contextvars.ContextVar("match", default=None)
+)
+KeywordsCtx: "contextvars.ContextVar[Tuple[str, ...]]" = (
+    contextvars.ContextVar("keywords", default=())
+)
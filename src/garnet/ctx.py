@@ -1,6 +1,18 @@
 from _garnet.vars.fsm import CageCtx, MCtx
-from _garnet.vars.handler import HandlerCtx
+from _garnet.vars.handler import DeadlineCtx, HandlerCtx, time_left
 from _garnet.vars.query import Query
+from _garnet.vars.text import KeywordsCtx, MatchCtx
 from _garnet.vars.user_and_chat import ChatIDCtx, UserIDCtx
 
-__all__ = ("MCtx", "HandlerCtx", "UserIDCtx", "ChatIDCtx", "CageCtx", "Query")
+__all__ = (
+    "MCtx",
+    "HandlerCtx",
+    "DeadlineCtx",
+    "time_left",
+    "UserIDCtx",
+    "ChatIDCtx",
+    "CageCtx",
+    "Query",
+    "MatchCtx",
+    "KeywordsCtx",
+)
@@ -1,7 +1,25 @@
-from _garnet.runner import RuntimeConfig, launch, run
+from _garnet.dedup import UpdateDeduplicator
+from _garnet.executors import (
+    DispatchExecutor,
+    KeyedExecutor,
+    Overflow,
+    WorkerPool,
+)
+from _garnet.lanes import PriorityLanes
+from _garnet.overload import OverloadController, answer_queries
+from _garnet.runner import RuntimeConfig, launch, run, run_sharded
 
 __all__ = (
     "run",
+    "run_sharded",
     "RuntimeConfig",
     "launch",
+    "DispatchExecutor",
+    "WorkerPool",
+    "KeyedExecutor",
+    "Overflow",
+    "UpdateDeduplicator",
+    "PriorityLanes",
+    "OverloadController",
+    "answer_queries",
 )
@@ -1,9 +1,23 @@
 from _garnet.storages.base import BaseStorage
+from _garnet.storages.cached import CachedStorage, CacheStats
+from _garnet.storages.compact import CompactStorage
+from _garnet.storages.cow import CopyOnWriteDict, CopyOnWriteList
 from _garnet.storages.dict import DictStorage
+from _garnet.storages.expiry import ExpiringStorage, Expiry
+from _garnet.storages.journal import Fsync, JournalStorage
 from _garnet.storages.json import JSONStorage
 
 __all__ = (
     "BaseStorage",
     "JSONStorage",
     "DictStorage",
+    "JournalStorage",
+    "CompactStorage",
+    "ExpiringStorage",
+    "CachedStorage",
+    "CacheStats",
+    "Expiry",
+    "CopyOnWriteDict",
+    "CopyOnWriteList",
+    "Fsync",
 )
@@ -0,0 +1,119 @@
+import asyncio
+from typing import Any, Callable, Coroutine, Dict, List, Type
+
+from telethon.events.common import EventBuilder
+from telethon.tl import types
+from telethon.tl.custom.chatgetter import ChatGetter
+from telethon.tl.custom.sendergetter import SenderGetter
+
+from _garnet.events.index import _walk
+from _garnet.events.router import Router, check_filter
+from _garnet.helpers.ctx import ContextInstanceMixin
+from _garnet.patched_events import NewMessage
+from _garnet.storages.base import BaseStorage
+
+
+class FakeEvent(ChatGetter, SenderGetter, ContextInstanceMixin):
+    """Event with text sent by user to private chat."""
+
+    def __init__(self, text: str = "", chat: int = 1, user: int = 1):
+        ChatGetter.__init__(self, types.PeerUser(chat))
+        SenderGetter.__init__(self, user)
+        self.text = self.raw_text = text
+
+
+class FakeBuilt:
+    """Events built for an update, see `EventBuilderDict`."""
+
+    def __init__(self, events: Dict[Type[EventBuilder], Any]):
+        self.events = events
+        self.update = None
+
+    def __getitem__(self, builder: Type[EventBuilder]) -> Any:
+        return self.events.get(builder)
+
+
+class FakeClient(ContextInstanceMixin):
+    pass
+
+
+def message(text: str, chat: int = 1, user: int = 1) -> FakeBuilt:
+    return FakeBuilt({NewMessage: FakeEvent(text, chat, user)})
+
+
+def run(coro: Coroutine[Any, Any, Any], /) -> Any:
+    return asyncio.run(coro)
+
+
+async def settle() -> None:
+    """Let spawned actions run."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def notify_linear(
+    root: Router, storage: BaseStorage, built: FakeBuilt, /,
+) -> None:
+    """Reference dispatch trying every handler of the tree in order."""
+    client = FakeClient()
+    for router in _walk(root):
+        if not await router._notify_filters(built):
+            continue
+
+        for handler in router._handlers:
+            event = built[handler.__event_builder__]
+            if not event:
+                continue
+
+            with router._contexvars_context(storage, event, client):
+                for filter_with_action in handler.filters:
+                    if not await check_filter(built, filter_with_action):
+                        break
+                else:
+                    await handler(event)
+                    return
+
+
+class Recorder:
+    """Log of handlers and actions called, in order."""
+
+    def __init__(self) -> None:
+        self.log: List[Any] = []
+
+    def handler(self, name: Any) -> Callable[[Any], Any]:
+        async def handle(event: Any) -> None:
+            self.log.append(name)
+
+        handle.__name__ = f"handle_{name}"
+        return handle
+
+    def action(self, name: Any) -> Callable[[Any, Any], Any]:
+        async def act(event: Any, filter_: Any) -> None:
+            self.log.append(("action", name))
+
+        act.__name__ = f"act_{name}"
+        return act
+
+
+async def compare(
+    make_router: Callable[[Recorder], Router],
+    updates: List[Callable[[], FakeBuilt]],
+    make_storage: Callable[[], BaseStorage],
+    /,
+) -> List[Any]:
+    """
+    Dispatch updates through index and linear scan of the same tree,
+    assert they call the same handlers and actions and return the log.
+    """
+    indexed, linear = Recorder(), Recorder()
+    indexed_router, linear_router = make_router(indexed), make_router(linear)
+    indexed_storage, linear_storage = make_storage(), make_storage()
+
+    for update in updates:
+        await indexed_router.notify(indexed_storage, update(), FakeClient())
+        await settle()
+        await notify_linear(linear_router, linear_storage, update())
+        await settle()
+
+    assert indexed.log == linear.log
+    return indexed.log
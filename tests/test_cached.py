@@ -0,0 +1,69 @@
+from fakes import run
+
+from _garnet.storages.cached import CachedStorage
+from _garnet.storages.dict import DictStorage
+
+
+class ClosedStorage(DictStorage):
+    """Storage remembering what it had when it was closed."""
+
+    __slots__ = ("closed_with",)
+
+    async def close(self):
+        self.closed_with = {
+            key: dict(spot) for key, spot in self._data.items()
+        }
+        await super().close()
+
+
+class FailingStorage(DictStorage):
+    __slots__ = ("failures",)
+
+    async def set_state(self, key, state=None):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("storage is unavailable")
+        await super().set_state(key, state)
+
+
+def test_changes_are_flushed_on_close():
+    async def main():
+        inner = ClosedStorage()
+        storage = CachedStorage(inner, flush_interval=60)
+        await storage.init()
+        await storage.set_state("1:1", "menu")
+        await storage.update_data("1:1", {"a": 1})
+        await storage.update_data("1:1", {"b": 2})
+        await storage.set_data("2:2", {"c": 3})
+        # nothing is written before flush
+        assert inner._data == {}
+        await storage.close()
+        return inner.closed_with
+
+    assert run(main()) == {
+        "1:1": {"state": "menu", "data": {"a": 1, "b": 2}},
+        "2:2": {"state": None, "data": {"c": 3}},
+    }
+
+
+def test_failed_writes_are_retried_with_newer_changes():
+    async def main():
+        inner = FailingStorage()
+        inner.failures = 1
+        storage = CachedStorage(inner, flush_interval=60)
+        await storage.init()
+        await storage.set_state("1:1", "menu")
+        await storage.update_data("1:1", {"a": 1})
+        await storage.flush()
+        assert storage.stats()["errors"] == 1
+        assert storage.dirty == 1
+
+        await storage.update_data("1:1", {"b": 2})
+        await storage.flush()
+        written = dict(inner._data)
+        await storage.close()
+        return written
+
+    assert run(main()) == {
+        "1:1": {"state": "menu", "data": {"a": 1, "b": 2}},
+    }
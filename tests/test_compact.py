@@ -0,0 +1,80 @@
+import tracemalloc
+
+from fakes import run
+
+from _garnet.storages.compact import CompactStorage, pack_key, unpack_key
+from _garnet.storages.dict import DictStorage
+
+KEYS = [f"{1_000_000 + n}:{1_000_000 + n}" for n in range(10_000)] + [
+    f"-100{1_000_000 + n}:{n}" for n in range(10_000)
+]
+
+
+class Record:
+    """Per-key record layout the storage is measured against."""
+
+    __slots__ = "state", "data"
+
+    def __init__(self, state: int):
+        self.state = state
+        self.data = None
+
+
+def bytes_per_key(fill):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = fill()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return used / len(KEYS)
+
+
+def with_states(storage):
+    async def fill():
+        for key in KEYS:
+            await storage.set_state(key, "menu")
+        return storage
+
+    return run(fill())
+
+
+def test_keys_are_packed_losslessly():
+    for key in KEYS + ["1:2", "01:1", "1: 1", "abc", f"{1 << 63}:1"]:
+        assert unpack_key(pack_key(key)) == key
+
+
+def test_states_take_less_memory_than_records():
+    compact = bytes_per_key(lambda: with_states(CompactStorage()))
+    records = bytes_per_key(
+        lambda: {pack_key(key): Record(0) for key in KEYS}
+    )
+    plain = bytes_per_key(lambda: with_states(DictStorage()))
+
+    assert compact < records
+    assert compact < plain
+
+
+def test_compact_storage_reads_like_dict_storage():
+    async def main():
+        results = []
+        for storage in (CompactStorage(), DictStorage()):
+            await storage.set_state("1:2", "menu")
+            await storage.update_data("1:2", {"a": 1})
+            await storage.update_data("3:3", {"b": 2})
+            await storage.set_state("3:3", None)
+            results.append(
+                [
+                    await storage.get_state("1:2"),
+                    await storage.get_data("1:2"),
+                    await storage.get_state("3:3"),
+                    await storage.get_data("3:3"),
+                    await storage.get_data("4:4"),
+                ]
+            )
+        return results
+
+    compact, plain = run(main())
+    assert compact == plain
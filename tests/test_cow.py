@@ -0,0 +1,69 @@
+import logging
+
+from fakes import run
+
+from _garnet.storages import cow
+from _garnet.storages.dict import DictStorage
+
+
+def stored(storage, key="1:1"):
+    return storage._data[key]["data"]
+
+
+def test_views_are_isolated_from_storage_and_each_other():
+    async def main():
+        storage = DictStorage(copy_on_write=True)
+        await storage.set_data("1:1", {"tags": ["a"], "profile": {"age": 1}})
+
+        first = await storage.get_data("1:1")
+        second = await storage.get_data("1:1")
+        # reading doesn't copy
+        assert first._target is stored(storage)
+
+        first["tags"].append("b")
+        first["profile"]["age"] = 2
+        assert stored(storage) == {"tags": ["a"], "profile": {"age": 1}}
+        assert second == {"tags": ["a"], "profile": {"age": 1}}
+        assert first == {"tags": ["a", "b"], "profile": {"age": 2}}
+
+        await storage.set_data("1:1", first)
+        first["tags"].append("c")
+        return stored(storage)
+
+    assert run(main()) == {"tags": ["a", "b"], "profile": {"age": 2}}
+
+
+def test_assigned_values_are_copied():
+    async def main():
+        storage = DictStorage(copy_on_write=True)
+        await storage.set_data("1:1", {})
+        tags = ["a"]
+
+        view = await storage.get_data("1:1")
+        view["tags"] = tags
+        await storage.set_data("1:1", view)
+        tags.append("b")
+        return stored(storage)
+
+    assert run(main()) == {"tags": ["a"]}
+
+
+def test_unknown_values_are_copied_and_reported(caplog):
+    class Tags(set):
+        pass
+
+    async def main():
+        storage = DictStorage(copy_on_write=True)
+        await storage.set_data("1:1", {"tags": Tags({"a"})})
+
+        for _ in range(2):
+            view = await storage.get_data("1:1")
+            view["tags"].add("b")
+        return stored(storage)
+
+    with caplog.at_level(logging.WARNING, logger="garnet.runtime"):
+        assert run(main()) == {"tags": {"a"}}
+
+    leaks = [r for r in caplog.records if "Tags" in r.getMessage()]
+    assert len(leaks) == 1
+    assert Tags in cow._leaked_types
@@ -0,0 +1,94 @@
+import datetime
+
+from telethon.tl import types
+
+from _garnet import dedup as dedup_module
+from _garnet.dedup import UpdateDeduplicator
+
+DATE = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def new_message(message_id, user_id=1, pts=1):
+    return types.UpdateNewMessage(
+        message=types.Message(
+            id=message_id,
+            peer_id=types.PeerUser(user_id),
+            date=DATE,
+            message="hi",
+        ),
+        pts=pts,
+        pts_count=1,
+    )
+
+
+def short_message(message_id, user_id=1, pts=1):
+    return types.UpdateShortMessage(
+        id=message_id,
+        user_id=user_id,
+        message="hi",
+        pts=pts,
+        pts_count=1,
+        date=DATE,
+    )
+
+
+def edited(message_id, edit_date):
+    return types.UpdateEditMessage(
+        message=types.Message(
+            id=message_id,
+            peer_id=types.PeerUser(1),
+            date=DATE,
+            message="hi",
+            edit_date=edit_date,
+        ),
+        pts=1,
+        pts_count=1,
+    )
+
+
+def test_short_and_full_update_of_a_message_are_duplicates():
+    dedup = UpdateDeduplicator()
+    assert not dedup.seen(short_message(1))
+    # the same message received again through difference
+    assert dedup.seen(new_message(1, pts=2))
+    assert not dedup.seen(new_message(2))
+    assert not dedup.seen(new_message(1, user_id=2))
+    assert (dedup.hits, dedup.misses) == (1, 3)
+
+
+def test_each_edit_is_seen_once():
+    dedup = UpdateDeduplicator()
+    later = DATE + datetime.timedelta(seconds=1)
+    assert not dedup.seen(edited(1, DATE))
+    assert dedup.seen(edited(1, DATE))
+    assert not dedup.seen(edited(1, later))
+
+
+def test_unknown_updates_are_never_duplicates():
+    dedup = UpdateDeduplicator()
+    assert not dedup.seen(types.UpdateConfig())
+    assert not dedup.seen(types.UpdateConfig())
+    assert dedup.unkeyed == 2
+
+
+def test_keys_survive_table_growth():
+    dedup = UpdateDeduplicator(initial_capacity=2)
+    for message_id in range(1, 1000):
+        assert not dedup.seen(new_message(message_id))
+    assert all(dedup.seen(new_message(n)) for n in range(1, 1000))
+    assert len(dedup) == 999
+
+
+def test_keys_are_forgotten_out_of_window(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(dedup_module.time, "monotonic", lambda: now[0])
+
+    dedup = UpdateDeduplicator(window=60, generations=2)
+    assert not dedup.seen(new_message(1))
+    now[0] = 59
+    assert dedup.seen(new_message(1))
+    # key is remembered until the generation after its one is out of window
+    now[0] = 118
+    assert dedup.seen(new_message(1))
+    now[0] = 119
+    assert not dedup.seen(new_message(1))
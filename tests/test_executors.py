@@ -0,0 +1,332 @@
+import asyncio
+
+import pytest
+from fakes import FakeBuilt, FakeClient, message, run
+
+from _garnet.client import GarnetConfig, dispatch_tracked
+from _garnet.concurrency import TaskTracker, spawn
+from _garnet.executors import KeyedExecutor, Overflow, WorkerPool
+from garnet.events import NewMessage
+
+
+def cancelling_dispatch(log):
+    async def dispatch(built, client):
+        if built.events:
+            log.append("cancelled")
+            # e.g. handler's own `wait_for` timed out
+            raise asyncio.CancelledError
+        log.append("handled")
+
+    return dispatch
+
+
+def test_worker_survives_handler_cancelled_error():
+    async def main():
+        log = []
+        pool = WorkerPool(1, 8)
+        await pool.start(cancelling_dispatch(log))
+
+        await pool.submit(message("/start"), None)
+        await pool.submit(FakeBuilt({}), None)
+        await asyncio.wait_for(pool._queue.join(), 1)
+
+        assert not pool._tasks[0].done()
+        await pool.close()
+        return log
+
+    assert run(main()) == ["cancelled", "handled"]
+
+
+def test_lane_survives_handler_cancelled_error():
+    async def main():
+        log = []
+        executor = KeyedExecutor()
+        await executor.start(cancelling_dispatch(log))
+
+        # both updates are of the same user
+        executor.key_of = lambda built: "1:1"
+
+        await executor.submit(message("/start"), None)
+        await executor.submit(FakeBuilt({}), None)
+        report = await executor.close(1)
+        return log, report
+
+    log, report = run(main())
+    assert log == ["cancelled", "handled"]
+    assert report["cancelled"] == 0
+
+
+def test_close_cancels_in_flight_dispatch():
+    async def main():
+        log = []
+
+        async def dispatch(built, client):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                log.append("cancelled")
+                raise
+
+        pool = WorkerPool(1, 8)
+        await pool.start(dispatch)
+        await pool.submit(message("/start"), None)
+        await asyncio.sleep(0.01)
+
+        report = await asyncio.wait_for(pool.close(0.01), 1)
+        return log, report, pool
+
+    log, report, pool = run(main())
+    assert log == ["cancelled"]
+    assert report["cancelled"] == 1
+    assert not pool._tasks
+
+
+def test_dispatch_tracked_by_client_config():
+    async def main():
+        tasks = TaskTracker()
+
+        async def hook(built, client):
+            spawn(asyncio.sleep(0))
+
+        client = FakeClient()
+        client.__garnet_config__ = GarnetConfig(
+            dont_wait_for_handler=False,
+            dispatch_hook=hook,
+            executor=None,
+            tasks=tasks,
+            dedup=None,
+            subscribed=None,
+        )
+
+        pool = WorkerPool(1, 8)
+        # workers are started outside of any tracking context
+        await pool.start(dispatch_tracked)
+        await pool.submit(message("/start"), client)
+        await asyncio.wait_for(pool._queue.join(), 1)
+        await pool.close()
+        return tasks
+
+    assert run(main()).spawned == 1
+
+
+def text_of(built):
+    return built[NewMessage].text
+
+
+class Gated:
+    """Dispatch hook logging texts of updates, blocked until opened."""
+
+    def __init__(self):
+        self.log = []
+        self.gate = asyncio.Event()
+        self.running = self.max_running = 0
+
+    async def __call__(self, built, client):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.gate.wait()
+            self.log.append(text_of(built))
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.parametrize(
+    "overflow, handled, dropped",
+    [
+        (Overflow.DROP_NEWEST, ["a", "b"], ["c"]),
+        (Overflow.DROP_OLDEST, ["a", "c"], ["b"]),
+        (Overflow.REJECT, ["a", "b"], ["c"]),
+    ],
+)
+def test_pool_overflow_drops_updates(overflow, handled, dropped):
+    async def main():
+        dispatch, overflown = Gated(), []
+
+        async def on_overflow(built, client):
+            overflown.append(text_of(built))
+
+        pool = WorkerPool(1, 1, overflow, on_overflow=on_overflow)
+        await pool.start(dispatch)
+        await pool.submit(message("a"), None)
+        # worker takes the first update, the second one fills the queue
+        await asyncio.sleep(0)
+        await pool.submit(message("b"), None)
+        await pool.submit(message("c"), None)
+        assert pool.in_flight == 1 and pool.queued == 1
+
+        dispatch.gate.set()
+        report = await pool.close(1)
+        return dispatch.log, overflown, pool.dropped, report
+
+    log, overflown, dropped_count, report = run(main())
+    assert log == handled
+    assert overflown == dropped
+    assert dropped_count == 1
+    assert report["finished"] == 2 and report["cancelled"] == 0
+
+
+def test_pool_blocks_until_queue_has_place():
+    async def main():
+        dispatch = Gated()
+        pool = WorkerPool(1, 1)
+        await pool.start(dispatch)
+        await pool.submit(message("a"), None)
+        await asyncio.sleep(0)
+        await pool.submit(message("b"), None)
+
+        blocked = asyncio.create_task(pool.submit(message("c"), None))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        dispatch.gate.set()
+        await asyncio.wait_for(blocked, 1)
+        await pool.close(1)
+        return dispatch.log, pool.dropped
+
+    assert run(main()) == (["a", "b", "c"], 0)
+
+
+def test_reject_requires_overflow_hook():
+    with pytest.raises(ValueError):
+        WorkerPool(1, 1, Overflow.REJECT)
+
+
+def test_pool_dispatches_at_most_workers_updates_at_once():
+    async def main():
+        dispatch = Gated()
+        pool = WorkerPool(3, 100)
+        await pool.start(dispatch)
+        for number in range(10):
+            await pool.submit(message(str(number)), None)
+        await asyncio.sleep(0.01)
+        assert pool.in_flight == dispatch.running == 3
+        assert pool.queued == 7
+
+        dispatch.gate.set()
+        await asyncio.wait_for(pool._queue.join(), 1)
+        await pool.close()
+        return dispatch
+
+    dispatch = run(main())
+    assert dispatch.max_running == 3
+    assert sorted(dispatch.log, key=int) == [str(n) for n in range(10)]
+
+
+def keyed(**options):
+    executor = KeyedExecutor(**options)
+    # key is the first letter of text, "-" stands for update without key
+    executor.key_of = lambda built: text_of(built)[0].strip("-") or None
+    return executor
+
+
+def test_updates_of_one_key_are_dispatched_in_order():
+    async def main():
+        log = []
+
+        async def dispatch(built, client):
+            text = text_of(built)
+            log.append(f"{text} started")
+            # the first update of a key is the slowest one
+            await asyncio.sleep(0.02 if text.endswith("1") else 0)
+            log.append(text)
+
+        executor = keyed()
+        await executor.start(dispatch)
+        for text in ("a1", "a2", "b1", "a3", "b2"):
+            await executor.submit(message(text), None)
+        assert executor.keys == 2 and executor.queued == 5
+
+        report = await executor.close(1)
+        return log, report
+
+    log, report = run(main())
+    assert [entry for entry in log if entry[0] == "a"] == [
+        "a1 started",
+        "a1",
+        "a2 started",
+        "a2",
+        "a3 started",
+        "a3",
+    ]
+    # keys don't wait for each other
+    assert log.index("b1 started") < log.index("a1")
+    assert report["finished"] == 5 and report["cancelled"] == 0
+
+
+def test_idle_keys_are_reclaimed():
+    async def main():
+        dispatch = Gated()
+        executor = keyed()
+        await executor.start(dispatch)
+        for text in ("a1", "a2", "b1", "-1", "-2"):
+            await executor.submit(message(text), None)
+        await asyncio.sleep(0)
+        # updates without key take no lane
+        assert executor.keys == 2 and dispatch.running == 4
+
+        dispatch.gate.set()
+        await asyncio.wait_for(executor._tasks.wait(1), 1)
+        assert executor.keys == 0 and executor.queued == 0
+
+        await executor.submit(message("a3"), None)
+        assert executor.keys == 1
+        await executor.close(1)
+        return dispatch.log
+
+    assert sorted(run(main())) == ["-1", "-2", "a1", "a2", "a3", "b1"]
+
+
+def test_submit_waits_for_pending_place():
+    async def main():
+        dispatch = Gated()
+        executor = keyed(max_pending=2)
+        await executor.start(dispatch)
+        await executor.submit(message("a1"), None)
+        await executor.submit(message("b1"), None)
+
+        blocked = asyncio.create_task(executor.submit(message("c1"), None))
+        await asyncio.sleep(0.01)
+        assert not blocked.done() and executor.queued == 2
+
+        dispatch.gate.set()
+        await asyncio.wait_for(blocked, 1)
+        await executor.close(1)
+        return dispatch.log
+
+    assert sorted(run(main())) == ["a1", "b1", "c1"]
+
+
+def test_keys_are_dispatched_at_most_max_in_flight_at_once():
+    async def main():
+        dispatch = Gated()
+        executor = keyed(max_in_flight=2)
+        await executor.start(dispatch)
+        for text in ("a1", "b1", "c1", "-1", "-2"):
+            await executor.submit(message(text), None)
+        await asyncio.sleep(0.01)
+        assert dispatch.running == 2 and executor.queued == 5
+
+        dispatch.gate.set()
+        report = await executor.close(1)
+        return dispatch, report
+
+    dispatch, report = run(main())
+    assert dispatch.max_running == 2
+    assert len(dispatch.log) == report["finished"] == 5
+
+
+def test_close_cancels_lanes_after_timeout():
+    async def main():
+        dispatch = Gated()
+        executor = keyed()
+        await executor.start(dispatch)
+        for text in ("a1", "a2", "-1"):
+            await executor.submit(message(text), None)
+
+        report = await asyncio.wait_for(executor.close(0.01), 1)
+        return executor, report
+
+    executor, report = run(main())
+    assert report["pending"] == report["cancelled"] == 3
+    assert executor.keys == 0
@@ -0,0 +1,79 @@
+from fakes import run
+
+from _garnet.storages.cached import CachedStorage
+from _garnet.storages.compact import CompactStorage
+from _garnet.storages.dict import DictStorage
+from _garnet.storages.expiry import ExpiringStorage, Expiry
+from _garnet.storages.journal import JournalStorage
+
+
+def test_wrapper_deletes_evicted_keys():
+    async def main():
+        evicted = []
+        inner = DictStorage()
+        storage = ExpiringStorage(
+            inner,
+            Expiry(
+                max_entries=1,
+                on_evict=lambda *args: evicted.append(args),
+            ),
+        )
+        await storage.set_state("1:1", "menu")
+        await storage.get_state("2:2")
+        return evicted, set(inner._data)
+
+    evicted, keys = run(main())
+    assert evicted == [("1:1", "menu", {})]
+    assert keys == {"2:2"}
+
+
+def test_wrapper_deletes_evicted_keys_of_compact_storage():
+    async def main():
+        inner = CompactStorage()
+        storage = ExpiringStorage(inner, Expiry(max_entries=1))
+        await storage.set_state("1:1", "menu")
+        await storage.update_data("1:1", {"a": 1})
+        await storage.set_state("2:2", "menu")
+        return len(inner)
+
+    assert run(main()) == 1
+
+
+def test_cached_delete_is_written_before_newer_changes():
+    async def main():
+        inner = DictStorage()
+        storage = CachedStorage(inner)
+        await storage.set_state("1:1", "menu")
+        await storage.update_data("1:1", {"a": 1})
+        await storage.flush()
+
+        await storage.delete("1:1")
+        await storage.delete("2:2")
+        assert await storage.get_state("1:1") is None
+        assert await storage.get_data("1:1") == {}
+        await storage.update_data("1:1", {"b": 2})
+        await storage.flush()
+        return inner._data
+
+    assert run(main()) == {"1:1": {"state": None, "data": {"b": 2}}}
+
+
+def test_journal_replays_deletes(tmp_path):
+    path = tmp_path / "states.json"
+
+    async def main():
+        storage = JournalStorage(path)
+        await storage.init()
+        await storage.set_state("1:1", "menu")
+        await storage.set_state("2:2", "menu")
+        await storage.delete("1:1")
+        # crash, journal is not compacted
+        storage._journal.close()
+
+        storage = JournalStorage(path)
+        await storage.init()
+        keys = set(storage._data)
+        await storage.close()
+        return keys
+
+    assert run(main()) == {"2:2"}
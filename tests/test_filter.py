@@ -0,0 +1,205 @@
+import inspect
+import threading
+
+import pytest
+from fakes import FakeClient, Recorder, message, run
+
+from _garnet.events.filter import evaluate, forget, memoized, revision
+from garnet import events
+from garnet.ctx import CageCtx
+from garnet.events import Router
+from garnet.filters import Filter
+from garnet.storages import DictStorage
+
+
+def logged(log, name, result):
+    def function(event):
+        log.append(name)
+        return result
+
+    function.__name__ = name
+    return Filter(function)
+
+
+def logged_async(log, name, result):
+    async def function(event):
+        log.append(name)
+        return result
+
+    function.__name__ = name
+    return Filter(function)
+
+
+def test_same_operations_are_flattened():
+    a, b, c = (Filter(lambda _: True) for _ in range(3))
+
+    conjunction = (a & b) & c
+    assert conjunction.op == "and"
+    assert conjunction.operands == (a, b, c)
+    assert (a | (b | c)).operands == (a, b, c)
+    assert (a ^ b ^ c).operands == (a, b, c)
+
+    mixed = (a | b) & c
+    assert mixed.operands[1] is c
+    assert mixed.operands[0].operands == (a, b)
+
+
+def test_double_negation_is_the_filter_itself():
+    f = Filter(lambda _: True)
+    assert ~~f is f
+    assert (~f).operands == (f,)
+
+
+def test_sync_operands_make_sync_filter():
+    log = []
+    composed = ~(logged(log, "a", True) & logged(log, "b", False))
+
+    assert composed.is_sync and not composed.is_awaitable
+    # called right in the event loop, nothing to await
+    assert composed.function(None) is True
+    assert log == ["a", "b"]
+    assert composed.function.__name__ == "Not(And(a, b))"
+
+
+def test_async_operand_makes_async_filter():
+    log = []
+    composed = logged(log, "a", True) & logged_async(log, "b", True)
+
+    assert composed.is_awaitable
+    assert inspect.iscoroutinefunction(composed.function)
+    assert run(composed.call(None)) is True
+    assert log == ["a", "b"]
+
+
+@pytest.mark.parametrize("make", [logged, logged_async])
+def test_operations_stop_at_deciding_operand(make):
+    log = []
+    conjunction = make(log, "a", True) & make(log, "b", False)
+    disjunction = make(log, "c", False) | make(log, "d", True)
+
+    assert not run((conjunction & make(log, "x", True)).call(None))
+    assert run((disjunction | make(log, "y", True)).call(None))
+    assert log == ["a", "b", "c", "d"]
+
+
+def test_xor_calls_every_operand():
+    log = []
+    composed = logged(log, "a", True) ^ logged(log, "b", True)
+    composed ^= logged(log, "c", True)
+
+    assert run(composed.call(None)) is True
+    assert log == ["a", "b", "c"]
+
+
+def test_filters_of_different_builders_are_not_composed():
+    message = Filter(lambda _: True, events.NewMessage)
+    query = Filter(lambda _: True, events.CallbackQuery)
+
+    assert (message & Filter(lambda _: True)).event_builder is events.NewMessage
+    with pytest.raises(ValueError):
+        message & query
+    with pytest.raises(ValueError):
+        message & (lambda _: True)
+
+
+def counted(calls, name, result=True, *, pure):
+    def function(event):
+        calls.append(name)
+        return result
+
+    return Filter(function, pure=pure)
+
+
+def never(event):
+    return False
+
+
+def dispatch(router, *texts):
+    async def main():
+        storage = DictStorage()
+        for text_ in texts:
+            await router.notify(storage, message(text_), FakeClient())
+
+    run(main())
+
+
+@pytest.mark.parametrize("pure, calls_per_update", [(True, 1), (False, 3)])
+def test_only_pure_filters_run_once_per_update(pure, calls_per_update):
+    calls, recorder = [], Recorder()
+    checked = counted(calls, "checked", pure=pure)
+
+    router = Router()
+    router.message(checked, Filter(never))(recorder.handler("never"))
+    router.message(checked, ~Filter(lambda _: True))(recorder.handler("not"))
+    router.message(checked)(recorder.handler("checked"))
+
+    dispatch(router, "first", "second")
+    assert recorder.log == ["checked", "checked"]
+    assert len(calls) == 2 * calls_per_update
+
+
+def test_storage_write_forgets_results():
+    calls, recorder = [], Recorder()
+    checked = counted(calls, "checked", pure=True)
+
+    async def moves_user(event):
+        await CageCtx.get().set_state("moved")
+        return False
+
+    router = Router()
+    router.message(checked, Filter(moves_user))(recorder.handler("moved"))
+    router.message(checked)(recorder.handler("checked"))
+
+    dispatch(router, "hello")
+    assert recorder.log == ["checked"]
+    assert calls == ["checked", "checked"]
+
+
+def test_results_are_reused_within_memoized_context_only():
+    calls = []
+    checked = counted(calls, "checked", pure=True)
+    event = object()
+
+    async def main():
+        await evaluate(checked, event)
+        with memoized():
+            assert revision() == 0
+            await evaluate(checked, event)
+            await evaluate(checked, event)
+            forget()
+            assert revision() == 1
+            await evaluate(checked, event)
+
+    run(main())
+    assert len(calls) == 3
+
+
+def thread_logged(threads, name, *, offload):
+    def function(event):
+        threads[name] = threading.get_ident()
+        return True
+
+    return Filter(function, offload=offload)
+
+
+def test_only_offloaded_filters_leave_event_loop():
+    threads, recorder = {}, Recorder()
+    inline = thread_logged(threads, "inline", offload=False)
+    offloaded = thread_logged(threads, "offloaded", offload=True)
+    composed = thread_logged(threads, "composed", offload=True) & inline
+
+    assert inline.is_sync and not offloaded.is_sync
+    assert not composed.is_sync
+
+    router = Router()
+    router.message(inline, offloaded, composed)(recorder.handler("passed"))
+
+    async def main():
+        threads["loop"] = threading.get_ident()
+        await router.notify(DictStorage(), message("hello"), FakeClient())
+
+    run(main())
+    assert recorder.log == ["passed"]
+    assert threads["inline"] == threads["loop"]
+    assert threads["offloaded"] != threads["loop"]
+    assert threads["composed"] != threads["loop"]
@@ -0,0 +1,88 @@
+import pytest
+
+from garnet.filters import group
+
+
+class Form(group.Group):
+    name = group.M()
+    age = group.M()
+
+    class Address(group.Group):
+        city = group.M()
+        street = group.M()
+
+        class Extra(group.Group):
+            flat = group.M()
+
+    phone = group.M()
+
+
+Address = Form.Address
+Extra = Address.Extra
+
+
+def test_nested_groups_have_full_names():
+    assert Form.full_group_name == "Form"
+    assert Extra.full_group_name == "Form.Address.Extra"
+    assert Address.city.name == "Form.Address.city"
+    assert str(Extra.flat) == "Form.Address.Extra.flat"
+    assert Form.all_state_names == (
+        "Form.name",
+        "Form.age",
+        "Form.phone",
+        "Form.Address.city",
+        "Form.Address.street",
+        "Form.Address.Extra.flat",
+    )
+    assert Extra.parent is Address and Address.parent is Form
+    assert Extra.get_root() is Form
+
+
+def test_members_are_navigated_through_children():
+    assert Form.name.next is Form.age
+    assert Form.phone.next is Address.city
+    assert Address.street.next is Extra.flat
+    assert Address.street.prev is Address.city
+    assert Form.age.prev is Form.name
+    assert Extra.flat.top is Extra.flat
+    assert Address.street.top is Address.city
+    assert Form.phone.top is Form.name
+
+
+def test_navigation_stops_at_group_ends():
+    with pytest.raises(group.NoNext):
+        Extra.flat.next
+    with pytest.raises(group.NoNext):
+        Address.street.next.next
+    # first member used to wrap around to the last one
+    with pytest.raises(group.NoPrev):
+        Form.name.prev
+    with pytest.raises(group.NoPrev):
+        Extra.flat.prev
+
+
+def test_navigation_does_not_scan_group():
+    names = [f"s{i}" for i in range(10_000)]
+    big = group.Group.from_iter(names, "Big")
+    members = big.all_state_objects
+
+    class Scanned(tuple):
+        def __iter__(self):
+            raise AssertionError("group is scanned")
+
+        index = __contains__ = __iter__
+
+    big._frozen.states = Scanned(members)
+    assert members[5000].next is members[5001]
+    assert members[5000].prev is members[4999]
+    assert members[-1].top is members[0]
+
+
+def test_membership_of_members_and_names():
+    assert Form.name in Form
+    assert Extra.flat in Form and Extra.flat in Address
+    assert "Form.Address.city" in Form
+    assert Form.name not in Address
+    assert "Form.Address.city" not in Extra
+    assert "city" not in Address
+    assert None not in Form
@@ -0,0 +1,143 @@
+from fakes import Recorder, compare, message, run
+
+from _garnet.events.index import Route
+from garnet.ctx import CageCtx
+from garnet.events import Router
+from garnet.filters import Filter, State, group, text
+from garnet.storages import DictStorage
+
+
+class Steps(group.Group):
+    name = group.M()
+    age = group.M()
+
+
+def hint_of(router: Router, /):
+    (handler,) = router._handlers
+    return Route(0, handler, router._chain(handler)).hint
+
+
+def test_commands_dispatch_like_linear_scan():
+    def make_router(recorder: Recorder) -> Router:
+        router, child = Router(), Router()
+        for number in range(20):
+            router.message(text.commands(f"c{number}"))(
+                recorder.handler(number)
+            )
+        router.message(text.commands("c5") & Filter(lambda e: "x" in e.text))(
+            recorder.handler("c5x")
+        )
+        child.message(Filter(lambda e: e.text.startswith("/c")))(
+            recorder.handler("fallback")
+        )
+        child.message(text.commands("c7", prefixes="!"))(
+            recorder.handler("bang")
+        )
+        return router.include(child)
+
+    updates = ["/c3", "/c5 x", "/c19@bot", "!c7", "/c99", "hello", ""]
+    log = run(
+        compare(
+            make_router,
+            [lambda text_=text_: message(text_) for text_ in updates],
+            DictStorage,
+        )
+    )
+    assert log == [3, 5, 19, "bang", "fallback"]
+
+
+def test_command_failure_action_is_called():
+    def make_router(recorder: Recorder) -> Router:
+        router = Router()
+        router.message(
+            (text.commands("start"), recorder.action("start")),
+            text.commands("help"),
+        )(recorder.handler("start"))
+        router.message(text.commands("help"))(recorder.handler("help"))
+        return router
+
+    log = run(compare(make_router, [lambda: message("/help")], DictStorage))
+    assert log == ["help", ("action", "start")]
+
+
+def test_hints_are_taken_before_filters_with_actions():
+    router = Router()
+    router.message(
+        text.commands("a"), (Filter(lambda e: True), lambda e, f: None),
+    )(Recorder().handler("a"))
+    assert hint_of(router) is not None
+
+    router = Router()
+    router.message(
+        (Filter(lambda e: True), lambda e, f: None), text.commands("a"),
+    )(Recorder().handler("a"))
+    assert hint_of(router) is None
+
+
+def test_states_dispatch_like_linear_scan():
+    def make_router(recorder: Recorder) -> Router:
+        router = Router()
+
+        @router.message(State.entry, text.commands("start"))
+        async def start(event):
+            await CageCtx.get().set_state(Steps.name)
+            recorder.log.append("start")
+
+        router.message(State.exact(Steps.age))(recorder.handler("second"))
+        router.message(
+            (State.exact(Steps.name), recorder.action("not first")),
+        )(recorder.handler("first"))
+        router.message(State.any)(recorder.handler("any"))
+        return router
+
+    log = run(
+        compare(
+            make_router,
+            [lambda: message("hi"), lambda: message("/start")]
+            + [lambda: message("hi")] * 2,
+            DictStorage,
+        )
+    )
+    assert log == [("action", "not first"), "start", "first", "first"]
+
+
+def test_state_selector_uses_router_key_maker():
+    def make_router(recorder: Recorder) -> Router:
+        # users of a chat share the state
+        router = Router(cage_key_maker=lambda chat, user: str(chat))
+
+        @router.message(State.entry)
+        async def start(event):
+            await CageCtx.get().set_state(Steps.name)
+            recorder.log.append("start")
+
+        router.message(State.exact(Steps.name))(recorder.handler("first"))
+        return router
+
+    log = run(
+        compare(
+            make_router,
+            [
+                lambda: message("hi", chat=5, user=1),
+                lambda: message("hi", chat=5, user=2),
+                lambda: message("hi", chat=6, user=2),
+            ],
+            DictStorage,
+        )
+    )
+    assert log == ["start", "first", "start"]
+
+
+def test_state_failure_action_is_called():
+    def make_router(recorder: Recorder) -> Router:
+        router = Router()
+        router.message((State.any, recorder.action("any")))(
+            recorder.handler("any")
+        )
+        router.message((State.entry, recorder.action("entry")))(
+            recorder.handler("entry")
+        )
+        return router
+
+    log = run(compare(make_router, [lambda: message("hi")], DictStorage))
+    assert log == ["entry", ("action", "any")]
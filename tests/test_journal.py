@@ -0,0 +1,150 @@
+import asyncio
+import copy
+import json
+
+from fakes import run
+
+from _garnet.storages import journal as journal_module
+from _garnet.storages.journal import Fsync, JournalStorage
+
+
+async def reopened(path):
+    storage = JournalStorage(path)
+    await storage.init()
+    return storage
+
+
+def test_torn_tail_is_ignored_and_overwritten(tmp_path):
+    path = tmp_path / "states.json"
+    journal = tmp_path / "states.json.journal"
+
+    async def main():
+        storage = await reopened(path)
+        await storage.set_state("1:1", "menu")
+        await storage.update_data("1:1", {"a": 1})
+        storage._journal.close()
+
+        # crash in the middle of the next record
+        with journal.open("ab") as fp:
+            fp.write(b'["u","1:1",{"b"')
+
+        storage = await reopened(path)
+        recovered = copy.deepcopy(storage._data["1:1"])
+        await storage.update_data("1:1", {"c": 3})
+        storage._journal.close()
+
+        storage = await reopened(path)
+        replayed = storage._data["1:1"]
+        await storage.close()
+        return recovered, replayed
+
+    recovered, replayed = run(main())
+    assert recovered == {"state": "menu", "data": {"a": 1}}
+    assert replayed == {"state": "menu", "data": {"a": 1, "c": 3}}
+    # torn record was cut off before the next one was appended
+    for line in journal.read_bytes().splitlines():
+        json.loads(line)
+
+
+def test_broken_record_is_skipped(tmp_path):
+    path = tmp_path / "states.json"
+    journal = tmp_path / "states.json.journal"
+    journal.write_bytes(
+        b'["s","1:1","menu"]\n["?","1:1",null]\n["u","1:1",{"a":1}]\n'
+    )
+
+    async def main():
+        storage = await reopened(path)
+        data = storage._data["1:1"]
+        await storage.close()
+        return data
+
+    assert run(main()) == {"state": "menu", "data": {"a": 1}}
+
+
+def test_periodic_records_are_flushed_on_close(tmp_path):
+    path = tmp_path / "states.json"
+
+    async def main():
+        storage = JournalStorage(path, fsync=Fsync.PERIODIC, interval=60)
+        await storage.init()
+        await storage.set_state("1:1", "menu")
+        await storage.close()
+
+        storage = await reopened(path)
+        state = await storage.get_state("1:1")
+        await storage.close()
+        return state
+
+    assert run(main()) == "menu"
+
+
+async def compacted(storage):
+    # writer is resumed before journal is rotated
+    await storage._flusher
+    await storage._compaction
+
+
+def test_rotation_goes_on_after_failed_compaction(tmp_path, monkeypatch):
+    path = tmp_path / "states.json"
+    journal = tmp_path / "states.json.journal"
+    rotated = tmp_path / "states.json.journal.1"
+    dump = journal_module._dump_snapshot
+
+    def failing_dump(snapshot, path_):
+        raise OSError("disk is full")
+
+    async def main():
+        storage = JournalStorage(path, compact_at=1)
+        await storage.init()
+
+        monkeypatch.setattr(journal_module, "_dump_snapshot", failing_dump)
+        await storage.set_state("1:1", "menu")
+        await compacted(storage)
+        await storage.set_state("2:2", "menu")
+        await compacted(storage)
+        # live journal is rotated anyway, records wait for the next merge
+        assert journal.read_bytes() == b""
+        assert len(rotated.read_bytes().splitlines()) == 2
+
+        monkeypatch.setattr(journal_module, "_dump_snapshot", dump)
+        await storage.set_state("3:3", "menu")
+        await compacted(storage)
+        assert not rotated.exists()
+        await storage.close()
+
+        storage = await reopened(path)
+        keys = set(storage._data)
+        await storage.close()
+        return keys
+
+    assert run(main()) == {"1:1", "2:2", "3:3"}
+    assert set(json.loads(path.read_text())) == {"1:1", "2:2", "3:3"}
+
+
+def test_failed_periodic_flush_is_not_retried_after_close(
+    tmp_path, monkeypatch, caplog
+):
+    path = tmp_path / "states.json"
+    appended = []
+
+    def failing_append(self, chunk):
+        appended.append(chunk)
+        raise OSError("disk is full")
+
+    async def main():
+        storage = JournalStorage(path, fsync=Fsync.PERIODIC, interval=0.01)
+        await storage.init()
+        monkeypatch.setattr(JournalStorage, "_append", failing_append)
+
+        await storage.set_state("1:1", "menu")
+        await storage.close()
+        assert storage._timer is None
+        flusher = storage._flusher
+
+        await asyncio.sleep(0.05)
+        assert storage._flusher is flusher
+
+    run(main())
+    assert len(appended) == 1
+    assert "1 records were not written" in caplog.text
@@ -0,0 +1,41 @@
+from telethon.tl import types
+
+from garnet import events
+from garnet.events import Router
+from garnet.runner import PriorityLanes
+
+QUERY = types.UpdateBotCallbackQuery(0, 0, None, 0, 0)
+MESSAGE = types.UpdateNewMessage(None, 0, 0)
+STATUS = types.UpdateUserStatus(0, None)
+
+
+async def handler(event):
+    pass
+
+
+def test_router_priority_applies_to_every_update_of_builder():
+    admin, other = Router(priority=2), Router(priority=1)
+    admin.message()(handler)
+    other.message()(handler)
+    other.callback_query()(handler)
+
+    lanes = PriorityLanes({})
+    lanes.include(Router().include(other).include(admin))
+
+    # not only updates admin router handles, the highest priority wins
+    assert lanes.priority_of(MESSAGE) == 2
+    assert lanes.priority_of(QUERY) == 1
+    assert lanes.priority_of(STATUS) == 0
+
+
+def test_higher_lanes_go_first_and_lower_ones_keep_moving():
+    lanes = PriorityLanes({events.CallbackQuery: 1}, burst=3)
+    for name in ("low1", "low2"):
+        lanes.put_nowait((STATUS, name))
+    for name in ("high1", "high2", "high3"):
+        lanes.put_nowait((QUERY, name))
+
+    taken = [lanes.get_nowait()[1] for _ in range(len(lanes))]
+    # every third update is the longest waiting one
+    assert taken == ["high1", "high2", "low1", "high3", "low2"]
+    assert lanes.empty()
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fakes import FakeBuilt, FakeClient, run
+from telethon.tl import types
+
+from _garnet.overload import LOW_PRIORITY, RESPONDED, STALE, update_age
+from garnet import events
+from garnet.runner import OverloadController
+
+STATUS = types.UpdateUserStatus(0, None)
+
+
+def new_message(age):
+    date = datetime.now(timezone.utc) - timedelta(seconds=age)
+    return types.UpdateNewMessage(
+        types.Message(1, types.PeerUser(1), date, "hello"), 0, 0
+    )
+
+
+def built_of(update):
+    built = FakeBuilt({})
+    built.update = update
+    return built
+
+
+def controlled(controller, *updates):
+    dispatched, client = [], FakeClient()
+
+    async def dispatch(built, client_):
+        dispatched.append(built.update)
+
+    async def main():
+        hook = controller.wrap(dispatch)
+        for update in updates:
+            await hook(built_of(update), client)
+
+    run(main())
+    return dispatched
+
+
+def test_lag_monitor_measures_blocked_loop():
+    controller = OverloadController(max_queue=None, max_lag=0.05, interval=0.01)
+
+    async def main():
+        await controller.start()
+        await asyncio.sleep(0.03)
+        assert controller.lag < 0.05 and not controller.overloaded
+
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        assert controller.lag > 0.05 and controller.overloaded
+
+        # spike fades out once loop is responsive again
+        await asyncio.sleep(0.1)
+        assert not controller.overloaded
+
+        monitor = controller._monitor
+        await controller.close()
+        assert monitor.cancelled() and controller._monitor is None
+
+    run(main())
+
+
+def test_nothing_is_shed_until_overloaded():
+    respond_calls = []
+
+    async def respond(built, client):
+        respond_calls.append(built.update)
+
+    controller = OverloadController(
+        max_queue=1,
+        max_lag=None,
+        max_age=1,
+        shed=(events.UserUpdate,),
+        respond=respond,
+    )
+    controller.watch(lambda: 1)
+
+    old = new_message(10)
+    assert controlled(controller, STATUS, old) == [STATUS, old]
+    assert not respond_calls and not controller.shed
+
+
+@pytest.mark.parametrize(
+    "options, update, reason",
+    [
+        ({"shed": (events.UserUpdate,)}, STATUS, LOW_PRIORITY),
+        ({"max_age": 5}, new_message(10), STALE),
+    ],
+)
+def test_each_policy_sheds_while_overloaded(options, update, reason):
+    controller = OverloadController(max_queue=0, max_lag=None, **options)
+    controller.watch(lambda: 1)
+
+    fresh = new_message(0)
+    assert controlled(controller, update, fresh) == [fresh]
+    assert controller.shed == {reason: 1}
+
+
+def test_rest_is_responded_to_while_overloaded():
+    responded, client = [], FakeClient()
+
+    async def respond(built, client_):
+        assert client_ is client
+        responded.append(built.update)
+
+    async def dispatch(built, client_):
+        raise AssertionError("update is dispatched")
+
+    controller = OverloadController(max_queue=0, respond=respond)
+    controller.watch(lambda: 1)
+    run(controller.wrap(dispatch)(built_of(STATUS), client))
+    assert responded == [STATUS]
+    assert controller.shed == {RESPONDED: 1}
+
+
+def test_policies_are_applied_in_order():
+    responded = []
+
+    async def respond(built, client):
+        responded.append(built.update)
+
+    controller = OverloadController(
+        max_queue=0,
+        max_lag=None,
+        max_age=5,
+        shed=(events.UserUpdate,),
+        respond=respond,
+    )
+    controller.watch(lambda: 1)
+
+    old, fresh = new_message(10), new_message(0)
+    assert controlled(controller, STATUS, old, fresh) == []
+    assert controller.shed == {LOW_PRIORITY: 1, STALE: 1, RESPONDED: 1}
+    assert responded == [fresh]
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_shed_hook_gets_every_shed_update(is_async):
+    shed = []
+
+    def on_shed(built, client, reason):
+        shed.append((built.update, reason))
+
+    async def on_shed_async(built, client, reason):
+        on_shed(built, client, reason)
+
+    controller = OverloadController(
+        max_queue=0,
+        max_lag=None,
+        max_age=5,
+        shed=(events.UserUpdate,),
+        on_shed=on_shed_async if is_async else on_shed,
+    )
+    controller.watch(lambda: 1)
+
+    old, fresh = new_message(10), new_message(0)
+    assert controlled(controller, STATUS, old, fresh) == [fresh]
+    assert shed == [(STATUS, LOW_PRIORITY), (old, STALE)]
+
+
+def test_failing_shed_hook_does_not_break_dispatch():
+    def on_shed(built, client, reason):
+        raise RuntimeError
+
+    controller = OverloadController(
+        max_queue=0, max_lag=None, shed=(events.UserUpdate,), on_shed=on_shed
+    )
+    controller.watch(lambda: 1)
+
+    fresh = new_message(0)
+    assert controlled(controller, STATUS, fresh) == [fresh]
+    assert controller.shed[LOW_PRIORITY] == 1
+
+
+def test_age_of_updates_without_date_is_unknown():
+    assert update_age(STATUS) is None
+    assert 9 < update_age(new_message(10)) < 11
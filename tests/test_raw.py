@@ -0,0 +1,49 @@
+import ast
+import inspect
+import textwrap
+
+from telethon import events
+from telethon.events.common import EventBuilder
+from telethon.tl import types
+
+from _garnet.events.raw import RAW_UPDATES
+
+# raw updates which only newer Telethon versions build events from
+NEWER = {events.ChatAction: {types.UpdateChannelParticipant}}
+
+
+def built_from(builder):
+    """Raw update types `build` of event builder checks `update` against."""
+    tree = ast.parse(textwrap.dedent(inspect.getsource(builder.build)))
+    found = set()
+    for node in ast.walk(tree):
+        if not (
+            isinstance(node, ast.Call)
+            and getattr(node.func, "id", None) == "isinstance"
+            and getattr(node.args[0], "id", None) == "update"
+        ):
+            continue
+
+        for name in ast.walk(node.args[1]):
+            if isinstance(name, ast.Attribute):
+                found.add(getattr(types, name.attr))
+    return found
+
+
+def test_every_builder_is_mapped():
+    builders = {
+        builder
+        for builder in vars(events).values()
+        if inspect.isclass(builder)
+        and issubclass(builder, EventBuilder)
+        and builder not in (EventBuilder, events.Raw)
+    }
+    assert builders == set(RAW_UPDATES)
+
+
+def test_raw_updates_match_builders():
+    for builder, raw_types in RAW_UPDATES.items():
+        expected = built_from(builder)
+        assert expected, builder
+        assert expected <= raw_types, builder
+        assert raw_types - expected <= NEWER.get(builder, set()), builder
@@ -0,0 +1,290 @@
+import asyncio
+
+import pytest
+from fakes import (
+    FakeBuilt,
+    FakeClient,
+    FakeEvent,
+    Recorder,
+    message,
+    run,
+    settle,
+)
+
+from garnet import events
+from garnet.ctx import DeadlineCtx, time_left
+from garnet.events import Router
+from garnet.filters import Filter
+from garnet.storages import DictStorage
+
+
+def dispatch(router, *updates):
+    async def main():
+        storage = DictStorage()
+        for update in updates:
+            await router.notify(storage, update, FakeClient())
+            await settle()
+
+    run(main())
+
+
+def raising(exception, recorder, name):
+    async def handle(event):
+        recorder.log.append(name)
+        raise exception
+
+    return handle
+
+
+def test_every_child_is_notified_in_order():
+    recorder = Recorder()
+    root, first, second, nested = Router(), Router(), Router(), Router()
+    first.message(Filter(lambda e: e.text == "first"))(
+        recorder.handler("first")
+    )
+    nested.message(Filter(lambda e: e.text == "nested"))(
+        recorder.handler("nested")
+    )
+    second.message()(recorder.handler("second"))
+    root.include(first.include(nested)).include(second)
+
+    dispatch(root, message("first"), message("nested"), message("other"))
+    assert recorder.log == ["first", "nested", "second"]
+
+
+def test_children_are_notified_if_router_filters_fail():
+    recorder = Recorder()
+    root, child = Router(None, Filter(lambda _: False)), Router()
+    root.message()(recorder.handler("root"))
+    child.message()(recorder.handler("child"))
+    root.include(child)
+
+    dispatch(root, message("hello"))
+    assert recorder.log == ["child"]
+
+
+def test_stop_propagation_ends_whole_dispatch():
+    recorder = Recorder()
+    root, first, second = Router(), Router(), Router()
+    first.message()(raising(events.StopPropagation, recorder, "stop"))
+    first.message()(recorder.handler("first"))
+    second.message()(recorder.handler("second"))
+    root.include(first).include(second)
+
+    dispatch(root, message("hello"))
+    assert recorder.log == ["stop"]
+
+
+def test_skip_handler_goes_to_the_next_one():
+    recorder = Recorder()
+    root, child = Router(), Router()
+    root.message()(raising(events.SkipHandler, recorder, "skip"))
+    child.message()(recorder.handler("child"))
+    root.include(child)
+
+    dispatch(root, message("hello"))
+    assert recorder.log == ["skip", "child"]
+
+
+def test_only_handlers_of_built_events_are_touched():
+    recorder = Recorder()
+    router = Router()
+    router.message(Filter(lambda e: recorder.log.append("checked")))(
+        recorder.handler("message")
+    )
+    router.callback_query()(recorder.handler("query"))
+
+    dispatch(router, FakeBuilt({events.CallbackQuery: FakeEvent()}))
+    assert recorder.log == ["query"]
+
+
+def test_changes_after_freeze_recompile_index():
+    recorder = Recorder()
+    root, child = Router(), Router()
+    root.include(child)
+
+    index = root.freeze()
+    assert root.freeze() is index
+
+    child.message(Filter(lambda e: e.text == "child"))(
+        recorder.handler("child")
+    )
+    assert root._index is None
+
+    grandchild = Router()
+    grandchild.message()(recorder.handler("grandchild"))
+    root.freeze()
+    child.include(grandchild)
+    assert root._index is None
+
+    dispatch(root, message("child"), message("other"))
+    assert recorder.log == ["child", "grandchild"]
+
+
+def logging_intermediate(log, name):
+    async def intermediate(handler, event):
+        log.append(name)
+        return await handler(event)
+
+    intermediate.__name__ = name
+    return intermediate
+
+
+def test_chains_are_built_once_per_freeze(monkeypatch):
+    built = []
+    chain = Router._chain
+
+    def counting_chain(self, handler):
+        built.append(handler)
+        return chain(self, handler)
+
+    monkeypatch.setattr(Router, "_chain", counting_chain)
+    recorder = Recorder()
+    router = Router()
+    router.add_use(logging_intermediate(recorder.log, "outer"))
+    router.message()(recorder.handler("handler"))
+
+    dispatch(router, message("a"), message("b"), message("c"))
+    assert len(built) == 1
+    assert recorder.log == ["outer", "handler"] * 3
+
+
+def test_intermediates_added_after_freeze_are_used():
+    recorder = Recorder()
+    root, child = Router(), Router()
+    root.include(child)
+    child.message(Filter(lambda e: e.text != "late"))(
+        recorder.handler("handler")
+    )
+    dispatch(root, message("a"))
+
+    child.add_use(logging_intermediate(recorder.log, "outer"))
+    child.add_use(logging_intermediate(recorder.log, "inner"))
+    dispatch(root, message("b"))
+
+    late = Router()
+    late.add_use(logging_intermediate(recorder.log, "late"))
+    late.message()(recorder.handler("late handler"))
+    root.include(late)
+    dispatch(root, message("c"), message("late"))
+
+    assert recorder.log == [
+        "handler",
+        "outer",
+        "inner",
+        "handler",
+        "outer",
+        "inner",
+        "handler",
+        "late",
+        "late handler",
+    ]
+
+
+def test_timer_is_called_after_every_intermediate():
+    timings = []
+    recorder = Recorder()
+    router = Router(
+        intermediate_timer=lambda intermediate, handler, seconds: (
+            timings.append((intermediate.__name__, handler, seconds))
+        )
+    )
+    router.add_use(logging_intermediate(recorder.log, "outer"))
+    router.add_use(logging_intermediate(recorder.log, "inner"))
+    handler = recorder.handler("handler")
+    router.message()(handler)
+
+    dispatch(router, message("a"))
+    assert [name for name, *_ in timings] == ["inner", "outer"]
+    assert all(seconds >= 0 for *_, seconds in timings)
+    assert timings[1][2] >= timings[0][2]
+
+
+def sleeping(recorder, name, seconds):
+    async def handle(event):
+        recorder.log.append(name)
+        await asyncio.sleep(seconds)
+        recorder.log.append(f"{name} done")
+
+    return handle
+
+
+def test_handler_is_cancelled_after_timeout():
+    recorder = Recorder()
+    router = Router()
+    router.message(
+        Filter(lambda e: e.text == "slow"),
+        timeout=0.01,
+        on_timeout=recorder.action("timeout"),
+    )(sleeping(recorder, "slow", 10))
+    router.message(timeout=1, on_timeout=recorder.action("timeout"))(
+        sleeping(recorder, "fast", 0)
+    )
+
+    dispatch(router, message("slow"), message("fast"))
+    assert recorder.log == [
+        "slow",
+        ("action", "timeout"),
+        "fast",
+        "fast done",
+    ]
+
+
+@pytest.mark.parametrize(
+    "timeout, log",
+    [
+        (None, ["default", ("action", "default")]),
+        (1, ["default", "default done"]),
+    ],
+)
+def test_router_timeout_is_default_of_own_handlers(timeout, log):
+    recorder = Recorder()
+    root = Router(timeout=0.01, on_timeout=recorder.action("default"))
+    child = Router()
+    root.message(Filter(lambda e: e.text == "root"), timeout=timeout)(
+        sleeping(recorder, "default", 0.05)
+    )
+    child.message()(sleeping(recorder, "child", 0.05))
+    root.include(child)
+
+    dispatch(root, message("root"), message("child"))
+    assert recorder.log == [*log, "child", "child done"]
+
+
+def test_handler_action_overrides_router_action():
+    recorder = Recorder()
+    router = Router(timeout=0.01, on_timeout=recorder.action("default"))
+    router.message(on_timeout=recorder.action("own"))(
+        sleeping(recorder, "slow", 10)
+    )
+
+    dispatch(router, message("slow"))
+    assert recorder.log == ["slow", ("action", "own")]
+
+
+def test_time_left_is_bound_by_outer_deadline():
+    left = []
+
+    async def handle(event):
+        left.append(time_left())
+
+    router = Router()
+    router.message(timeout=10)(handle)
+
+    async def main():
+        storage = DictStorage()
+        left.append(time_left())
+        await router.notify(storage, message("own"), FakeClient())
+
+        loop = asyncio.get_running_loop()
+        token = DeadlineCtx.set(loop.time() + 1)
+        try:
+            await router.notify(storage, message("outer"), FakeClient())
+        finally:
+            DeadlineCtx.reset(token)
+        assert DeadlineCtx.get() is None
+
+    run(main())
+    assert left[0] is None
+    assert 9 < left[1] <= 10
+    assert 0 < left[2] <= 1
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+
+from fakes import run
+
+from _garnet.shards import ShardedExecutor
+
+
+class SlowConnection:
+    def __init__(self):
+        self.sent = []
+        self.writing = threading.Lock()
+        self.overlapped = False
+
+    def send(self, obj):
+        if not self.writing.acquire(blocking=False):
+            self.overlapped = True
+            self.writing.acquire()
+        try:
+            time.sleep(0.05)
+            self.sent.append(obj)
+        finally:
+            self.writing.release()
+
+
+def test_stop_waits_for_cancelled_send():
+    async def main():
+        executor = ShardedExecutor(None, None, None, 1)
+        (shard,) = executor._shards
+        shard.conn = conn = SlowConnection()
+
+        feeding = asyncio.ensure_future(executor._send(shard, ["update"]))
+        await asyncio.sleep(0.01)
+        feeding.cancel()
+        await executor._send(shard, 1.0)
+        return conn
+
+    conn = run(main())
+    assert conn.sent == [["update"], 1.0]
+    assert not conn.overlapped
@@ -0,0 +1,126 @@
+import re
+
+from fakes import FakeClient, FakeEvent, Recorder, compare, message, run
+
+from _garnet.events.index import build_index
+from _garnet.filters.text import PatternSelector
+from _garnet.patched_events import NewMessage
+from garnet.ctx import KeywordsCtx, MatchCtx
+from garnet.events import Router
+from garnet.filters import Filter, text
+from garnet.storages import DictStorage
+
+PATTERNS = [
+    ("hello", 0),
+    ("(?i)hello", 0),
+    ("(?i)(?s)hel+o.", 0),
+    ("HELLO", re.IGNORECASE),
+    (r"(\w+) \1", 0),
+    (r"(?P<word>\w+) (?P=word)", 0),
+    (r"(<)?hello(?(1)>)", 0),
+    (r"(?x) h e l l o  # spaces are ignored", 0),
+    (r"hel  lo", re.VERBOSE),
+    (r"(he)(l+)(o)", 0),
+    (r"^\d+$", 0),
+    ("", 0),
+]
+TEXTS = [
+    "hello",
+    "Hello world",
+    "HELLO",
+    "hello hello",
+    "hi hi",
+    "<hello>",
+    "<hello",
+    "hellooo\n",
+    "42",
+    "",
+]
+
+
+def test_pattern_selector_matches_like_patterns():
+    router = Router()
+    for expression, flags in PATTERNS:
+        router.message(text.match(expression, flags))(
+            Recorder().handler(expression)
+        )
+
+    (segment,) = build_index(router)[NewMessage]
+    (selector,) = segment._selectors
+    assert isinstance(selector, PatternSelector)
+    # patterns which can't be combined are matched one by one
+    assert len(selector.standalone) == 5
+
+    async def selected(text_: str) -> set:
+        found = await selector.select(FakeEvent(text_))
+        return {route.position for routes in found for route in routes}
+
+    for text_ in TEXTS:
+        expected = {
+            position
+            for position, (expression, flags) in enumerate(PATTERNS)
+            if re.compile(expression, flags).match(text_)
+        }
+        assert run(selected(text_)) == expected, text_
+
+
+def test_patterns_dispatch_like_linear_scan():
+    def make_router(recorder: Recorder) -> Router:
+        router = Router()
+        for expression, flags in PATTERNS:
+            router.message(text.match(expression, flags))(
+                recorder.handler(expression)
+            )
+        return router
+
+    run(
+        compare(
+            make_router,
+            [lambda text_=text_: message(text_) for text_ in TEXTS],
+            DictStorage,
+        )
+    )
+
+
+def test_match_is_seen_only_by_its_handler():
+    seen = []
+    router = Router()
+
+    @router.message(text.match(r"\d+"), Filter(lambda e: False))
+    async def never(event):
+        pass
+
+    @router.message()
+    async def other(event):
+        seen.append(MatchCtx.get())
+
+    @router.message(text.match(r"\d+"))
+    async def number(event):
+        seen.append(MatchCtx.get())
+
+    run(router.notify(DictStorage(), message("42"), FakeClient()))
+    assert seen == [None]
+    assert MatchCtx.get() is None
+
+
+def test_keywords_are_seen_only_by_their_handler():
+    seen = []
+    router = Router()
+
+    @router.message(text.keywords("buy"), Filter(lambda e: False))
+    async def never(event):
+        pass
+
+    @router.message()
+    async def other(event):
+        seen.append(KeywordsCtx.get())
+
+    run(router.notify(DictStorage(), message("buy now"), FakeClient()))
+    assert seen == [()]
+
+
+def test_keywords_find_phrases():
+    keywords = text.Keywords(["buy now", "Free"], whole_words=True)
+    assert keywords.find("FREE stuff, buy  now!") == ("Free",)
+    assert keywords.find("buy now for free") == ("buy now", "Free")
+    assert keywords.find("freedom") == ()
@@ -0,0 +1,50 @@
+from fakes import FakeClient, message, run
+
+from garnet.ctx import CageCtx
+from garnet.events import Router, SkipHandler
+from garnet.storages import DictStorage
+
+
+def data_is_cached(seen: list, /):
+    async def handle(event):
+        cage = CageCtx.get()
+        seen.append((await cage.get_data()) is (await cage.get_data()))
+        raise SkipHandler
+
+    return handle
+
+
+def test_cache_cage_data_is_applied_per_router():
+    for caching_first in (True, False):
+        seen: list = []
+        caching, plain = Router(cache_cage_data=True), Router()
+        caching.message()(data_is_cached(seen))
+        plain.message()(data_is_cached(seen))
+
+        root = Router()
+        if caching_first:
+            root.include(caching).include(plain)
+        else:
+            root.include(plain).include(caching)
+
+        run(root.notify(DictStorage(), message("hi"), FakeClient()))
+        assert seen == [caching_first, not caching_first]
+
+
+def test_cages_of_user_share_state():
+    states = []
+    caching, plain = Router(cache_cage_data=True), Router()
+
+    @caching.message()
+    async def set_state(event):
+        await CageCtx.get().set_state("next")
+        raise SkipHandler
+
+    @plain.message()
+    async def get_state(event):
+        states.append(await CageCtx.get().get_state())
+
+    root = Router()
+    root.include(caching).include(plain)
+    run(root.notify(DictStorage(), message("hi"), FakeClient()))
+    assert states == ["next"]